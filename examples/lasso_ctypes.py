@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Compares the time to stuff the lasso problem with the generated Python code
+and with the generated C code called through its Python (ctypes) binding.
+"""
+from qcml import QCML
+from numpy.random import randn
+import scipy.sparse as sparse
+import sys, timeit
+
+if __name__ == '__main__':
+    print "Creating data."
+    n = 1000    # number of features
+    m = 100     # number of examples
+    A = sparse.rand(m, n, 0.1)
+    b = randn(m)
+    gamma = 1
+    params = {'A': A, 'b': b, 'gamma': gamma}
+    dims = {'m': m, 'n': n}
+
+    s = """
+    dimensions m n
+    variable x(n)
+    parameters A(m,n) b(m)
+    parameter gamma positive
+    minimize (square(norm(A*x - b)) + gamma*norm1(x))
+    """
+    p = QCML()
+    p.parse(s)
+    p.canonicalize()
+
+    print "Generating python code."
+    p.codegen("python")
+    python_prob2socp = p.prob2socp
+
+    print "Generating C code and its ctypes binding."
+    p.codegen("ctypes")
+    p.save("lasso_ctypes")
+    sys.path.insert(0, "lasso_ctypes")
+    import lasso_ctypes     # builds liblasso_ctypes.so on import
+
+    # check that both produce the same SOCP
+    expected = python_prob2socp(params, dims)
+    result = lasso_ctypes.prob_to_socp(params, dims)
+    print "max |G_python - G_ctypes| =", abs(expected['G'] - result['G']).max()
+
+    N = 100
+    t_python = timeit.timeit(lambda: python_prob2socp(params, dims), number=N)
+    t_ctypes = timeit.timeit(lambda: lasso_ctypes.prob_to_socp(params, dims), number=N)
+    print "python: %f ms per call" % (1e3 * t_python / N)
+    print "ctypes: %f ms per call" % (1e3 * t_ctypes / N)
+    print "speedup: %.1fx" % (t_python / t_ctypes)
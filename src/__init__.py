@@ -53,6 +53,49 @@ This functions wraps all six steps above into a single call and
 assumes that all parameters and dimensions are defined in the local
 namespace.
 
+The canonical problem can be made smaller before generating code with
+
+    p.canonicalize()
+    p.presolve()
+
+which substitutes away the variables defined by equalities (a user variable
+only when it is an alias, `x == y`, of another one), and drops or merges
+redundant linear constraints. The recovered solution still contains every
+user variable.
+
+The code generators can also rewrite the problem differently (see the
+`mixins`). To pick the rewriting that gives the smallest SOCP, plan it once
+the dims are known,
+
+    plan = p.plan({'m': m, 'n': n}, nnz={'F': 1000})
+    print plan
+    p.codegen("C", strategy=plan.best)
+
+which predicts the number of variables, rows, cones, and nonzeros of every
+strategy without generating code, and ranks them by an estimate of the
+nonzeros in the KKT system the solver factors (or by `plan(..., cost=f)`).
+
+When the same parameters are stuffed repeatedly, pass a dict as the cache,
+
+    cache = {}
+    data = p.prob2socp(params, dims, cache)
+
+and the sparse matrices made from the parameters are reused as long as the
+parameters are unchanged. The entries of the arrays are hashed on each call,
+so arrays modified in place are noticed too. The cache holds one entry per
+conversion in the problem; to drop the conversions of a parameter, call
+
+    qcml.invalidate(cache, 'F')
+
+Parameters that never change can instead be frozen when the code is
+generated (the dims must be set first),
+
+    p.codegen("python", frozen_params={'F': F})
+
+Their values are then written into the generated code as constants (static
+arrays in C), the parts of the data that only involve them are computed once
+at codegen time, and they are no longer passed to `prob2socp`.
+
 Finally, you can call
 
     p.codegen("C", name="myprob")
@@ -70,6 +113,64 @@ must supply your own solver. The code simply stuffs the matrices for you; you
 are still responsible for using the proper solver and linking it. An example
 of how this might work is in `examples/lasso.py`.
 
+To call the C code from Python, use the "ctypes" code generator instead,
+
+    p.codegen("ctypes")
+    p.save("myprob")
+
+which produces the same files and a Python module `myprob.py` that compiles
+`libmyprob.so` with the Makefile and wraps `qc_myprob2socp` and the solution
+recovery. Its `prob_to_socp` takes the same parameters as the Python code and
+returns NumPy views of the data stuffed in C.
+
+For problems where G and A are too large to stuff, the "C_operator" code
+generator produces the same files, except that `qc_myprob2socp` leaves G and
+A empty and the source also contains `qc_myprob_A`, `qc_myprob_AT`,
+`qc_myprob_G`, and `qc_myprob_GT`, which apply A, A', G, and G' to a vector
+directly from the parameters, and `qc_myprob_norms`, which computes the row
+and column norms of G and A (e.g., to equilibrate them) without applying the
+operators. The "ctypes_operator" code generator wraps these in Python; like
+the "operator" code generator, its `prob_to_socp` returns the norms as the
+function 'norms'.
+
+For a QP solver (such as OSQP), keep the quadratic terms of the objective
+(`square`, `quad_over_lin` with a constant denominator, `huber`, ...) when
+canonicalizing, and use the "qp" code generator,
+
+    p.canonicalize(quadratic=True)
+    p.codegen("qp")
+    qp_data = p.prob2socp(params, dims)
+
+which returns the data `P`, `q`, `A`, `l`, and `u` of the QP with objective
+(1/2) x'*P*x + q'*x and constraints l <= A*x <= u. The rest of the objective
+and the constraints are rewritten as before, so they must not need any
+second-order cones.
+
+Poorly scaled data can be equilibrated before it is handed to the solver with
+`p.codegen("python", equilibrate=True)` (or "C" and "ctypes"). The rows and
+columns of G and A are then rescaled, and the scaling returned with the data
+(the 'scaling' entry in Python, or the `qc_unscale` function in C) must be
+undone on the solution before recovering the variables.
+
+The second-order cones are also described compactly, as a list of (count,
+size) blocks of cones of the same size, in the 'q_blocks' entry of the cone
+dims (the `qblocks` array in C). Products of many small cones (e.g., the
+elementwise `norm(x, y)`) have their rows interleaved, one cone after the
+other, as ECOS expects them. With `p.codegen("python", cone_layout="blocked")`
+(or "C" and "ctypes"), the rows are instead ordered argument by argument (the
+first entries of all the cones of a product, then the second ones, etc.), for
+solvers that accept this layout; the sizes of the cones are then only given
+by their blocks.
+
+Matrix parameters are sparse by default. A parameter declared as
+
+    parameter D(n,n) diagonal
+    parameter F(n,m) dense
+
+is instead given as its diagonal (a vector of length n) or as a dense array
+(in column major order in C), and its entries are stuffed directly, without
+forming a sparse matrix first. The `sparse` keyword spells out the default.
+
 The `qc_utils` files are static; meaning, if you have multiple sources you
 wish to use in a project, you only need one copy of `qc_utils.h` and
 `qc_utils.c`.
@@ -79,4 +180,5 @@ BSD, the generated code is LGPL for this reason.
 """
 
 from . qc_lang import QCML
+from . codegens.python.codegen import invalidate
 
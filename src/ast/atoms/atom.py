@@ -1,4 +1,5 @@
-from .. expressions import Expression
+from .. expressions import Expression, Variable
+from .. socps.socp import SOCP
 from ... properties import sign, curvature
 
 atoms = {}
@@ -45,7 +46,17 @@ class Atom(Expression):
         # specific to each atom
         return NotImplemented
 
+    def _max_terms(self):
+        # the expressions this atom is the (elementwise) max of, if any; such
+        # an atom needs no epigraph in a <= constraint (see LinearInequality)
+        return None
+
     def canonicalize(self):
+        # an atom that appears more than once shares its epigraph variable
+        key = str(self)
+        if key in SOCP.epigraphs:
+            return (SOCP.epigraphs[key], [])
+
         # basically borrowed from CVXPY
 
         # TODO: need to take care of what happens when it's
@@ -68,6 +79,8 @@ class Atom(Expression):
         for elem in constraints: constrs.extend(elem)
         for constr in base_constraints:
             if constr: constrs += constr.canonicalize()[1]
+        if isinstance(base_obj, Variable):
+            SOCP.epigraphs[key] = base_obj
         return (base_obj, constrs)
 
     # we only call simplify *after* we call canonicalize
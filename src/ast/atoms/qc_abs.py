@@ -23,5 +23,10 @@ class QC_abs(atom.Atom):
         constraints = [x <= v, x >= -v]
         return (v, constraints)
 
+    def _max_terms(self):
+        x, = self.args
+        # abs(x) = max(x, -x) is only convex in x when x is affine
+        if curvature.isaffine(x): return [x, -x]
+
 # register with the atom library
 atom.atoms['abs'] = QC_abs
@@ -1,29 +1,196 @@
 """ This is the geo_mean atom.
 
         geo_mean(x,y) = sqrt(x * y)
+        geo_mean(x1,...,xk) = (x1 * ... * xk)^(1/k)
 
-    If either x or y is a vector, the atom is applied elementwise.
+    If any argument is a vector, the atom is applied elementwise.
 
-    It is a CONCAVE atom. It is DECREASING in the first argument, and
-    DECREASING in the second argument.
+    It is a CONCAVE atom. It is INCREASING in every argument.
 
-    It returns a SCALAR expression if the both arguments are SCALAR.
+    It returns a SCALAR expression if all the arguments are SCALAR.
     Otherwise, it returns a VECTOR expression (sized to match the largest
     arugment).
 
     In every module, you must have defined two functions:
         attributes :: [arg] -> (sign, vexity, shape)
         rewrite :: [arg] -> Program
+
+    The (weighted) geometric means, here and in pow_rat, are represented by a
+    binary tree of 3-dimensional cones,
+
+        z^2 <= a * b,  a, b >= 0
+
+    where each z is a geometric mean of its children with equal weights, so
+    the weights of the leaves must be dyadic. Otherwise, the mean itself is
+    added as a leaf: t <= x^(1/3) is t <= (x * 1 * t)^(1/4), for instance.
+    Identical subtrees share a variable. Equal weights give the balanced
+    tree; otherwise, the tree with the fewest cones is found by a (bounded)
+    search.
 """
 import atom
 from utils import *
 
+# the most splits enumerated in one search for a smaller tree; past it, the
+# best tree found so far is used
+SEARCH_LIMIT = 5000
+
+# the trees found, by their (reduced) leaf weights
+trees = {}
+
+def _reduce(w):
+    """ The weights w (integers whose sum is a power of two), as small as
+        possible.
+    """
+    w = tuple(w)
+    while sum(w) > 1 and all(x % 2 == 0 for x in w):
+        w = tuple(x / 2 for x in w)
+    return w
+
+def _isleaf(w):
+    return sum(1 for x in w if x) == 1
+
+def _depth(w):
+    # the number of halvings to get to the leaves
+    return sum(w).bit_length() - 1
+
+def _splits(w, count):
+    """ The ways to write the mean with weights w as the mean of two means,
+        each with half the total weight. They are generated lazily, and stop
+        once `count` (shared by the whole search) passes SEARCH_LIMIT.
+    """
+    # the weight left after each index
+    rest = [sum(w[i + 1:]) for i in xrange(len(w))]
+    def halves(i, left):
+        if i == len(w) - 1:
+            if left <= w[i]: yield (left,)
+            return
+        # the rest of the weights must be able to make up what is left
+        for x in xrange(min(w[i], left), max(left - rest[i], 0) - 1, -1):
+            for more in halves(i + 1, left - x):
+                yield (x,) + more
+    seen = set()
+    for u in halves(0, sum(w) / 2):
+        v = tuple(a - b for a, b in zip(w, u))
+        if (v, u) in seen: continue
+        seen.add((u, v))
+        count[0] += 1
+        if count[0] > SEARCH_LIMIT: return
+        yield _reduce(u), _reduce(v)
+
+def _search(pending, known, budget, count):
+    """ A tree (a list of (node, left, right) weights) that splits every
+        pending node with at most `budget` cones, or None. Gives up (with
+        None) once SEARCH_LIMIT splits have been enumerated.
+    """
+    if not pending: return []
+    # every pending node needs a cone (its children may be shared, so it may
+    # need no more)
+    if len(pending) > budget: return None
+    w = pending[0]
+    # try the splits that introduce the fewest nodes first
+    options = []
+    for u, v in _splits(w, count):
+        new = [x for x in sorted(set([u, v])) if not _isleaf(x) and x not in known]
+        options.append((len(new), u, v, new))
+    options.sort(key=lambda option: option[0])
+    for n, u, v, new in options:
+        if count[0] > SEARCH_LIMIT: return None
+        if len(pending) + n > budget: continue
+        tree = _search(pending[1:] + new, known | set(new), budget - 1, count)
+        if tree is not None: return [(w, u, v)] + tree
+    return None
+
+def _balanced(w):
+    """ The tree that splits the weights of every node in order, the first
+        half of the total weight to the left. For equal weights, this is the
+        balanced binary tree, which has the fewest cones.
+    """
+    cones, pending, known = [], [w], set([w])
+    while pending:
+        node = pending.pop(0)
+        half, u = sum(node) / 2, []
+        for x in node:
+            u.append(min(x, half))
+            half -= u[-1]
+        v = _reduce(a - b for a, b in zip(node, u))
+        u = _reduce(u)
+        cones.append((node, u, v))
+        for x in sorted(set([u, v])):
+            if not _isleaf(x) and x not in known:
+                known.add(x)
+                pending.append(x)
+    return cones
+
+def tree(w):
+    """ The tree of 3-dimensional cones for the mean with weights w (whose
+        sum is a power of two), as a list of (node, left, right) weights.
+
+        The fewest cones are at least the depth of the tree and one less than
+        the number of leaves; trees with fewer cones than the balanced one are
+        searched for until none is left (so the tree is minimal) or the search
+        gives up.
+    """
+    w = _reduce(w)
+    if w not in trees:
+        if _isleaf(w):
+            trees[w] = []
+        else:
+            best = _balanced(w)
+            lower = max(_depth(w), sum(1 for x in w if x) - 1)
+            if len(set(x for x in w if x)) > 1:
+                for budget in xrange(lower, len(best)):
+                    count = [0]
+                    found = _search([w], set([w]), budget, count)
+                    if found is not None:
+                        best = found
+                        break
+                    if count[0] > SEARCH_LIMIT: break
+            trees[w] = best
+    return trees[w]
+
+def isdyadic(weights):
+    d = sum(weights)
+    return d & (d - 1) == 0
+
+def geo_mean_cones(t, args, weights):
+    """ The constraints for
+
+        t <= prod(args_i^(weights_i / sum(weights)))
+
+    where the weights are positive integers; the args are nonnegative. If
+    the weights are not dyadic, t is a leaf of the tree, so it is
+    nonnegative too.
+    """
+    items, weights = list(args), list(weights)
+    if not isdyadic(weights):
+        d = sum(weights)
+        items.append(t)
+        weights.append((1 << (d - 1).bit_length()) - d)
+
+    cones = tree(weights)
+    if not cones:
+        # the mean of a single argument
+        return [t <= items[0]]
+    nodes = {cones[0][0]: t}
+    def node(w):
+        if _isleaf(w): return items[[i for i, x in enumerate(w) if x][0]]
+        if w not in nodes: nodes[w] = Variable('', t.shape)
+        return nodes[w]
+
+    constraints = []
+    for w, u, v in cones:
+        x, y, z = node(u), node(v), node(w)
+        constraints.append(SOCProd(x + y, [y - x, Number(2.0)*z]))
+    return constraints
+
 class QC_geo_mean(atom.Atom):
-    def __init__(self, x, y):
-        super(QC_geo_mean, self).__init__(x,y)
+    def __init__(self, *args):
+        if len(args) < 2:
+            raise TypeError("Cannot use geo_mean with fewer than two arguments.")
+        super(QC_geo_mean, self).__init__(*args)
 
     def _monotonicity(self):
-        return [monotonicity.increasing, monotonicity.increasing]
+        return [monotonicity.increasing]*len(self.args)
 
     def _curvature(self):
         return curvature.Concave()
@@ -32,18 +199,14 @@ class QC_geo_mean(atom.Atom):
         return sign.Positive()
 
     def _shape(self):
-        return self.args[0].shape + self.args[1].shape
+        base_shape = shape.Scalar()
+        for e in self.args:
+            base_shape += e.shape
+        return base_shape
 
     def _canonicalize(self):
         v = Variable('', self.shape)
-        x, y = self.args
-        constraints = [
-            SOCProd(x + y, [y - x, Number(2.0)*v]),
-            y >= Number(0),
-            x >= Number(0)
-        ]
-        return (v, constraints)
+        return (v, geo_mean_cones(v, self.args, [1]*len(self.args)))
 
 # register with the atom library
 atom.atoms['geo_mean'] = QC_geo_mean
-
@@ -42,5 +42,8 @@ class QC_max(atom.Atom):
         constraints = [v >= x for x in self.args]
         return (v, constraints)
 
+    def _max_terms(self):
+        return list(self.args)
+
 # register with the atom library
 atom.atoms['max'] = QC_max
@@ -1,54 +1,61 @@
-import atom
-from utils import *
+""" This is the pow_rat atom.
 
-from qc_square import QC_square
-from qc_square_over_lin import QC_square_over_lin
-from qc_sqrt import QC_sqrt
-from qc_geo_mean import QC_geo_mean
-from qc_inv_pos import QC_inv_pos
+        pow_rat(x, p, q) = x^(p/q)
 
-def three_fourths(x):
-    return QC_geo_mean(x, QC_sqrt(x))
+    for positive integers p and q.
 
-def three_halves(x):
-    return QC_square_over_lin(x, QC_sqrt(x))
+    If p < q, it is a CONCAVE atom, INCREASING in the first argument.
 
-def cube(x):
-    return QC_square_over_lin(QC_square(x), x)
+    If p > q, it is a CONVEX atom. For p/q = 2 or 4, it is the square (or the
+    square of the square), so it is NONMONOTONE in the first argument; it is
+    INCREASING in the first argument otherwise, and defined for nonnegative
+    x only.
 
-class one_third(QC_sqrt):
-    def __init__(self, x):
-        super(one_third, self).__init__(x)
+    It returns a VECTOR expression.
 
-    def __str__(self): return "pow_rat(%s, 1, 3)" % self.args[0]
+    In every module, you must have defined two functions:
+        attributes :: [arg] -> (sign, vexity, shape)
+        rewrite :: [arg] -> Program
 
-    def _canonicalize(self):
-        v = Variable('', self.shape)
-        x = self.args[0]
-        constraints = [
-            cube(v) <= x
-        ]
-        return (v, constraints)
+    The powers are represented directly by the cones of a weighted geometric
+    mean (see geo_mean), instead of by composing atoms:
 
-class two_thirds(QC_sqrt):
-    def __init__(self, x):
-        super(two_thirds, self).__init__(x)
+        t <= x^(p/q)  <=>  t <= x^(p/q) * 1^((q-p)/q)
+        t >= x^(p/q)  <=>  x <= t^(q/p) * 1^((p-q)/p),  x >= 0
+"""
+import atom
+from utils import *
+
+from qc_square import QC_square
+from qc_sqrt import QC_sqrt
+from qc_geo_mean import geo_mean_cones, isdyadic
 
-    def __str__(self): return "pow_rat(%s, 2, 3)" % self.args[0]
+def gcd(a, b):
+    while b: a, b = b, a % b
+    return a
+
+class root(QC_sqrt):
+    """ x^(p/q) for p < q
+    """
+    def __init__(self, x, p, q):
+        self.p, self.q = p, q
+        super(root, self).__init__(x)
+
+    def __str__(self): return "pow_rat(%s, %d, %d)" % (self.args[0], self.p, self.q)
 
     def _canonicalize(self):
         v = Variable('', self.shape)
         x = self.args[0]
-        constraints = [
-            three_halves(v) <= x
-        ]
-        return (v, constraints)
+        return (v, geo_mean_cones(v, [x, Number(1)], [self.p, self.q - self.p]))
 
-class four_thirds(QC_square):
-    def __init__(self, x):
-        super(four_thirds, self).__init__(x)
+class power(QC_square):
+    """ x^(p/q) for p > q, and x >= 0
+    """
+    def __init__(self, x, p, q):
+        self.p, self.q = p, q
+        super(power, self).__init__(x)
 
-    def __str__(self): return "pow_rat(%s, 4, 3)" % self.args[0]
+    def __str__(self): return "pow_rat(%s, %d, %d)" % (self.args[0], self.p, self.q)
 
     def _monotonicity(self):
         return [monotonicity.increasing]
@@ -56,38 +63,25 @@ class four_thirds(QC_square):
     def _canonicalize(self):
         v = Variable('', self.shape)
         x = self.args[0]
-        constraints = [
-            x <= three_fourths(v)
-        ]
+        constraints = geo_mean_cones(x, [v, Number(1)], [self.q, self.p - self.q])
+        # otherwise, x is already a leaf of the cones
+        if isdyadic([self.p]):
+            constraints.append(x >= Number(0))
         return (v, constraints)
 
-# only valid entries for pow_rat
-pow_rat_func = {
-    (1,1): lambda x: x,
-    (1,2): QC_sqrt,
-    (1,3): one_third,
-    (1,4): lambda x: QC_sqrt(QC_sqrt(x)),
-    (2,1): QC_square,
-    (2,2): lambda x: x,
-    (2,3): two_thirds,
-    (2,4): QC_sqrt,
-    (3,1): cube,
-    (3,2): three_halves,
-    (3,3): lambda x: x,
-    (3,4): three_fourths,
-    (4,1): lambda x: QC_square(QC_square(x)),
-    (4,2): QC_square,
-    (4,3): four_thirds,
-    (4,4): lambda x: x
-}
-
 def QC_pow_rat(x,p,q):
     if isnumber(p) and isnumber(q):
-        try:
-            result = pow_rat_func[(p.value, q.value)](x)
-        except KeyError:
-            raise TypeError("Nonexistent implementation for %s^(%s/%s)" % (x.value, p.value, q.value))
-        return result
+        if not all(e.value == int(e.value) and e.value > 0 for e in (p, q)):
+            raise TypeError("Nonexistent implementation for %s^(%s/%s)" % (x, p.value, q.value))
+        p, q = int(p.value), int(q.value)
+        d = gcd(p, q)
+        p, q = p / d, q / d
+        if p == q: return x
+        if (p, q) == (1, 2): return QC_sqrt(x)
+        if (p, q) == (2, 1): return QC_square(x)
+        if (p, q) == (4, 1): return QC_square(QC_square(x))
+        if p < q: return root(x, p, q)
+        return power(x, p, q)
     else:
         raise TypeError("Cannot use non-constant arguments p = %s, q = %s" % (str(p), str(q)))
 
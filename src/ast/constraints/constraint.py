@@ -1,6 +1,29 @@
 from .. node import Node
 from abc import ABCMeta, abstractmethod, abstractproperty
 
+def linear_key(expr):
+    """ A structural key of the (linear) expression `expr`: its terms with
+        their numeric coefficients, in sorted order, and its constant.
+
+        Sums that only differ in the order of their terms, or in how their
+        numbers are written (2 or 2.0, -(x + y) or -x - y), have the same key.
+    """
+    # imported here, since the expressions import the constraints
+    from .. expressions import Add, Mul, Number
+    terms, constant = [], [0.0]
+    def collect(e, coeff):
+        if isinstance(e, Add):
+            collect(e.left, coeff)
+            collect(e.right, coeff)
+        elif isinstance(e, Number):
+            constant[0] += coeff * e.value
+        elif isinstance(e, Mul) and isinstance(e.left, Number):
+            collect(e.right, coeff * e.left.value)
+        else:
+            terms.append((str(e), coeff))
+    collect(expr, 1.0)
+    return (tuple(sorted(terms)), constant[0])
+
 class Constraint(Node):
     """ Constraint AST node.
 
@@ -25,15 +48,20 @@ class Constraint(Node):
     def __str__(self):
         pass
 
+    def key(self):
+        """ A structural key of the constraint. Constraints are equal (and
+            only added to a program once) if their keys are.
+        """
+        return (self.__class__.__name__, self.dual_var, str(self))
+
     def __eq__(self, other):
-        # do we simplify before comparing?
-        return str(self) == str(other)
+        return isinstance(other, Constraint) and self.key() == other.key()
 
     def __ne__(self, other):
         return not (self == other)
 
     def __hash__(self):
-        return hash(str(self))
+        return hash(self.key())
 
     def children(self):
         if self.right is not None: yield self.right
@@ -1,5 +1,31 @@
-from constraint import Constraint
-from ... properties import curvature
+from constraint import Constraint, linear_key
+from ... properties import curvature, shape
+
+def _summands(expr, coeff = 1):
+    """ The summands of expr, with their numeric coefficients.
+    """
+    # imported here, since the expressions import the constraints
+    from .. expressions import Add, Mul, Number
+    if isinstance(expr, Add):
+        return _summands(expr.left, coeff) + _summands(expr.right, coeff)
+    if isinstance(expr, Mul) and isinstance(expr.left, Number):
+        return _summands(expr.right, coeff * expr.left.value)
+    return [(coeff, expr)]
+
+def _blocks(expr):
+    """ A rough count of the nonzeros of the summand expr, in blocks of
+        (about) as many nonzeros as it has rows; None if it may have many more
+        (e.g., a product with a matrix parameter).
+    """
+    from .. expressions import Mul, Parameter, Variable
+    from .. atoms.atom import Atom
+    if curvature.isconstant(expr): return 0
+    # an atom is replaced by its epigraph variable
+    if isinstance(expr, (Variable, Atom)): return 1
+    if isinstance(expr, Mul) and isinstance(expr.left, Parameter) and \
+            (shape.isscalar(expr.left) or expr.left.structure == 'diagonal'):
+        return _blocks(expr.right)
+    return None
 
 class LinearConstraint(Constraint):
     """ expr == 0 or expr <= 0
@@ -15,6 +41,9 @@ class LinearConstraint(Constraint):
         else:
             return constr
 
+    def key(self):
+        return (self.__class__.__name__, self.dual_var, self.op, linear_key(self.left))
+
     def canonicalize(self):
         self.left, lh_constr = self.left.canonicalize()
         return (None, [self] + lh_constr)
@@ -30,6 +59,54 @@ class LinearInequality(LinearConstraint):
         is_dcp = curvature.isconvex(left) and curvature.isconcave(right)
         super(LinearInequality, self).__init__('<=', left-right, left.shape+right.shape, is_dcp)
 
+    def canonicalize(self):
+        constraints = self.split_max()
+        if constraints is None:
+            return super(LinearInequality, self).canonicalize()
+        result = []
+        for constr in constraints:
+            if constr: result += constr.canonicalize()[1]
+        return (None, result)
+
+    def split_max(self):
+        """ Splits the constraint on an atom that is the max of some terms,
+            like abs or max, instead of introducing its epigraph:
+
+                max(f1, ..., fk) + r <= 0  <=>  fi + r <= 0, i = 1, ..., k
+
+            This saves the epigraph variable and its rows, but repeats r k
+            times, so it is only done when it is predicted to give fewer
+            nonzeros. Returns the constraints, or None if not split.
+        """
+        # the split constraints have no single dual variable
+        if self.dual_var or not self.is_dcp: return None
+
+        summands = _summands(self.left)
+        for i, (coeff, expr) in enumerate(summands):
+            terms = coeff > 0 and getattr(expr, '_max_terms', lambda: None)()
+            if not terms: continue
+            rest = summands[:i] + summands[i+1:]
+
+            # a scalar max of vector terms is only split against a scalar r
+            if shape.isscalar(expr) and not all(map(shape.isscalar, terms)) and \
+                    not all(shape.isscalar(e) for _, e in rest):
+                continue
+            # any other max in r would be split too, multiplying the
+            # constraints; keep its epigraph instead
+            if any(getattr(e, '_max_terms', lambda: None)() for _, e in rest):
+                return None
+            # the epigraph costs a column in k + 1 blocks; the split repeats
+            # r k - 1 more times
+            blocks = [_blocks(e) for _, e in rest]
+            if None in blocks or (len(terms) - 1) * sum(blocks) > len(terms) + 1:
+                return None
+
+            from .. expressions import Number
+            scaled = lambda c, e: e if c == 1 else Number(c) * e
+            r = sum((scaled(c, e) for c, e in rest), Number(0))
+            return [scaled(coeff, t) + r <= Number(0) for t in terms]
+        return None
+
 class LinearEquality(LinearConstraint):
     def __init__(self, left, right):
         is_dcp = curvature.isaffine(left) and curvature.isaffine(right)
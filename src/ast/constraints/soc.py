@@ -1,4 +1,12 @@
-from constraint import Constraint
+from constraint import Constraint, linear_key
+
+def _unsigned_key(expr):
+    """ The linear key of expr or -expr, whichever is smaller; the norm is
+        the same for both.
+    """
+    terms, constant = linear_key(expr)
+    negated = (tuple(sorted((t, -c) for t, c in terms)), -constant)
+    return min((terms, constant), negated)
 from ... properties import curvature, shape
 
 class SOCConstraint(Constraint):
@@ -8,6 +16,11 @@ class SOCConstraint(Constraint):
         is_dcp = all(map(curvature.isaffine, left)) and curvature.isaffine(right)
         super(SOCConstraint, self).__init__(left, right, shape, is_dcp)
 
+    def key(self):
+        # the order of the arguments of the norm does not matter
+        args = tuple(sorted(map(_unsigned_key, self.left)))
+        return (self.__class__.__name__, self.dual_var, linear_key(self.right), args)
+
     def canonicalize(self):
         self.left, constraints = map(list, zip(*[elem.canonicalize() for elem in self.left]))
         self.right, constraint = self.right.canonicalize()
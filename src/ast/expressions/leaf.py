@@ -20,9 +20,14 @@ class Parameter(e.LeafMixin, e.Expression):
 
         Contains a representation of Parameters. It is Affine; its sign and
         shape are supplied from QCML.
+
+        The structure of a matrix parameter ('diagonal', 'sparse', or
+        'dense') may also be declared; it is None otherwise, and the matrix
+        is treated as sparse.
     """
-    def __init__(self, value, shape, sign):
+    def __init__(self, value, shape, sign, structure = None):
         super(Parameter, self).__init__(value = value, curvature = curvature.Constant(), shape = shape, sign = sign)
+        self.structure = structure
 
     def __repr__(self): return "Parameter('%s',%s)" % (self.value, self.shape)
 
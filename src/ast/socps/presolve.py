@@ -0,0 +1,195 @@
+""" Presolve for a canonicalized SOCP.
+
+    Canonicalization is local; every atom introduces its own variables and
+    constraints. The presolve looks at the whole (canonical) problem and
+    makes it smaller before any code is generated:
+
+        -- variables defined by an equality in which they appear with an
+           identity coefficient are substituted away (the equality is
+           dropped); for the variables introduced by canonicalization, the
+           defining expression can be anything, but a user variable is only
+           eliminated when it is an alias of another variable, x == y, so
+           that it can still be recovered from the solution
+        -- linear rows that are trivially satisfied or that repeat another
+           row up to the order of their terms are dropped
+        -- linear inequalities on the same expression that differ only in
+           their constant, x + a <= 0 and x + b <= 0, are merged into the
+           tightest one
+
+    The atoms do not introduce equalities, so the eliminated variables come
+    from the equalities written in the problem (aliases, or definitions of a
+    variable introduced by canonicalization, e.g., the y == e of a quadratic
+    objective); the epigraph rows of the atoms are only reduced by the row
+    merging.
+
+    The eliminated variables and their values are recorded in the program's
+    `eliminated` dict.
+"""
+from .. expressions import Number, Variable, Add, Mul, Sum, Transpose
+from .. expressions.expression import isnumber
+from .. constraints import LinearConstraint, SOCConstraint
+from ... exceptions import QCMLException
+
+def summands(expr):
+    """ The terms of the (canonical, i.e., linear) expression `expr`.
+    """
+    if isinstance(expr, Add):
+        return summands(expr.left) + summands(expr.right)
+    return [expr]
+
+def total(terms):
+    """ The sum of the list of expressions `terms`.
+    """
+    if not terms: return Number(0)
+    return reduce(Add, terms)
+
+def variables(expr):
+    """ The names of the variables in the expression `expr`.
+    """
+    if isinstance(expr, Variable): return set([expr.value])
+    return set().union(*(variables(child) for child in expr.children()))
+
+def identity(term):
+    """ The name and coefficient of `term` if it is a variable with an
+        identity coefficient (x or -1*x), otherwise (None, 0).
+    """
+    if isinstance(term, Variable):
+        return term.value, 1
+    if isinstance(term, Mul) and isnumber(term.left) and term.left.value == -1 \
+       and isinstance(term.right, Variable):
+        return term.right.value, -1
+    return None, 0
+
+def substitute(expr, values, resolved = None):
+    """ Replaces the variables in `expr` with their expressions in the dict
+        `values`. The values may themselves contain variables in `values`;
+        they are substituted in turn, once each, and kept in the dict
+        `resolved`.
+
+        The expression is rebuilt, since its subtrees may be shared with
+        other constraints.
+    """
+    if resolved is None: resolved = {}
+    if isinstance(expr, Variable):
+        name = expr.value
+        if name not in values: return expr
+        if name not in resolved:
+            resolved[name] = substitute(values[name], values, resolved).simplify()
+        return resolved[name]
+    if isinstance(expr, (Add, Mul)):
+        return expr.__class__(substitute(expr.left, values, resolved),
+                              substitute(expr.right, values, resolved))
+    if isinstance(expr, (Sum, Transpose)):
+        return expr.__class__(substitute(expr.expr, values, resolved))
+    return expr
+
+def definition(constraint, program):
+    """ The name and value of a variable defined by the equality
+        `constraint`, or None.
+    """
+    if constraint.dual_var: return None
+    terms = summands(constraint.left)
+    # eliminate the variables introduced by canonicalization first
+    order = sorted(range(len(terms)), key=lambda i: identity(terms[i])[0] not in program.new_variables)
+    for i in order:
+        term = terms[i]
+        name, coeff = identity(term)
+        # the variables of the quadratic objective are kept
+        if name is None or name in program.quadratic: continue
+        variable = term if coeff == 1 else term.right
+        rest = terms[:i] + terms[i+1:]
+        if any(name in variables(t) for t in rest): continue
+        # the value must have the shape of the variable (no broadcasting)
+        value = total(rest) if coeff == -1 else total([-t for t in rest])
+        if not (variable.shape == constraint.shape and variable.shape == value.shape):
+            continue
+        if name in program.new_variables:
+            return name, value.simplify()
+        # a user variable can be recovered from the user variable it aliases
+        if len(rest) == 1:
+            other, other_coeff = identity(rest[0])
+            if other in program.variables and other != name and other_coeff == -coeff:
+                return name, value.simplify()
+    return None
+
+def eliminate(program):
+    """ Substitutes away the variables defined by equalities.
+
+        The equalities are visited once, in order, each with the variables
+        eliminated so far substituted; the rest of the problem is then
+        rewritten in a single pass.
+    """
+    values = {}
+    resolved = {}
+    kept = []
+    for c in program.constraints.children():
+        if not (isinstance(c, LinearConstraint) and c.op == '=='):
+            kept.append(c)
+            continue
+        if values:
+            c.left = substitute(c.left, values, resolved).simplify()
+        found = definition(c, program)
+        if not found:
+            kept.append(c)
+            continue
+        name, value = found
+        values[name] = value
+        # the values resolved so far may contain the new variable
+        resolved = {}
+        program.new_variables.pop(name, None)
+    if not values:
+        return
+
+    program.constraints.clear()
+    for c in kept:
+        if isinstance(c, LinearConstraint):
+            # (an equality may contain variables eliminated after it)
+            c.left = substitute(c.left, values, resolved).simplify()
+        elif isinstance(c, SOCConstraint):
+            c.left = [substitute(e, values, resolved).simplify() for e in c.left]
+            c.right = substitute(c.right, values, resolved).simplify()
+        program.constraints.add(c)
+    program.objective.expr = substitute(program.objective.expr, values, resolved).simplify()
+
+    # keep the recorded values in terms of the remaining variables
+    for k, v in program.eliminated.iteritems():
+        program.eliminated[k] = substitute(v, values, resolved).simplify()
+    for name in values:
+        program.eliminated[name] = substitute(values[name], values, resolved).simplify()
+
+def reduce_rows(program):
+    """ Drops trivial and repeated linear rows, and merges inequalities that
+        only differ in their constant.
+    """
+    constraints = list(program.constraints.children())
+    kept, bounds = [], {}
+    for c in constraints:
+        if not isinstance(c, LinearConstraint) or c.dual_var:
+            kept.append(c)
+            continue
+        if isnumber(c.left):
+            satisfied = c.left.value == 0 if c.op == '==' else c.left.value <= 0
+            if satisfied: continue
+            raise QCMLException("QCML presolve: Constraint %s is trivially infeasible." % c)
+
+        terms = summands(c.left)
+        constant = sum(t.value for t in terms if isnumber(t))
+        key = (c.op, tuple(sorted(str(t) for t in terms if not isnumber(t))))
+        if c.op == '==': key += (constant,)
+        if key not in bounds:
+            bounds[key] = (len(kept), constant)
+            kept.append(c)
+        elif c.op == '<=' and constant > bounds[key][1]:
+            # expr + constant <= 0 is tighter for a larger constant
+            bounds[key] = (bounds[key][0], constant)
+            kept[bounds[key][0]] = c
+
+    program.constraints.clear()
+    for c in kept:
+        program.constraints.add(c)
+
+def presolve(program):
+    """ Presolves the canonicalized SOCP `program` in place.
+    """
+    eliminate(program)
+    reduce_rows(program)
@@ -1,6 +1,7 @@
 """ ProgramConstraints is an object that contains a list of constraints for
     an SOCP.
 """
+from collections import OrderedDict
 from .. node import Node
 from .. constraints import LinearEquality, LinearInequality, \
     SOC, SOCProd, Constraint
@@ -13,20 +14,22 @@ class ProgramConstraints(Node):
     """
     def __init__(self, constraints):
         """ Initalizes the object. Builds a set of constraints so that
-            redundant constraints (as determined by their string description)
-            are removed.
+            redundant constraints (as determined by their structural keys, see
+            Constraint.key) are removed. The sets are ordered (by insertion), so the rows and
+            cones of the generated code do not depend on string hashes.
         """
         assert(all(isinstance(x, Constraint) for x in constraints))
 
         self.is_dcp = all(c.is_dcp for c in constraints)
         # adds constraints to the proper set (using constr_map) and removes
         # duplicates
-        self.eq_constr, self.ineq_constr, self.soc_constr = set(), set(), set()
+        self.eq_constr, self.ineq_constr, self.soc_constr = \
+            OrderedDict(), OrderedDict(), OrderedDict()
         self.__constr_map = {
-            LinearEquality: self.eq_constr.add,
-            LinearInequality: self.ineq_constr.add,
-            SOC: self.soc_constr.add,
-            SOCProd: self.soc_constr.add,
+            LinearEquality: self.eq_constr.setdefault,
+            LinearInequality: self.ineq_constr.setdefault,
+            SOC: self.soc_constr.setdefault,
+            SOCProd: self.soc_constr.setdefault,
             None.__class__: lambda x: None,   # if None, don't do anything
         }
         for constr in constraints:
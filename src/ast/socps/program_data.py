@@ -1,23 +1,26 @@
 """ ProgramData contains the dictionaries for the dimensions, parameters, and
     variables of a problem. It also has the ability to iterate over them.
 """
+from collections import OrderedDict
+
 class ProgramData(object):
     def __init__(self, dimensions = None, parameters = None, variables = None):
         """ Creates ProgramData.
         """
         # dimensions declared by the user
-        self.__dimensions = dimensions if dimensions else set()
-        # keep track of the original, abstract dims
-        self.__original_dims = self.__dimensions
+        self.__dimensions = set(dimensions) if dimensions else set()
+        # keep track of the original, abstract dims (in declaration order)
+        self.__original_dims = list(dimensions) if dimensions else []
 
         # parameters declared by the user
-        self.parameters = parameters if parameters else {}
+        self.parameters = parameters if parameters else OrderedDict()
         # variables declared by the user
-        self.variables = variables if variables else {}
+        self.variables = variables if variables else OrderedDict()
 
     @property
     def abstract_dims(self):
-        return [dim for dim in self.__dimensions if isinstance(dim, str)]
+        return [dim for dim in self.__original_dims
+            if isinstance(dim, str) and dim in self.__dimensions]
 
     @property
     def dimensions(self):
@@ -26,7 +29,7 @@ class ProgramData(object):
     @dimensions.setter
     def dimensions(self, dims):
         # whenever you set dims, you reset the abstract dimensions
-        self.__dimensions = self.__original_dims
+        self.__dimensions = set(self.__original_dims)
         for elem in self.parameters.values():
             elem.shape.eval(dims)
         for elem in self.variables.values():
@@ -0,0 +1,145 @@
+""" Quadratic objectives, for QP solvers.
+
+    The convex quadratic terms of a minimized objective (the concave ones of a
+    maximized objective) are kept as quadratic forms instead of being
+    rewritten into second-order cones. With a positive constant coefficient,
+    the terms
+
+        square(e), sum(square(e)), square(norm(e1, ..., ek))
+        square_over_lin(e, a), quad_over_lin(e, a), for a number a > 0
+        huber(e), sum(huber(e))
+
+    for affine e are sums of squared norms, ||e||^2 / a (huber(e) is w.^2 +
+    2*v with abs(e) <= w + v, w <= 1, v >= 0, as in its atom). Every other term
+    is left to the SOC rewriting.
+
+    Each ||e||^2 is kept as ||y||^2 for a variable y: e itself, if it is a
+    variable, or a new variable with y == e. So the quadratic part of the
+    objective is a sum of c * ||y||^2, and its Hessian is diagonal.
+"""
+from .. expressions import Number, Variable, Add, Mul, Sum
+from .. atoms.qc_square_over_lin import QC_square_over_lin
+from .. atoms.qc_square import QC_square
+from .. atoms.qc_quad_over_lin import QC_quad_over_lin
+from .. atoms.qc_norm import QC_norm
+from .. atoms.qc_huber import QC_huber
+from .. atoms.qc_abs import QC_abs
+from ... properties import sign, shape, curvature
+
+def isscalar_constant(expr):
+    return curvature.isconstant(expr) and shape.isscalar(expr)
+
+def terms(expr, coeff = None):
+    """ The summands of expr, with their constant scalar coefficients.
+    """
+    if coeff is None: coeff = Number(1)
+    if isinstance(expr, Add):
+        return terms(expr.left, coeff) + terms(expr.right, coeff)
+    if isinstance(expr, Mul) and isscalar_constant(expr.left):
+        return terms(expr.right, coeff * expr.left)
+    if isinstance(expr, Sum):
+        inner = expr.expr
+        # sum(x + y) is only sum(x) + sum(y) if neither is broadcast
+        if isinstance(inner, Add) and \
+                shape.isscalar(inner.left) == shape.isscalar(inner.right):
+            return terms(Sum(inner.left), coeff) + terms(Sum(inner.right), coeff)
+        if isinstance(inner, Mul) and isscalar_constant(inner.left):
+            return terms(Sum(inner.right), coeff * inner.left)
+    return [(coeff, expr)]
+
+def squares(term):
+    """ The affine expressions e_i and the number a such that
+
+            term = (||e_1||^2 + ... + ||e_k||^2) / a
+
+        or None.
+    """
+    total = isinstance(term, Sum)
+    atom = term.expr if total else term
+    if type(atom) not in (QC_square, QC_square_over_lin, QC_quad_over_lin):
+        return None
+    # an elementwise square must be summed
+    if not (total or shape.isscalar(atom)):
+        return None
+    x, a = atom.args
+    if not isinstance(a, Number) or a.value <= 0:
+        return None
+
+    args = [x]
+    if type(x) is QC_norm:
+        # the norm of scalars, or the elementwise norm of vectors
+        if any(shape.isscalar(e) != shape.isscalar(x) for e in x.args[1:]):
+            return None
+        if not shape.isscalar(x) and shape.isscalar(x.args[0]):
+            return None
+        args = x.args
+    if not all(map(curvature.isaffine, args)):
+        return None
+    return args, a.value
+
+def huber(term):
+    """ The variable w, the linear expression r, and the constraints such
+        that term = ||w||^2 + r, or None.
+    """
+    total = isinstance(term, Sum)
+    atom = term.expr if total else term
+    if type(atom) is not QC_huber or not (total or shape.isscalar(atom)):
+        return None
+    x, = atom.args
+    if not curvature.isaffine(x):
+        return None
+    w, v = Variable('', atom.shape), Variable('', atom.shape)
+    r = Number(2) * (Sum(v) if total else v)
+    return w, r, [QC_abs(x) <= w + v, w <= Number(1), v >= Number(0)]
+
+def quadratic_objective(program):
+    """ Splits the quadratic terms off the objective of the (uncanonicalized)
+        program, and stores them in the program's `quadratic` dict, as the
+        coefficient of ||y||^2 by the name of y. The coefficients are those
+        of the minimized objective (e.g., the negated objective, if it is
+        maximized).
+
+        Returns the (canonical) constraints introduced.
+    """
+    objective = program.objective
+    if objective.sense == 'find':
+        return []
+    expected = sign.ispositive if objective.sense == 'minimize' else sign.isnegative
+
+    squared, constraints, rest = [], [], []
+    for coeff, term in terms(objective.expr):
+        coeff = coeff.simplify()
+        found = expected(coeff) and (squares(term) or huber(term))
+        if not found:
+            rest.append(coeff * term)
+            continue
+        c = coeff if objective.sense == 'minimize' else -coeff
+        if len(found) == 2:
+            args, a = found
+            squared += [(c * Number(1.0 / a), e) for e in args]
+        else:
+            w, r, constrs = found
+            squared.append((c, w))
+            rest.append(coeff * r)
+            constraints += constrs
+    if not squared:
+        return []
+
+    objective.expr = sum(rest[1:], rest[0]) if rest else Number(0)
+
+    result = []
+    for c, e in squared:
+        y, constrs = e.canonicalize()
+        y = y.simplify()
+        if not isinstance(y, Variable):
+            e, y = y, Variable('', e.shape)
+            constrs.append(y == e)
+        result += constrs
+        c = c.simplify()
+        if y.value in program.quadratic:
+            c = (program.quadratic[y.value] + c).simplify()
+        program.quadratic[y.value] = c
+
+    for constr in constraints:
+        result += constr.canonicalize()[1]
+    return [constr.simplify() for constr in result]
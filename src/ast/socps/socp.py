@@ -1,6 +1,8 @@
 """ An SOCP object.
 """
 
+from collections import OrderedDict
+
 from .. import Node, NodeVisitor
 from . program_objective import ProgramObjective
 from . program_data import ProgramData
@@ -47,7 +49,10 @@ class SOCP(Node):
     # number of new variables introduced so far
     count = 0
     # new variables introduced by canonicalization
-    new_variables = {}
+    new_variables = OrderedDict()
+    # the epigraph (or hypograph) variables of the atoms canonicalized so
+    # far, keyed by the atom expression
+    epigraphs = {}
 
     def __init__(self, objective, constraints, data):
         assert(isinstance(objective, ProgramObjective))
@@ -59,10 +64,19 @@ class SOCP(Node):
         self.objective = objective
         self.constraints = constraints
         self.data = data
+        # variables substituted away by the presolve, and their values
+        self.eliminated = OrderedDict()
+        # the coefficients of the squared norms ||y||^2 kept in the
+        # (minimized) objective, by the name of y; see ast.socps.quadratic
+        self.quadratic = OrderedDict()
 
     def __str__(self):
         constr = '\n    '.join(str(self.constraints).split('\n'))
-        return "%s\nsubject to\n    %s" % (self.objective, constr)
+        objective = str(self.objective)
+        if self.quadratic:
+            op = ' - ' if self.objective.sense == 'maximize' else ' + '
+            objective += op + op.join("%s*square(norm(%s))" % (c, name) for name, c in self.quadratic.iteritems())
+        return "%s\nsubject to\n    %s" % (objective, constr)
 
     def info(self):
         prob = '\n    '.join(str(self).split('\n'))
@@ -80,14 +94,30 @@ class SOCP(Node):
     #     return p
 
     # TODO: old canonicalize
-    def canonicalize(self):
+    def canonicalize(self, quadratic = False):
+        """ Rewrites the program into an SOCP. If `quadratic`, the convex
+            quadratic terms of the objective are kept in `quadratic` instead
+            (see ast.socps.quadratic), for a QP solver.
+        """
         SOCP.reset()
-        _, constraints = self.objective.canonicalize()
+        constraints = []
+        if quadratic:
+            # imported here, since the expressions import the SOCP
+            from . quadratic import quadratic_objective
+            constraints += quadratic_objective(self)
+        _, objective_constraints = self.objective.canonicalize()
         self.constraints.canonicalize()
 
-        for constr in constraints:
+        for constr in constraints + objective_constraints:
             self.constraints.add(constr)
 
+    def presolve(self):
+        """ Simplifies the canonicalized program; see ast.socps.presolve.
+        """
+        # imported here, since the expressions import the SOCP
+        from . presolve import presolve
+        presolve(self)
+
     def children(self):
         """ An iterator that yields a program's children
         """
@@ -97,7 +127,8 @@ class SOCP(Node):
     @classmethod
     def reset(cls):
         cls.count = 0
-        cls.new_variables = {}
+        cls.new_variables = OrderedDict()
+        cls.epigraphs = {}
 
     @property
     def parameters(self):
@@ -0,0 +1,92 @@
+/*
+ * TODO: MIT/BSD license this generated code
+ *
+ * This is an ANSI C compatible benchmark for the matrix stuffing function
+ * qc_%(name)s2socp. It fills the parameters with random data and stuffs the
+ * SOCP repeatedly. Usage:
+ *
+ *    ./bench_%(name)s [number of calls] %(usage)s
+ *
+ * Dimensions that are not given default to 100.
+ */
+/* for clock_gettime (not part of ANSI C) */
+#define _POSIX_C_SOURCE 199309L
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+#include "%(name)s.h"
+
+/* random number in [0, 1) */
+static double qc_rand(void)
+{
+  return (double) rand() / ((double) RAND_MAX + 1.0);
+}
+
+/* wall clock time in seconds (clock() would add up the time of all the
+ * OpenMP threads) */
+static double qc_wall_time(void)
+{
+#ifdef _OPENMP
+  return omp_get_wtime();
+#else
+  struct timespec t;
+  clock_gettime(CLOCK_MONOTONIC, &t);
+  return (double) t.tv_sec + 1e-9 * (double) t.tv_nsec;
+#endif
+}
+
+int main(int argc, char **argv)
+{
+  %(name)s_params params;
+  %(name)s_dims dims;
+  qc_socp *data;
+  long k, N, nnzG, nnzA, bytes;
+  double start, elapsed;
+%(bench_declarations)s
+
+  N = argc > 1 ? atol(argv[1]) : 100;
+%(bench_dims)s
+
+  /* fill the parameters with random data */
+  srand(0);
+%(bench_params)s
+
+  /* stuff the matrices once, to report the problem size */
+  data = qc_%(name)s2socp(&params, &dims);
+  if (!data) {
+    printf("qc_%(name)s2socp: out of memory\n");
+    return 1;
+  }
+  nnzG = data->Gp ? (long) data->Gp[data->n] : 0;
+  nnzA = data->Ap ? (long) data->Ap[data->n] : 0;
+  /* the memory held by the SOCP data (not counting the allocator's own) */
+  bytes = (long) sizeof(qc_socp)
+        + (data->n + data->m + data->p) * (long) sizeof(double)
+        + (data->q ? data->nsoc : 0) * (long) sizeof(qc_int)
+        + 2 * data->nqblocks * (long) sizeof(qc_int)
+        + (nnzG + nnzA) * (long) (sizeof(double) + sizeof(qc_int))
+        + (data->Gp ? data->n + 1 : 0) * (long) sizeof(qc_int)
+        + (data->Ap ? data->n + 1 : 0) * (long) sizeof(qc_int)
+        + ((data->x_scale ? data->n : 0) + (data->y_scale ? data->p : 0)
+           + (data->z_scale ? data->m : 0)) * (long) sizeof(double);
+  printf("n = %%ld, m = %%ld, p = %%ld\n", data->n, data->m, data->p);
+  printf("nnz(G) = %%ld, nnz(A) = %%ld\n", nnzG, nnzA);
+  printf("bytes = %%ld\n", bytes);
+  qc_socp_free(data);
+
+  start = qc_wall_time();
+  for (k = 0; k < N; ++k) {
+    data = qc_%(name)s2socp(&params, &dims);
+    qc_socp_free(data);
+  }
+  elapsed = qc_wall_time() - start;
+  printf("calls = %%ld\n", N);
+  printf("ns/call = %%.0f\n", 1e9 * elapsed / (N > 0 ? N : 1));
+
+  /* free the parameters */
+%(bench_free)s
+  return 0;
+}
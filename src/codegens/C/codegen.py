@@ -19,29 +19,71 @@ Links with ECOS library.
 An easy way to stuff the matrices (without calling "compress" on the
 triplet form) is to write the matrix column by column, but I haven't
 done this yet. It would be a slight improvement in performance.
+
+With the `openmp` option, every block of G and A (and every segment of c, h,
+and b) is written into its own, disjoint range of the output. The offset of
+each block is computed by a prefix sum over the block nonzeros and the blocks
+are then stuffed in a `#pragma omp parallel for` loop. Without OpenMP, the
+pragma is skipped and the same loop runs serially.
+
+Sums and products of parameters (e.g., `A*B*x` or `x + A*x`) are evaluated at
+the top of `prob2socp` into temporary sparse matrices with the operations in
+`qcml_utils`; the matrices are then stuffed like any other parameter. This
+keeps the SOCP the same size as the one produced by the Python code, instead
+of introducing a new variable and equality constraint for each product.
+
+With the `equilibrate` option, `prob2socp` finishes with `qc_equilibrate`,
+which rescales the rows and columns of G and A (Ruiz equilibration). The
+scalings are kept in the `qc_socp` struct; call `qc_unscale` on the solution
+before recovering the variables with `socp2prob`.
+
+The second-order cones are described by `qblocks`, the (count, size) of each
+block of cones of the same size, and (in the default, interleaved, layout)
+by `q`, the size of every cone. With `cone_layout="blocked"`, the rows of a
+product of cones are ordered argument by argument, so they are stuffed
+without a stride, and `q` is NULL.
+
+Frozen parameters (and the parts of G, A, c, h, and b evaluated from them at
+codegen time) are declared at the top of the source as static arrays: a dense
+array for a vector and a static `qc_matrix` otherwise.
 """
 import os, shutil, site, math
-from collections import Counter
-from .. base_codegen import Codegen, CodegenVariable
-
-from ... mixins import RestrictedMultiplyMixin
+from collections import Counter, OrderedDict
+from .. base_codegen import Codegen, CodegenVariable, INDEX_TYPES, \
+    CONE_LAYOUTS, RUIZ_ITERATIONS
 
 from ... ast.expressions import expression
-from ... properties import shape
+from ... properties import shape, sign
+from ... properties.shape import Shape
 from ... properties.curvature import isconstant
 
-from ... codes import OnesCoeff, ConstantCoeff
+from ... codes import OnesCoeff, ConstantCoeff, EyeCoeff, NegateCoeff, \
+    TransposeCoeff, AddCoeff, MulCoeff, ParameterCoeff, TemporaryCoeff, \
+    DiagonalParameterCoeff, DenseParameterCoeff, FrozenCoeff
+from ... codes.coefficients.coefficient import isstructured, coefficients
 from ... codes.function import CFunction
 from ... codes.encoders import toC
 
 from ... properties.abstract_dim import AbstractDim
+from ... exceptions import QCMLException
+
 
+class OrderedCounter(Counter, OrderedDict):
+    """ A Counter that remembers the order its elements were first counted.
+    """
+    pass
 
 def write_template(template_file, new_file, code):
     with open(template_file, 'r') as template, open(new_file, 'w') as output:
         for line in template:
             output.write(line % (code))
 
+def c_array(values):
+    """ The C initializer of an array with the given (numpy) values.
+    """
+    # an array can't be empty
+    return "{%s}" % (', '.join(map(repr, values.tolist())) or "0")
+
 def shape_to_c_type(x):
     if isinstance(x, CodegenVariable):
         if x.length == 1:
@@ -51,16 +93,51 @@ def shape_to_c_type(x):
     else:
         if shape.isscalar(x): return "double"
         if shape.isvector(x): return "double *"
+        # diagonal and dense matrices are given as arrays (of the diagonal,
+        # or of the entries in column major order)
+        if getattr(x, 'structure', None) in ('diagonal', 'dense'): return "double *"
         if shape.ismatrix(x): return "qc_matrix *"
     raise Exception("Unknown shape...")
 
-class C_Codegen(RestrictedMultiplyMixin, Codegen):
+class C_Codegen(Codegen):
     """ This produces two functions and a header file.
     """
-    def __init__(self):
+    # names of the matrix-free operators, e.g., "A" for `qc_{name}_A`, that
+    # are written out along with the two functions; see C_OperatorCodegen
+    operators = ()
+
+    @property
+    def operator_functions(self):
+        """ The keys of the functions written out with the operators.
+        """
+        return ['f' + k for k in self.operators]
+
+    def __init__(self, openmp = False, index_type = "int64", equilibrate = False, cone_layout = "interleaved"):
         super(C_Codegen, self).__init__()
         # TODO: allow optimizations with given sparsity pattern
 
+        # the integer type of the sparse matrix indices and cone sizes
+        if index_type not in INDEX_TYPES:
+            raise QCMLException("C codegen: index_type must be one of %s" % (INDEX_TYPES,))
+        self.index_type = index_type
+
+        # stuff independent blocks in parallel with OpenMP
+        self.openmp = openmp
+        # list of (matrix, block number, lines) for each independent block;
+        # only used with openmp
+        self.blocks = []
+
+        # rescale G and A at the end of prob2socp
+        self.equilibrate = equilibrate
+
+        # the row order of the products of cones; in the blocked layout, q
+        # is NULL and the cones are only described by their blocks
+        if cone_layout not in CONE_LAYOUTS:
+            raise QCMLException("C codegen: cone_layout must be one of %s" % (CONE_LAYOUTS,))
+        if cone_layout == "blocked" and equilibrate:
+            raise QCMLException("C codegen: Cannot equilibrate the blocked cone layout.")
+        self.cone_layout = cone_layout
+
         # functions we are going to generate
         self._code = {}
         self._code['prob2socp'] = CFunction("qc_{name}2socp",
@@ -84,6 +161,15 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
         # keep track of the problem dimension
         self.size_lookup = {'m': 0, 'n': 0, 'p': 0}
 
+        # lines evaluating the temporary matrices (products and sums of
+        # parameters) used to stuff the matrices
+        self.temporaries = []
+
+        # the frozen coefficients, declared as static arrays, and their names
+        # (keyed by value)
+        self.frozen = []
+        self.frozen_names = {}
+
     @property
     def prob2socp(self): return self.code['prob2socp']
 
@@ -94,7 +180,13 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
     def extension(self):
         return ".c"
 
-    def save(self, name):
+    def save(self, name, benchmark = False):
+        """ Saves the generated code into the folder `name`.
+
+            With `benchmark`, also writes `bench_{name}.c` and a Makefile
+            target `bench_{name}` that times `qc_{name}2socp` on random
+            parameters.
+        """
         # get the paths to the template files
         data_dir = os.path.dirname(__file__)
         path = os.getcwd()
@@ -102,11 +194,13 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
         makefile_template = "{data_dir}/Makefile_template".format(**vars())
         source_file_template = "{data_dir}/stuff_template.c".format(**vars())
         header_file_template = "{data_dir}/stuff_template.h".format(**vars())
+        bench_file_template = "{data_dir}/bench_template.c".format(**vars())
 
         new_dir = "{path}/{name}".format(**vars())
         makefile = "{new_dir}/Makefile".format(**vars())
         source_file = "{new_dir}/{name}.c".format(**vars())
         header_file = "{new_dir}/{name}.h".format(**vars())
+        bench_file = "{new_dir}/bench_{name}.c".format(**vars())
 
         # create the dictionary for the generated code
         if not os.path.exists(new_dir):
@@ -116,6 +210,11 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
         codegen_dict = {
             'name': name,
             'NAME': name.upper(),
+            'openmp_flag': "-fopenmp" if self.openmp else "",
+            'index_flag': "-DQC_INT32" if self.index_type == "int32" else "",
+            'index_check': '\n'.join(self.c_index_check(name)),
+            'frozen': ''.join("%s\n" % line for line in self.c_frozen_declarations()),
+            'bench_target': "",
             'params': self.params,
             'dims': self.abstract_dims,
             'variables': '\n'.join(self.variables),
@@ -124,9 +223,21 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
             'prob2socp': self.prob2socp.source.format(name=name),
             'socp2prob': self.socp2prob.source.format(name=name),
             'prob2socp_prototype': self.prob2socp.prototype.format(name=name),
-            'socp2prob_prototype': self.socp2prob.prototype.format(name=name)
+            'socp2prob_prototype': self.socp2prob.prototype.format(name=name),
+            'operators': ''.join("\n\n%s" % self.code[k].source.format(name=name) for k in self.operator_functions),
+            'operator_prototypes': '\n'.join(self.c_operator_prototypes(name))
         }
 
+        if benchmark:
+            codegen_dict.update({
+                'bench_target': '\n'.join(self.c_bench_target(name)),
+                'usage': ' '.join("[%s]" % k for k in self.program.abstract_dims),
+                'bench_declarations': '\n'.join(self.c_bench_declarations()),
+                'bench_dims': '\n'.join(self.c_bench_dims()),
+                'bench_params': '\n'.join(self.c_bench_params()),
+                'bench_free': '\n'.join(self.c_bench_free())
+            })
+
         # copy over the static utility files
         shutil.copy("{0}/qcml_utils.c".format(data_dir), new_dir)
         shutil.copy("{0}/qcml_utils.h".format(data_dir), new_dir)
@@ -135,6 +246,96 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
         write_template(makefile_template, makefile, codegen_dict)
         write_template(header_file_template, header_file, codegen_dict)
         write_template(source_file_template, source_file, codegen_dict)
+        if benchmark:
+            write_template(bench_file_template, bench_file, codegen_dict)
+
+    # generator for the declarations of the matrix-free operators
+    def c_operator_prototypes(self, name):
+        if self.operators:
+            yield ""
+            yield ""
+            yield "/* matrix-free products with A, G, and their transposes; e.g.,"
+            yield " * qc_%s_A sets y = A*x and qc_%s_AT sets x = A'*y; qc_%s_norms sets" % (name, name, name)
+            yield " * the 2-norms (or, with inf, the inf-norms) of the rows and columns of G and A"
+            yield " *     returns 0 on success and 1 if out of memory"
+            yield " */"
+            for k in self.operator_functions:
+                yield "%s;" % self.code[k].prototype.format(name=name)
+
+    # generator for the Makefile target of the benchmark
+    def c_bench_target(self, name):
+        yield ""
+        yield "# times the matrix stuffing on random parameters"
+        yield "bench_%s: bench_%s.c %s.o qcml_utils.o" % (name, name, name)
+        yield "\t$(CC) $(CFLAGS) bench_%s.c %s.o qcml_utils.o -lm -o $@" % (name, name)
+        yield ""
+
+    # the benchmark uses a dims struct (not a pointer)
+    def bench_size(self, *dims):
+        return Shape(list(dims)).size(abstractdim_rewriter=lambda ad: "dims.%s" % ad)
+
+    # generator to declare the matrix parameters of the benchmark
+    def c_bench_declarations(self):
+        for (k,v) in self.parameters.iteritems():
+            if shape_to_c_type(v) == "qc_matrix *":
+                yield "%sqc_matrix %s_matrix;" % (self.indent, k)
+
+    # generator to read the dimensions of the benchmark from the command line
+    def c_bench_dims(self):
+        for i, k in enumerate(self.program.abstract_dims):
+            yield "%sdims.%s = argc > %d ? atol(argv[%d]) : 100;" % (self.indent, k, i+2, i+2)
+
+    # generator to fill the parameters of the benchmark with (dense) random
+    # data of the right sign
+    def c_bench_params(self):
+        for (k,v) in self.parameters.iteritems():
+            value = "-qc_rand()" if sign.isnegative(v) else "qc_rand()"
+            c_type = shape_to_c_type(v)
+            if c_type == "double":
+                yield "%sparams.%s = %s;" % (self.indent, k, value)
+            elif c_type == "double *":
+                size = self.bench_size(*self.c_array_dims(v))
+                yield "%sparams.%s = (double *) malloc(%s * sizeof(double));" % (self.indent, k, size)
+                yield "%sif (!params.%s) return 1;" % (self.indent, k)
+                yield "%s{ long i; for(i = 0; i < %s; ++i) params.%s[i] = %s; }" % (self.indent, size, k, value)
+            else:
+                mat = "%s_matrix" % k
+                yield "%s%s.m = %s; %s.n = %s;" % (self.indent, mat, self.bench_size(v.shape.row), mat, self.bench_size(v.shape.col))
+                yield "%s%s.nnz = %s.m * %s.n;" % (self.indent, mat, mat, mat)
+                yield "%s%s.v = (double *) malloc(%s.nnz * sizeof(double));" % (self.indent, mat, mat)
+                yield "%s%s.i = (qc_int *) malloc(%s.nnz * sizeof(qc_int));" % (self.indent, mat, mat)
+                yield "%s%s.j = (qc_int *) malloc(%s.nnz * sizeof(qc_int));" % (self.indent, mat, mat)
+                yield "%sif (!%s.v || !%s.i || !%s.j) return 1;" % (self.indent, mat, mat, mat)
+                yield "%s{ long i; for(i = 0; i < %s.nnz; ++i) {" % (self.indent, mat)
+                yield "%s%s.i[i] = i %% %s.m; %s.j[i] = i / %s.m; %s.v[i] = %s;" % (2*self.indent, mat, mat, mat, mat, mat, value)
+                yield "%s} }" % self.indent
+                yield "%sparams.%s = &%s;" % (self.indent, k, mat)
+
+    # the dimensions of the array holding the vector, diagonal, or dense
+    # parameter `x`
+    def c_array_dims(self, x):
+        if x.structure == 'diagonal': return [x.shape.row]
+        return [x.shape.row, x.shape.col]
+
+    # generator to free the parameters of the benchmark
+    def c_bench_free(self):
+        for (k,v) in self.parameters.iteritems():
+            c_type = shape_to_c_type(v)
+            if c_type == "double *":
+                yield "%sfree(params.%s);" % (self.indent, k)
+            elif c_type == "qc_matrix *":
+                yield "%sfree(%s_matrix.v); free(%s_matrix.i); free(%s_matrix.j);" % (self.indent, k, k, k)
+
+    # generator to check that the header is compiled with the right indices
+    def c_index_check(self, name):
+        if self.index_type == "int32":
+            yield "#ifndef QC_INT32"
+            yield '#error "%s was generated with 32-bit indices; compile with -DQC_INT32"' % name
+            yield "#endif"
+        else:
+            yield "#ifdef QC_INT32"
+            yield '#error "%s was generated with 64-bit indices; compile without -DQC_INT32"' % name
+            yield "#endif"
 
     # generator to get cone sizes
     def c_dimensions(self):
@@ -145,30 +346,44 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
         yield "data->m = %s;" % (self.num_conic + self.num_lps)
         yield "data->n = %s;" % self.num_vars
 
-    # generator to get cone dimensions
+    # generator to get cone dimensions; the (count, size) blocks of cones
+    # are stored in qblocks, and expanded into the size of every cone in q
+    # (only in the interleaved layout)
     def c_cone_sizes(self):
         if self.cone_list:
             num_cone, cone_size = zip(*self.cone_list)
         else:
             num_cone, cone_size = [0], 0
+        blocks = self.cone_blocks()
 
         yield "data->l = %s;" % self.num_lps
         yield "data->nsoc = %s;" % sum(num_cone)
-        if sum(num_cone) == 0:
+        yield "data->nqblocks = %d;" % len(blocks)
+        if not blocks:
+            yield "data->qblocks = NULL;"
+        else:
+            yield "data->qblocks = (qc_int *) malloc(2 * data->nqblocks * sizeof(qc_int));"
+            yield "if(!data->qblocks) %s" % self.c_fail()
+            for k, (num, sz) in enumerate(blocks):
+                yield "data->qblocks[%d] = %s; data->qblocks[%d] = %s;" % (2*k, num, 2*k + 1, sz)
+        if sum(num_cone) == 0 or self.cone_layout == "blocked":
             yield "data->q = NULL;"
         else:
-            yield "data->q = (long *) malloc(data->nsoc * sizeof(long));"
-            yield "if(!data->q) return qc_socp_free(data);"
+            yield "data->q = (qc_int *) malloc(data->nsoc * sizeof(qc_int));"
+            yield "if(!data->q) %s" % self.c_fail()
             yield ""
             yield "/* initialize the cone */"
             yield "q_ptr = data->q;"
-            for num, sz in self.cone_list:
+            for num, sz in blocks:
                 if num == 1: yield "*q_ptr++ = %s;" % sz
                 else: yield "for(i = 0; i < %s; ++i) *q_ptr++ = %s;" % (num, sz)
 
     # function to get parameters
     def c_params(self):
-        return ["%s%s %s;" % (self.indent, shape_to_c_type(v),k) for (k,v) in self.program.parameters.iteritems()]
+        if self.parameters:
+            return ["%s%s %s;" % (self.indent, shape_to_c_type(v),k) for (k,v) in self.parameters.iteritems()]
+        else:
+            return ["%sconst char SENTINEL; /* empty params struct */" % self.indent]
 
     # function to get abstract dims
     def c_dims(self):
@@ -198,7 +413,7 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
     # generator to allocate socp data structures
     def c_allocate_socp(self):
         yield "qc_socp * data = (qc_socp *) calloc(1, sizeof(qc_socp));"
-        yield "if (!data) return qc_socp_free(data);"
+        yield "if (!data) %s" % self.c_fail()
 
     # generator to allocate vectors
     def c_allocate_vector(self, vector, size):
@@ -206,20 +421,26 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
             yield "data->%s = NULL;" % vector
         else:
             yield "data->%s = (double *) calloc(data->%s, sizeof(double));" % (vector, size)
-            yield "if (!data->%s) return qc_socp_free(data);" % (vector)
+            yield "if (!data->%s) %s" % (vector, self.c_fail())
 
     def c_allocate_matrix(self, matrix):
         const = sum(int(x) for x in self.nnz[matrix] if x.isdigit())
-        expr_counts = Counter(x for x in self.nnz[matrix] if not x.isdigit())
+        expr_counts = OrderedCounter(x for x in self.nnz[matrix] if not x.isdigit())
         size = ' + '.join('%d*%s' % (v,k) for k,v in expr_counts.iteritems())
 
         if const > 0: size = "%s + %d" % (size, const)
         if const > 0 or size:
+            if self.index_type == "int32":
+                # sum the nonzeros in floating point to check for overflow
+                terms = ["(double) %d*%s" % (v,k) for k,v in expr_counts.iteritems()]
+                if const > 0: terms.append("(double) %d" % const)
+                yield "/* check that the nonzeros fit in the index type */"
+                yield "if (%s > QC_INT_MAX) %s" % (' + '.join(terms), self.c_fail())
             yield "nnz%s = %s;" % (matrix, size)
             yield "data->%(matrix)sx = (double *) malloc(nnz%(matrix)s * sizeof(double));" % {'matrix': matrix}
-            yield "data->%(matrix)sp = (long *) malloc(nnz%(matrix)s * sizeof(long));" % {'matrix': matrix}
-            yield "data->%(matrix)si = (long *) malloc(nnz%(matrix)s * sizeof(long));" % {'matrix': matrix}
-            yield "if ((!data->%(matrix)sx) || (!data->%(matrix)sp) || (!data->%(matrix)si)) return qc_socp_free(data);" % {'matrix': matrix}
+            yield "data->%(matrix)sp = (qc_int *) malloc(nnz%(matrix)s * sizeof(qc_int));" % {'matrix': matrix}
+            yield "data->%(matrix)si = (qc_int *) malloc(nnz%(matrix)s * sizeof(qc_int));" % {'matrix': matrix}
+            yield "if ((!data->%(matrix)sx) || (!data->%(matrix)sp) || (!data->%(matrix)si)) %(fail)s" % {'matrix': matrix, 'fail': self.c_fail()}
         else:
             yield "nnz%s = 0;" % (matrix)
             yield "data->%sx = NULL;" % (matrix)
@@ -243,7 +464,7 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
     def c_compress(self, matrix):
         if self.nnz[matrix]:
             yield "%s_csc = qc_compress(&%s_coo);" % (matrix, matrix)
-            yield "if (!%s_csc) return qc_socp_free(data);" % matrix
+            yield "if (!%s_csc) %s" % (matrix, self.c_fail())
             yield "/* free memory used for COO matrix, so it can be reassigned later */"
             yield "free(data->%si);" % matrix
             yield "free(data->%sp);" % matrix
@@ -276,6 +497,128 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
             else:
                 yield "vars->%s = z + %s;  /* length %s */" % (k, start, length)
 
+    # whether the C encoder can loop over the nonzeros of the coefficient
+    # directly; otherwise, it is evaluated into a temporary matrix first
+    def c_isnative(self, x):
+        if x.isscalar: return True
+        if isinstance(x, AddCoeff): return False
+        if isinstance(x, MulCoeff):
+            return x.left.isscalar and (isinstance(x.right, ParameterCoeff) or \
+                (isinstance(x.right, TransposeCoeff) and self.c_isdense(x.right)) or \
+                isstructured(x.right))
+        if isinstance(x, NegateCoeff): return isinstance(x.arg, ParameterCoeff)
+        if isinstance(x, TransposeCoeff): return self.c_isnative(x.arg)
+        return True
+
+    # whether the C encoder can index the vector coefficient directly (as
+    # x[i]); otherwise, it is evaluated into a temporary matrix first
+    def c_isdense(self, x):
+        if x.isscalar or isinstance(x, OnesCoeff): return True
+        if isinstance(x, NegateCoeff): return self.c_isdense(x.arg)
+        if isinstance(x, MulCoeff): return x.left.isscalar and self.c_isdense(x.right)
+        if isinstance(x, TransposeCoeff): x = x.arg
+        return isinstance(x, ParameterCoeff) and x.cols == 1
+
+    def temporary(self, x):
+        """ Adds the code evaluating the coefficient `x` into a sparse (COO)
+            matrix and returns the name of that matrix.
+
+            Sums are formed by appending the nonzeros (duplicates are summed
+            when G and A are compressed) and products by a sparse product, so
+            no new variables or constraints are needed for them.
+        """
+        if isinstance(x, DiagonalParameterCoeff):
+            value = "qc_diag(%s, %s)" % (toC(x), x.n)
+        elif isinstance(x, DenseParameterCoeff):
+            value = "qc_dense2coo(%s, %s, %s)" % (toC(x), x.rows, x.cols)
+        elif isinstance(x, ParameterCoeff) and not x.isscalar and x.cols != 1:
+            return toC(x)
+        elif x.isscalar:
+            value = "qc_speye(1, %s)" % toC(x)
+        elif isinstance(x, ParameterCoeff):
+            value = "qc_dense2coo(%s, %s, 1)" % (toC(x), x.rows)
+        elif isinstance(x, EyeCoeff):
+            value = "qc_speye(%s, %s)" % (x.n, toC(x.coeff))
+        elif isinstance(x, OnesCoeff):
+            value = "qc_ones(%s, %s, %d)" % (x.n, toC(x.coeff), x.transpose)
+        elif isinstance(x, NegateCoeff):
+            value = "qc_scale(%s, -1)" % self.temporary(x.arg)
+        elif isinstance(x, TransposeCoeff):
+            value = "qc_transpose(%s)" % self.temporary(x.arg)
+        elif isinstance(x, AddCoeff):
+            value = "qc_add(%s, %s)" % (self.temporary(x.left), self.temporary(x.right))
+        elif isinstance(x, MulCoeff) and x.left.isscalar:
+            value = "qc_scale(%s, %s)" % (self.temporary(x.right), toC(x.left))
+        elif isinstance(x, MulCoeff) and x.right.isscalar:
+            value = "qc_scale(%s, %s)" % (self.temporary(x.left), toC(x.right))
+        elif isinstance(x, MulCoeff):
+            value = "qc_multiply(%s, %s)" % (self.temporary(x.left), self.temporary(x.right))
+        else:
+            raise QCMLException("C codegen: cannot evaluate the coefficient %s" % x)
+
+        name = "tmp[%d]" % len(self.temporaries)
+        self.temporaries.append( (name, value) )
+        return name
+
+    def declare_frozen(self, expr):
+        """ Names the frozen coefficients in `expr`, which are declared as
+            static arrays in the source; must be called before `expr` is
+            encoded.
+        """
+        for x in coefficients(expr, FrozenCoeff):
+            # coefficients with the same value share a declaration
+            m = x.matrix
+            key = (m.shape, m.row.tostring(), m.col.tostring(), m.data.tostring())
+            if key not in self.frozen_names:
+                self.frozen_names[key] = "frozen%d" % len(self.frozen)
+                self.frozen.append(x)
+            x.value = self.frozen_names[key]
+
+    # generator to declare the frozen coefficients
+    def c_frozen_declarations(self):
+        if self.frozen:
+            yield "/* the frozen parameters */"
+            for x in self.frozen:
+                m = x.matrix
+                if x.cols == 1:
+                    yield "static double %s[] = %s;" % (x.value, c_array(m.toarray().ravel()))
+                else:
+                    yield "static qc_int %s_i[] = %s;" % (x.value, c_array(m.row))
+                    yield "static qc_int %s_j[] = %s;" % (x.value, c_array(m.col))
+                    yield "static double %s_v[] = %s;" % (x.value, c_array(m.data))
+                    yield "static qc_matrix %(name)s = {%(name)s_v, %(name)s_i, %(name)s_j, %(nnz)d, %(m)d, %(n)d};" % \
+                        {'name': x.value, 'nnz': m.nnz, 'm': x.rows, 'n': x.cols}
+            yield ""
+
+    # the statement to free all memory and return when out of memory
+    def c_fail(self):
+        if self.temporaries:
+            return "{{ %s return qc_socp_free(data); }}" % self.c_free_temporaries_statement()
+        return "return qc_socp_free(data);"
+
+    def c_free_temporaries_statement(self):
+        return "for(i = 0; i < %d; ++i) qc_spfree(tmp[i]);" % len(self.temporaries)
+
+    # generator to declare the temporary matrices
+    def c_temporary_declarations(self):
+        if self.temporaries:
+            yield "qc_matrix *tmp[%d] = {{NULL}};  /* parameter expressions */" % len(self.temporaries)
+
+    # generator to evaluate the temporary matrices
+    def c_temporaries(self):
+        if self.temporaries:
+            yield ""
+            yield "/* evaluate the products and sums of parameters */"
+            for name, value in self.temporaries:
+                yield "%s = %s;" % (name, value)
+                yield "if (!%s) %s" % (name, self.c_fail())
+
+    # generator to free the temporary matrices
+    def c_free_temporaries(self):
+        if self.temporaries:
+            yield "/* free the evaluated parameter expressions */"
+            yield self.c_free_temporaries_statement()
+
     def functions_setup(self):
         # add some documentation
         self.prob2socp.document("maps 'params' into the C socp data type")
@@ -290,17 +633,20 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
 
         self.prob2socp.add_comment("all local variables")
         self.prob2socp.add_lines("long i;  /* loop index */")
-        self.prob2socp.add_lines("long *q_ptr;")
-        self.prob2socp.add_lines("long *A_row_ptr, *A_col_ptr;")
-        self.prob2socp.add_lines("long *G_row_ptr, *G_col_ptr;")
+        self.prob2socp.add_lines("qc_int *q_ptr;")
+        self.prob2socp.add_lines("qc_int *A_row_ptr, *A_col_ptr;")
+        self.prob2socp.add_lines("qc_int *G_row_ptr, *G_col_ptr;")
         self.prob2socp.add_lines("double *A_data_ptr, *G_data_ptr;")
         self.prob2socp.add_lines("long nnzA, nnzG;")
         self.prob2socp.add_lines("qc_matrix *G_csc, *A_csc;  /* possibly un-used */")
         self.prob2socp.add_lines("qc_matrix G_coo, A_coo;    /* possibly un-used */")
+        self.prob2socp.add_lines(self.c_block_declarations())
+        self.prob2socp.add_lines(self.c_temporary_declarations())
 
         self.prob2socp.newline()
         self.prob2socp.add_comment("allocate socp data structure")
         self.prob2socp.add_lines(self.c_allocate_socp())
+        self.prob2socp.add_lines(self.c_temporaries())
         self.prob2socp.newline()
 
         # set up the data structures
@@ -331,8 +677,55 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
         self.prob2socp.add_comment("allocate the cone sizes")
         self.prob2socp.add_lines(self.c_cone_sizes())
 
+    # generator to declare the block offsets (only used with openmp)
+    def c_block_declarations(self):
+        if self.openmp and self.blocks:
+            yield "long blk;  /* block index */"
+            for matrix in ['G', 'A']:
+                if self.nnz[matrix]:
+                    yield "long %s_offset[%d];" % (matrix, len(self.nnz[matrix]))
+
+    # generator to compute block offsets by prefix sum
+    def c_block_offsets(self):
+        for matrix in ['G', 'A']:
+            if self.nnz[matrix]:
+                yield "%s_offset[0] = 0;" % matrix
+                for k, nnz in enumerate(self.nnz[matrix][:-1]):
+                    yield "%s_offset[%d] = %s_offset[%d] + %s;" % (matrix, k+1, matrix, k, nnz)
+
+    # generator to stuff all the independent blocks in parallel
+    # braces are doubled, since the source is later formatted with the name
+    def c_parallel_blocks(self):
+        yield "#ifdef _OPENMP"
+        yield "#pragma omp parallel for schedule(dynamic)"
+        yield "#endif"
+        yield "for(blk = 0; blk < %d; ++blk) {{" % len(self.blocks)
+        yield "%sswitch(blk) {{" % self.indent
+        indent = 2*self.indent
+        for num, (matrix, k, lines) in enumerate(self.blocks):
+            yield "%scase %d: {{" % (indent, num)
+            yield "%s%slong i;" % (indent, self.indent)
+            if matrix is not None:
+                block = {'matrix': matrix, 'k': k}
+                yield "%s%sqc_int *%%(matrix)s_row_ptr = data->%%(matrix)si + %%(matrix)s_offset[%%(k)d];" % (indent, self.indent) % block
+                yield "%s%sqc_int *%%(matrix)s_col_ptr = data->%%(matrix)sp + %%(matrix)s_offset[%%(k)d];" % (indent, self.indent) % block
+                yield "%s%sdouble *%%(matrix)s_data_ptr = data->%%(matrix)sx + %%(matrix)s_offset[%%(k)d];" % (indent, self.indent) % block
+            for line in lines:
+                yield "%s%s%s" % (indent, self.indent, line)
+            yield "%s%sbreak;" % (indent, self.indent)
+            yield "%s}}" % indent
+        yield "%s}}" % self.indent
+        yield "}}"
+
     def functions_return(self):
         #self.prob2socp.add_lines("""for(i=0; i< 16; ++i) printf("%f ", data->Gx[i]);""")
+        if self.openmp and self.blocks:
+            self.prob2socp.add_comment("compute the offsets of the blocks in G and A")
+            self.prob2socp.add_lines(self.c_block_offsets())
+            self.prob2socp.newline()
+            self.prob2socp.add_comment("stuff the independent blocks of c, h, b, G, and A")
+            self.prob2socp.add_lines(self.c_parallel_blocks())
+            self.prob2socp.newline()
         self.prob2socp.add_comment("convert G and A ptrs into a qc_matrix")
         # creates an object named "G_coo"
         self.prob2socp.add_lines(self.c_setup_qc_matrix("G"))
@@ -342,6 +735,11 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
         self.prob2socp.add_comment("convert the matrices to column compressed form")
         self.prob2socp.add_lines(self.c_compress("G"))
         self.prob2socp.add_lines(self.c_compress("A"))
+        self.prob2socp.add_lines(self.c_free_temporaries())
+        if self.equilibrate:
+            self.prob2socp.newline()
+            self.prob2socp.add_comment("equilibrate G and A (undo with qc_unscale)")
+            self.prob2socp.add_lines("if (!qc_equilibrate(data, %d)) return qc_socp_free(data);" % RUIZ_ITERATIONS)
         self.prob2socp.add_lines("return data;")
 
         self.socp2prob.document("recovers the problem variables from the solver variable 'x' and dual variables 'y' (equality constraints) and 'z' (conic constraints)")
@@ -350,19 +748,48 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
         # recover the old variables
         self.socp2prob.add_lines(self.c_recover())
 
-    def stuff_c(self, start, end, expr):
+    def stuff_block(self, lines, matrix = None):
+        """ Without openmp, simply returns the lines to stuff the block.
+            Otherwise, saves them as an independent block (written out in
+            functions_return) and returns no lines.
+        """
+        if not self.openmp: return lines
+        k = len(self.nnz[matrix]) - 1 if matrix is not None else None
+        self.blocks.append( (matrix, k, lines) )
+        return []
+
+    # evaluates the vector into a temporary matrix if it can't be indexed
+    def dense_or_temporary(self, expr):
+        if self.c_isdense(expr): return expr
+        return TemporaryCoeff(self.temporary(expr))
+
+    def stuff_vector(self, vector, start, end, expr):
+        if isinstance(expr, TemporaryCoeff):
+            # the vector is zero-initialized, so add the (possibly duplicate)
+            # nonzeros of the evaluated expression
+            yield "for(i = 0; i < %(tmp)s->nnz; ++i) data->%(vector)s[%(tmp)s->i[i] + %(start)s] += %(tmp)s->v[i];" % \
+                {'tmp': toC(expr), 'vector': vector, 'start': start}
+            return
         # TODO: i shouldn't have to check here....
         if expr.isscalar or isinstance(expr, OnesCoeff): tag = ";"
         else: tag = "[i];"
-        yield "for(i = 0; i < %s; ++i) data->c[i + %s] = %s%s" % (end-start, start, toC(expr), tag)
+        yield "for(i = 0; i < %s; ++i) data->%s[i + %s] = %s%s" % (end-start, vector, start, toC(expr), tag)
 
-    def stuff_b(self, start, end, expr):
-        # TODO: i shouldn't have to check here....
-        if expr.isscalar or isinstance(expr, OnesCoeff): tag = ";"
-        else: tag = "[i];"
-        yield "for(i = 0; i < %s; ++i) data->b[i + %s] = %s%s" % (end-start, start, toC(expr), tag)
+    def stuff_c(self, start, end, expr):
+        self.declare_frozen(expr)
+        expr = self.dense_or_temporary(expr)
+        return self.stuff_block(self.stuff_vector("c", start, end, expr))
 
-    def stuff_h(self, start, end, expr, stride = None):
+    def stuff_b(self, start, end, expr):
+        self.declare_frozen(expr)
+        expr = self.dense_or_temporary(expr)
+        return self.stuff_block(self.stuff_vector("b", start, end, expr))
+
+    def stuff_strided_h(self, start, end, expr, stride):
+        if isinstance(expr, TemporaryCoeff):
+            yield "for(i = 0; i < %(tmp)s->nnz; ++i) data->h[%(stride)s * %(tmp)s->i[i] + %(start)s] += %(tmp)s->v[i];" % \
+                {'tmp': toC(expr), 'stride': stride or 1, 'start': start}
+            return
         if expr.isscalar: tag = ";"
         else: tag = "[i];"
         if stride is not None and stride != 1:
@@ -375,6 +802,10 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
         else:
             yield "for(i = 0; i < %s; ++i) data->h[i + %s] = %s%s" % (end-start, start, toC(expr), tag)
 
+    def stuff_h(self, start, end, expr, stride = None):
+        self.declare_frozen(expr)
+        expr = self.dense_or_temporary(expr)
+        return self.stuff_block(self.stuff_strided_h(start, end, expr, stride))
 
     def stuff_matrix(self, matrix, rstart, rend, cstart, cend, expr, rstride):
         yield toC(expr.I(rstart, rstride)) % ({'ptr': "%s_row_ptr" % matrix})
@@ -386,22 +817,28 @@ class C_Codegen(RestrictedMultiplyMixin, Codegen):
         n = (rend - rstart) / rstride
         if (isinstance(n, AbstractDim) or n > 1) and expr.isscalar:
             expr = OnesCoeff(n,ConstantCoeff(1))*expr
+        self.declare_frozen(expr)
+        if not self.c_isnative(expr):
+            expr = TemporaryCoeff(self.temporary(expr))
 
         # execute this code first
         self.nnz['G'].append(toC(expr.nnz()))
 
-        return self.stuff_matrix("G", rstart, rend, cstart, cend, expr, rstride)
+        return self.stuff_block(self.stuff_matrix("G", rstart, rend, cstart, cend, expr, rstride), "G")
 
     def stuff_A(self, rstart, rend, cstart, cend, expr, rstride = 1):
         # in case we need to promote scalar into vector
         n = (rend - rstart) / rstride
         if (isinstance(n, AbstractDim) or n > 1) and expr.isscalar:
             expr = OnesCoeff(n,ConstantCoeff(1))*expr
+        self.declare_frozen(expr)
+        if not self.c_isnative(expr):
+            expr = TemporaryCoeff(self.temporary(expr))
 
         # execute this code first
         self.nnz['A'].append(toC(expr.nnz()))
 
-        return self.stuff_matrix("A", rstart, rend, cstart, cend, expr, rstride)
+        return self.stuff_block(self.stuff_matrix("A", rstart, rend, cstart, cend, expr, rstride), "A")
 
     def abstractdim_rewriter(self, ad):
         return "dims->%s" % ad
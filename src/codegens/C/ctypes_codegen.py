@@ -0,0 +1,84 @@
+"""
+Code generator for the C matrix stuffing code with a Python (ctypes) binding.
+
+Spits out everything the C code generator does, plus
+
+{name}.py
+
+a thin Python module that builds `lib{name}.so` with the local C compiler
+(through the Makefile), converts NumPy / scipy.sparse parameters into the
+C parameter struct, and calls `qc_{name}2socp`. The returned `c`, `h`, `b`,
+`G`, and `A` are NumPy arrays (and scipy CSC matrices) viewing the memory
+allocated in C; the `qc_socp` struct is freed with `qc_socp_free` once all
+of the views have been garbage collected.
+
+The `CtypesOperatorCodegen` wraps the matrix-free operators of the
+`C_OperatorCodegen` in the same way.
+
+Since the binding is plain Python, the variable offsets for `socp_to_prob`
+are written in Python syntax by rewriting the C abstract dimensions.
+"""
+import os, re
+from . codegen import C_Codegen, write_template
+from . operator_codegen import C_OperatorCodegen
+
+from ... properties import shape
+
+CTYPES_INDEX = {"int32": "ctypes.c_int", "int64": "ctypes.c_long"}
+NUMPY_INDEX = {"int32": "np.int32", "int64": "np.int_"}
+
+def shape_to_kind(x):
+    if shape.isscalar(x): return "scalar"
+    if shape.isvector(x): return "vector"
+    # a diagonal matrix is given by the vector of its diagonal
+    if x.structure == 'diagonal': return "vector"
+    if x.structure == 'dense': return "dense"
+    if shape.ismatrix(x): return "matrix"
+    raise Exception("Unknown shape...")
+
+def c_dims_to_python(expr):
+    """ Rewrites the C abstract dimensions, e.g. `dims->n`, in `expr` as
+        Python dictionary lookups, e.g. `dims['n']`.
+    """
+    return re.sub(r"dims->(\w+)", r"dims['\1']", str(expr))
+
+class CtypesCodegen(C_Codegen):
+    """ This produces the C code and a Python module wrapping it.
+    """
+    def python_recover(self):
+        for k in self.program.variables.keys():
+            start, length = self.primal_vars[k]
+            yield "'%s' : x[%s:%s]" % (k, c_dims_to_python(start), c_dims_to_python(start+length))
+        for k in self.dual_equality_vars.keys():
+            start, length = self.dual_equality_vars[k]
+            yield "'%s' : y[%s:%s]" % (k, c_dims_to_python(start), c_dims_to_python(start+length))
+        for k in self.dual_conic_vars.keys():
+            start, length = self.dual_conic_vars[k]
+            yield "'%s' : z[%s:%s]" % (k, c_dims_to_python(start), c_dims_to_python(start+length))
+
+    def save(self, name, benchmark = False):
+        super(CtypesCodegen, self).save(name, benchmark)
+
+        data_dir = os.path.dirname(__file__)
+        path = os.getcwd()
+
+        binding_template = "{data_dir}/ctypes_template".format(**vars())
+        binding_file = "{path}/{name}/{name}.py".format(**vars())
+
+        params = [(k, shape_to_kind(v)) for (k,v) in self.parameters.iteritems()]
+        codegen_dict = {
+            'name': name,
+            'ctypes_int': CTYPES_INDEX[self.index_type],
+            'numpy_int': NUMPY_INDEX[self.index_type],
+            'params': repr(params),
+            'dims': repr(list(self.program.abstract_dims)),
+            'operators': repr(list(self.operators)),
+            'recover': ', '.join(self.python_recover())
+        }
+        write_template(binding_template, binding_file, codegen_dict)
+
+class CtypesOperatorCodegen(CtypesCodegen, C_OperatorCodegen):
+    """ This produces the matrix-free C operators and a Python module wrapping
+        them; its `prob_to_socp` returns 'A', 'AT', 'G', and 'GT' as functions.
+    """
+    pass
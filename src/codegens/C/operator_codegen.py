@@ -0,0 +1,328 @@
+"""
+Code generator for matrix-free C operators.
+
+Spits out everything the C code generator does, except that `qc_{name}2socp`
+only fills in c, h, b, and the cone sizes; G and A are left empty. Instead,
+the source also contains the four functions
+
+qc_{name}_A, qc_{name}_AT, qc_{name}_G, qc_{name}_GT
+
+which compute y = A*x, x = A'*y, y = G*x, and x = G'*y, respectively. Each
+block of G and A is applied with a strided loop over the parameter storage
+(the nonzeros of a `qc_matrix` or the entries of a dense vector), so G and A
+are never formed. This is meant for problems where stuffing G would not fit
+in memory.
+
+Products of parameters, e.g. `A*B*x`, are applied right to left through work
+vectors allocated when the operator is called; the operators return 1 if the
+allocation fails and 0 otherwise.
+
+The source also contains `qc_{name}_norms`, which sets the 2-norms (or
+inf-norms) of the rows and columns of G and A, e.g. for equilibrating them,
+without applying the operators. Each block is reduced in closed form from the
+parameter storage, except for sums and products of parameters, which are
+evaluated into a sparse matrix (as in `qc_{name}2socp` of the C codegen) and
+freed once their norms are added.
+"""
+from . codegen import C_Codegen
+from .. base_operator_codegen import OperatorCodegen
+
+from ... codes import OnesCoeff, ConstantCoeff, EyeCoeff, NegateCoeff, \
+    TransposeCoeff, AddCoeff, MulCoeff, ParameterCoeff, DiagonalParameterCoeff, \
+    DenseParameterCoeff
+from ... codes.function import CFunction
+from ... codes.encoders import toC
+
+from ... properties.abstract_dim import AbstractDim
+from ... exceptions import QCMLException
+
+def element(vector, i):
+    """ The C expression for the i-th element of the strided `vector`, given
+        as a (pointer, offset, stride) tuple.
+    """
+    ptr, offset, stride = vector
+    if str(i) == "0": return "%s[%s]" % (ptr, offset)
+    index = i if stride == 1 else "%s*%s" % (stride, i)
+    if str(offset) != "0": index = "%s + %s" % (offset, index)
+    return "%s[%s]" % (ptr, index)
+
+def times(scale, coeff):
+    """ Multiplies the C expression `scale` (or None) by the scalar `coeff`.
+    """
+    if isinstance(coeff, ConstantCoeff) and coeff.value == 1: return scale
+    value = "(%s)" % toC(coeff)
+    if scale is None: return value
+    return "%s*%s" % (scale, value)
+
+def scaled(scale, value):
+    if scale is None: return value
+    return "%s*%s" % (scale, value)
+
+class C_OperatorCodegen(OperatorCodegen, C_Codegen):
+    """ This produces the C code with matrix-free operators for G and A.
+    """
+    operators = ('A', 'AT', 'G', 'GT')
+
+    def __init__(self, index_type = "int64"):
+        C_Codegen.__init__(self, index_type = index_type)
+
+        args = ["const {name}_params * params", "const {name}_dims * dims"]
+        self._code['fA'] = CFunction("qc_{name}_A",
+            arguments = args + ["const double * x", "double * y"], ret_type="int")
+        self._code['fAT'] = CFunction("qc_{name}_AT",
+            arguments = args + ["const double * y", "double * x"], ret_type="int")
+        self._code['fG'] = CFunction("qc_{name}_G",
+            arguments = args + ["const double * x", "double * y"], ret_type="int")
+        self._code['fGT'] = CFunction("qc_{name}_GT",
+            arguments = args + ["const double * y", "double * x"], ret_type="int")
+        self._code['norms'] = CFunction("qc_{name}_norms",
+            arguments = args + ["int inf", "double * Grows", "double * Gcols",
+                                "double * Arows", "double * Acols"], ret_type="int")
+        self._codekeyorder = ['prob2socp', 'socp2prob', 'fA', 'fAT', 'fG', 'fGT', 'norms']
+
+        # lengths of the work vectors used by each operator
+        self.workspaces = {'fA': [], 'fAT': [], 'fG': [], 'fGT': []}
+
+    @property
+    def fA(self): return self.code['fA']
+
+    @property
+    def fAT(self): return self.code['fAT']
+
+    @property
+    def fG(self): return self.code['fG']
+
+    @property
+    def fGT(self): return self.code['fGT']
+
+    @property
+    def norms(self): return self.code['norms']
+
+    @property
+    def operator_functions(self):
+        return ['f' + k for k in self.operators] + ['norms']
+
+    def c_apply(self, func, expr, x, y, transpose = False, scale = None):
+        """ Generates the lines to add `scale*expr*x` (or `scale*expr'*x`) to
+            `y` in the operator `func`; `x` and `y` are (pointer, offset,
+            stride) tuples.
+
+            Must be consumed right away, since it registers the work vectors
+            of the operator.
+        """
+        if expr.isscalar:
+            yield "%s += %s;" % (element(y, 0), scaled(times(scale, expr), element(x, 0)))
+        elif isinstance(expr, EyeCoeff):
+            yield "for(i = 0; i < %s; ++i) %s += %s;" % \
+                (expr.n, element(y, "i"), scaled(times(scale, expr.coeff), element(x, "i")))
+        elif isinstance(expr, OnesCoeff):
+            # a column of ones, or a row of ones if (exactly one is) transposed
+            xi, yi = ("i", 0) if expr.transpose != transpose else (0, "i")
+            yield "for(i = 0; i < %s; ++i) %s += %s;" % \
+                (expr.n, element(y, yi), scaled(times(scale, expr.coeff), element(x, xi)))
+        elif isinstance(expr, DiagonalParameterCoeff):
+            yield "for(i = 0; i < %s; ++i) %s += %s[i] * %s;" % \
+                (expr.n, element(y, "i"), scaled(scale, toC(expr)), element(x, "i"))
+        elif isinstance(expr, DenseParameterCoeff):
+            # a dense matrix parameter, in column major order
+            row, col = "i %% %s" % expr.rows, "i / %s" % expr.rows
+            xi, yi = (row, col) if transpose else (col, row)
+            yield "for(i = 0; i < %s; ++i) %s += %s[i] * %s;" % \
+                (expr.nnz(), element(y, "(%s)" % yi), scaled(scale, toC(expr)), element(x, "(%s)" % xi))
+        elif isinstance(expr, ParameterCoeff) and expr.cols == 1:
+            # a dense vector parameter
+            xi, yi = ("i", 0) if transpose else (0, "i")
+            yield "for(i = 0; i < %s; ++i) %s += %s[i] * %s;" % \
+                (expr.rows, element(y, yi), scaled(scale, toC(expr)), element(x, xi))
+        elif isinstance(expr, ParameterCoeff):
+            # a sparse (COO) matrix parameter
+            matrix = toC(expr)
+            xi, yi = ("%s->i[i]" % matrix, "%s->j[i]" % matrix) if transpose else \
+                ("%s->j[i]" % matrix, "%s->i[i]" % matrix)
+            yield "for(i = 0; i < %s->nnz; ++i) %s += %s->v[i] * %s;" % \
+                (matrix, element(y, yi), scaled(scale, matrix), element(x, xi))
+        elif isinstance(expr, NegateCoeff):
+            for line in self.c_apply(func, expr.arg, x, y, transpose, times(scale, ConstantCoeff(-1))):
+                yield line
+        elif isinstance(expr, TransposeCoeff):
+            for line in self.c_apply(func, expr.arg, x, y, not transpose, scale):
+                yield line
+        elif isinstance(expr, AddCoeff):
+            for line in self.c_apply(func, expr.left, x, y, transpose, scale):
+                yield line
+            for line in self.c_apply(func, expr.right, x, y, transpose, scale):
+                yield line
+        elif isinstance(expr, MulCoeff) and expr.left.isscalar:
+            for line in self.c_apply(func, expr.right, x, y, transpose, times(scale, expr.left)):
+                yield line
+        elif isinstance(expr, MulCoeff) and expr.right.isscalar:
+            for line in self.c_apply(func, expr.left, x, y, transpose, times(scale, expr.right)):
+                yield line
+        elif isinstance(expr, MulCoeff):
+            # apply the product right to left through a work vector
+            k = len(self.workspaces[func])
+            length = expr.left.shape()[1]
+            self.workspaces[func].append(length)
+            work = ("w[%d]" % k, 0, 1)
+            first, second = (expr.left, expr.right) if transpose else (expr.right, expr.left)
+            yield "for(i = 0; i < %s; ++i) w[%d][i] = 0;" % (length, k)
+            for line in self.c_apply(func, first, x, work, transpose):
+                yield line
+            for line in self.c_apply(func, second, work, y, transpose, scale):
+                yield line
+        else:
+            raise QCMLException("C operator codegen: cannot apply the coefficient %s" % expr)
+
+    def c_norm_entries(self, expr, transpose = False, scale = None):
+        """ The (count, row, column, value) C expressions of the entries of
+            `scale*expr` (or `scale*expr'`), looped over with the index `i`
+            (a count of None is a single entry); None if the entries can only
+            be found by evaluating the coefficient.
+        """
+        if expr.isscalar:
+            return (None, 0, 0, times(scale, expr) or "1")
+        elif isinstance(expr, EyeCoeff):
+            return (expr.n, "i", "i", times(scale, expr.coeff) or "1")
+        elif isinstance(expr, OnesCoeff):
+            # a column of ones, or a row of ones if (exactly one is) transposed
+            row, col = (0, "i") if expr.transpose != transpose else ("i", 0)
+            return (expr.n, row, col, times(scale, expr.coeff) or "1")
+        elif isinstance(expr, DiagonalParameterCoeff):
+            return (expr.n, "i", "i", scaled(scale, "%s[i]" % toC(expr)))
+        elif isinstance(expr, DenseParameterCoeff):
+            # a dense matrix parameter, in column major order
+            row, col = "(i %% %s)" % expr.rows, "(i / %s)" % expr.rows
+            if transpose: row, col = col, row
+            return (expr.nnz(), row, col, scaled(scale, "%s[i]" % toC(expr)))
+        elif isinstance(expr, ParameterCoeff) and expr.cols == 1:
+            # a dense vector parameter
+            row, col = (0, "i") if transpose else ("i", 0)
+            return (expr.rows, row, col, scaled(scale, "%s[i]" % toC(expr)))
+        elif isinstance(expr, NegateCoeff):
+            return self.c_norm_entries(expr.arg, transpose, times(scale, ConstantCoeff(-1)))
+        elif isinstance(expr, TransposeCoeff):
+            return self.c_norm_entries(expr.arg, not transpose, scale)
+        elif isinstance(expr, MulCoeff) and expr.left.isscalar:
+            return self.c_norm_entries(expr.right, transpose, times(scale, expr.left))
+        elif isinstance(expr, MulCoeff) and expr.right.isscalar:
+            return self.c_norm_entries(expr.left, transpose, times(scale, expr.right))
+        return None
+
+    def c_norms(self, matrix, rstart, cstart, expr, rstride):
+        """ Generates the lines adding the entries of the block `expr` of
+            `matrix` (G or A) to the norms of its rows and columns.
+        """
+        rows, cols = ("%srows" % matrix, rstart, rstride), ("%scols" % matrix, cstart, 1)
+        entries = self.c_norm_entries(expr)
+        if entries:
+            count, row, col, value = entries
+            add = "qc_add_norm(&%s, %s, inf); qc_add_norm(&%s, %s, inf);" % \
+                (element(rows, row), value, element(cols, col), value)
+            if count is None: yield add
+            else: yield "for(i = 0; i < %s; ++i) {{ %s }}" % (count, add)
+            return
+
+        # sums and products of parameters (and sparse matrix parameters, whose
+        # duplicate entries must be summed) are reduced as sparse matrices;
+        # the temporaries of prob2socp are left alone
+        saved, self.temporaries = self.temporaries, []
+        try:
+            value = self.temporary(expr)
+        finally:
+            evaluated, self.temporaries = self.temporaries, saved
+        add = "qc_add_norms(%s, %srows + %s, %s, %scols + %s, inf)" % \
+            (value, matrix, rstart, rstride, matrix, cstart)
+        if not evaluated:
+            yield "if (%s) return 1;" % add
+            return
+        yield "{{"
+        yield "%sqc_matrix *tmp[%d] = {{NULL}};" % (self.indent, len(evaluated))
+        yield "%sint failed = 0;" % self.indent
+        for name, value in evaluated:
+            yield "%sif (!failed) failed = !(%s = %s);" % (self.indent, name, value)
+        yield "%sif (!failed) failed = %s;" % (self.indent, add)
+        yield "%sfor(i = 0; i < %d; ++i) qc_spfree(tmp[i]);" % (self.indent, len(evaluated))
+        yield "%sif (failed) return 1;" % self.indent
+        yield "}}"
+
+    # generator to declare the locals of the norms and zero them
+    def c_norms_setup(self):
+        yield "long i;  /* loop index */"
+        yield ""
+        for vector, length in self.c_norm_lengths():
+            yield "for(i = 0; i < %s; ++i) %s[i] = 0;" % (length, vector)
+
+    # generator to take the square root of the 2-norms and return
+    def c_norms_return(self):
+        for vector, length in self.c_norm_lengths():
+            yield "qc_finish_norms(%s, %s, inf);" % (vector, length)
+        yield "return 0;"
+
+    def c_norm_lengths(self):
+        m, n, p = self.num_conic + self.num_lps, self.num_vars, self.num_lineqs
+        return [("Grows", m), ("Gcols", n), ("Arows", p), ("Acols", n)]
+
+    # the statement to free the work vectors and return when out of memory
+    def c_operator_fail(self, func):
+        return "{{ for(i = 0; i < %d; ++i) free(w[i]); return 1; }}" % len(self.workspaces[func])
+
+    # generator to declare the locals of the operator and zero its output
+    def c_operator_setup(self, func, output, length):
+        yield "long i;  /* loop index */"
+        if self.workspaces[func]:
+            yield "double *w[%d] = {{NULL}};  /* work vectors */" % len(self.workspaces[func])
+        yield ""
+        for k, size in enumerate(self.workspaces[func]):
+            yield "w[%d] = (double *) malloc(%s * sizeof(double));" % (k, size)
+            yield "if (!w[%d]) %s" % (k, self.c_operator_fail(func))
+        yield "for(i = 0; i < %s; ++i) %s[i] = 0;" % (length(), output)
+
+    # generator to free the work vectors of the operator
+    def c_operator_return(self, func):
+        if self.workspaces[func]:
+            yield "for(i = 0; i < %d; ++i) free(w[i]);" % len(self.workspaces[func])
+        yield "return 0;"
+
+    def functions_setup(self):
+        super(C_OperatorCodegen, self).functions_setup()
+
+        self.fA.document("sets y = A*x, where A is the matrix of the SOCP equality constraints")
+        self.fAT.document("sets x = A'*y, where A is the matrix of the SOCP equality constraints")
+        self.fG.document("sets y = G*x, where G is the matrix of the SOCP conic constraints")
+        self.fGT.document("sets x = G'*y, where G is the matrix of the SOCP conic constraints")
+
+        # the lengths are only known after visiting the problem
+        self.fA.add_lines(self.c_operator_setup('fA', 'y', lambda: self.num_lineqs))
+        self.fAT.add_lines(self.c_operator_setup('fAT', 'x', lambda: self.num_vars))
+        self.fG.add_lines(self.c_operator_setup('fG', 'y', lambda: self.num_conic + self.num_lps))
+        self.fGT.add_lines(self.c_operator_setup('fGT', 'x', lambda: self.num_vars))
+
+        self.norms.document("sets the 2-norms (or, if inf, the inf-norms) of the rows and columns of G and A")
+        self.norms.add_lines(self.c_norms_setup())
+
+    def functions_return(self):
+        super(C_OperatorCodegen, self).functions_return()
+
+        for func in ['fA', 'fAT', 'fG', 'fGT']:
+            self.code[func].add_lines(self.c_operator_return(func))
+        self.norms.add_lines(self.c_norms_return())
+
+    def stuff_operator(self, func, rstart, rend, cstart, cend, expr, rstride):
+        # in case we need to promote scalar into vector
+        n = (rend - rstart) / rstride
+        if (isinstance(n, AbstractDim) or n > 1) and expr.isscalar:
+            expr = OnesCoeff(n, ConstantCoeff(1))*expr
+        self.declare_frozen(expr)
+
+        x, y = ("x", cstart, 1), ("y", rstart, rstride)
+        self.code[func].add_lines(list(self.c_apply(func, expr, x, y)))
+        self.code[func + 'T'].add_lines(list(self.c_apply(func + 'T', expr, y, x, transpose = True)))
+        self.norms.add_lines(list(self.c_norms(func[1:], rstart, cstart, expr, rstride)))
+
+    def stuff_G(self, rstart, rend, cstart, cend, expr, rstride = 1):
+        self.stuff_operator('fG', rstart, rend, cstart, cend, expr, rstride)
+        return []
+
+    def stuff_A(self, rstart, rend, cstart, cend, expr, rstride = 1):
+        self.stuff_operator('fA', rstart, rend, cstart, cend, expr, rstride)
+        return []
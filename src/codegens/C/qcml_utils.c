@@ -1,4 +1,5 @@
 #include <stdlib.h>
+#include <math.h>
 #include "qcml_utils.h"
 
 /* free a qc_socp structure */
@@ -6,6 +7,7 @@ qc_socp *qc_socp_free(qc_socp *data)
 {
   if(data) {
     if (data->q) free(data->q);
+    if (data->qblocks) free(data->qblocks);
     if (data->Gx) free(data->Gx);
     if (data->Gp) free(data->Gp);
     if (data->Gi) free(data->Gi);
@@ -15,6 +17,9 @@ qc_socp *qc_socp_free(qc_socp *data)
     if (data->c) free(data->c);
     if (data->h) free(data->h);
     if (data->b) free(data->b);
+    if (data->x_scale) free(data->x_scale);
+    if (data->y_scale) free(data->y_scale);
+    if (data->z_scale) free(data->z_scale);
     free(data);
   }
   return NULL;
@@ -47,16 +52,16 @@ qc_matrix *qc_spalloc (long m, long n, long nnz, int triplet)
   A->m = m ;                              /* define dimensions and nzmax */
   A->n = n ;
   A->nnz = triplet ? nnz : -1 ;
-  A->j = (long *) malloc (triplet ? (nnz * sizeof(long)) : ((n+1) * sizeof(long))) ;
-  A->i = (long *) malloc (nnz * sizeof (long)) ;
+  A->j = (qc_int *) malloc (triplet ? (nnz * sizeof(qc_int)) : ((n+1) * sizeof(qc_int))) ;
+  A->i = (qc_int *) malloc (nnz * sizeof (qc_int)) ;
   A->v = (double *) malloc (nnz * sizeof (double)) ;
   return ((!A->v || !A->i || !A->j) ? qc_spfree(A) : A);
 }
 
 /* p [0..n] = cumulative sum of c [0..n-1], and then copy p [0..n-1] into c */
-void cumsum (long *p, long *c, long n)
+void cumsum (qc_int *p, qc_int *c, long n)
 {
-  /* performs a cumulative sum; may overflow if exceed long storage (4GB
+  /* performs a cumulative sum; may overflow if exceed qc_int storage (4GB
    * worth of nonzerors)
    *
    * although could write c[i] += c[i-1], we don't. the extra workspace allows
@@ -79,10 +84,11 @@ void cumsum (long *p, long *c, long n)
  */
 int remove_dup (qc_matrix *A)
 {
-  long i, j, p, q, nz = 0, n, m, *Ap, *Ai, *w ;
+  long i, j, p, q, nz = 0, n, m ;
+  qc_int *Ap, *Ai, *w ;
   double *Ax ;
   m = A->m ; n = A->n ; Ap = A->j ; Ai = A->i ; Ax = A->v ;
-  w = (long *) malloc (m * sizeof (long)) ;   /* get workspace */
+  w = (qc_int *) malloc (m * sizeof (qc_int)) ; /* get workspace */
   if (!w) return 0;                           /* out of memory */
   for (i = 0 ; i < m ; i++) w [i] = -1 ;      /* row i not yet seen */
   for (j = 0 ; j < n ; j++)
@@ -114,7 +120,8 @@ int remove_dup (qc_matrix *A)
  * removes duplicate entires as a last step */
 qc_matrix *qc_compress (const qc_matrix *T)
 {
-  long m, n, nnz, p, k, *Cp, *Ci, *w, *Ti, *Tj ;
+  long m, n, nnz, p, k ;
+  qc_int *Cp, *Ci, *w, *Ti, *Tj ;
   double *Cx, *Tx ;
   qc_matrix *C ;
   
@@ -125,7 +132,7 @@ qc_matrix *qc_compress (const qc_matrix *T)
   if (!C) return NULL;
   
   /* create temporary workspace */
-  w = (long *) calloc (n, sizeof(long));
+  w = (qc_int *) calloc (n, sizeof(qc_int));
   if (!w) {
     free(C->i);
     free(C->j);
@@ -148,3 +155,323 @@ qc_matrix *qc_compress (const qc_matrix *T)
   if (remove_dup(C)) return C;    
   return NULL;  
 }
+
+/*
+ * sparse matrix operations used to evaluate expressions of the parameters
+ * all of them return a new COO matrix; duplicate entries are summed once the
+ * matrix is compressed
+ */
+
+/* allocate a COO matrix with nnz entries (at least one, so that malloc does
+ * not return NULL for empty matrices) */
+static qc_matrix *coo_alloc (long m, long n, long nnz)
+{
+  qc_matrix *A = qc_spalloc (m, n, nnz > 0 ? nnz : 1, QC_COO) ;
+  if (A) A->nnz = nnz ;
+  return A ;
+}
+
+/* a dense m-by-n matrix (stored in column-major order) in COO form */
+qc_matrix *qc_dense2coo (const double *x, long m, long n)
+{
+  long k ;
+  qc_matrix *A = coo_alloc (m, n, m*n) ;
+  if (!A) return NULL ;
+  for (k = 0 ; k < m*n ; k++)
+  {
+    A->i [k] = k % m ; A->j [k] = k / m ; A->v [k] = x [k] ;
+  }
+  return A ;
+}
+
+/* the scaled n-by-n identity matrix a*I */
+qc_matrix *qc_speye (long n, double a)
+{
+  long k ;
+  qc_matrix *A = coo_alloc (n, n, n) ;
+  if (!A) return NULL ;
+  for (k = 0 ; k < n ; k++)
+  {
+    A->i [k] = k ; A->j [k] = k ; A->v [k] = a ;
+  }
+  return A ;
+}
+
+/* the n-by-n diagonal matrix with diagonal d */
+qc_matrix *qc_diag (const double *d, long n)
+{
+  long k ;
+  qc_matrix *A = coo_alloc (n, n, n) ;
+  if (!A) return NULL ;
+  for (k = 0 ; k < n ; k++)
+  {
+    A->i [k] = k ; A->j [k] = k ; A->v [k] = d [k] ;
+  }
+  return A ;
+}
+
+/* the scaled n-vector of ones, a*ones(n,1), or its transpose */
+qc_matrix *qc_ones (long n, double a, int transpose)
+{
+  long k ;
+  qc_matrix *A = transpose ? coo_alloc (1, n, n) : coo_alloc (n, 1, n) ;
+  if (!A) return NULL ;
+  for (k = 0 ; k < n ; k++)
+  {
+    A->i [k] = transpose ? 0 : k ; A->j [k] = transpose ? k : 0 ;
+    A->v [k] = a ;
+  }
+  return A ;
+}
+
+/* a copy of the COO matrix A scaled by a */
+qc_matrix *qc_scale (const qc_matrix *A, double a)
+{
+  long k ;
+  qc_matrix *C = coo_alloc (A->m, A->n, A->nnz) ;
+  if (!C) return NULL ;
+  for (k = 0 ; k < A->nnz ; k++)
+  {
+    C->i [k] = A->i [k] ; C->j [k] = A->j [k] ; C->v [k] = a * A->v [k] ;
+  }
+  return C ;
+}
+
+/* the transpose of the COO matrix A */
+qc_matrix *qc_transpose (const qc_matrix *A)
+{
+  long k ;
+  qc_matrix *C = coo_alloc (A->n, A->m, A->nnz) ;
+  if (!C) return NULL ;
+  for (k = 0 ; k < A->nnz ; k++)
+  {
+    C->i [k] = A->j [k] ; C->j [k] = A->i [k] ; C->v [k] = A->v [k] ;
+  }
+  return C ;
+}
+
+/* the sum of the COO matrices A and B (of the same size); the entries of B
+ * are appended to the entries of A */
+qc_matrix *qc_add (const qc_matrix *A, const qc_matrix *B)
+{
+  long k ;
+  qc_matrix *C = coo_alloc (A->m, A->n, A->nnz + B->nnz) ;
+  if (!C) return NULL ;
+  for (k = 0 ; k < A->nnz ; k++)
+  {
+    C->i [k] = A->i [k] ; C->j [k] = A->j [k] ; C->v [k] = A->v [k] ;
+  }
+  for (k = 0 ; k < B->nnz ; k++)
+  {
+    C->i [A->nnz + k] = B->i [k] ; C->j [A->nnz + k] = B->j [k] ;
+    C->v [A->nnz + k] = B->v [k] ;
+  }
+  return C ;
+}
+
+/* the product of the COO matrices A and B; both are compressed and the
+ * product is formed column by column (the sparsity pattern is computed in a
+ * first pass, so the result is allocated exactly) */
+qc_matrix *qc_multiply (const qc_matrix *A, const qc_matrix *B)
+{
+  long i, j, k, p, q, start, nnz = 0 ;
+  long *mark = NULL ;
+  double *x = NULL ;
+  qc_matrix *Ac, *Bc, *C = NULL ;
+
+  Ac = qc_compress (A) ;
+  Bc = qc_compress (B) ;
+  mark = (long *) malloc ((A->m > 0 ? A->m : 1) * sizeof (long)) ;
+  x = (double *) malloc ((A->m > 0 ? A->m : 1) * sizeof (double)) ;
+  if (!Ac || !Bc || !mark || !x) goto done ;
+
+  /* count the nonzeros of C */
+  for (i = 0 ; i < A->m ; i++) mark [i] = -1 ;
+  for (j = 0 ; j < B->n ; j++)
+  {
+    for (p = Bc->j [j] ; p < Bc->j [j+1] ; p++)
+    {
+      k = Bc->i [p] ;
+      for (q = Ac->j [k] ; q < Ac->j [k+1] ; q++)
+      {
+        i = Ac->i [q] ;
+        if (mark [i] != j) { mark [i] = j ; nnz++ ; }
+      }
+    }
+  }
+
+  C = coo_alloc (A->m, B->n, nnz) ;
+  if (!C) goto done ;
+
+  /* compute the values of C */
+  nnz = 0 ;
+  for (i = 0 ; i < A->m ; i++) mark [i] = -1 ;
+  for (j = 0 ; j < B->n ; j++)
+  {
+    start = nnz ;
+    for (p = Bc->j [j] ; p < Bc->j [j+1] ; p++)
+    {
+      k = Bc->i [p] ;
+      for (q = Ac->j [k] ; q < Ac->j [k+1] ; q++)
+      {
+        i = Ac->i [q] ;
+        if (mark [i] != j)
+        {
+          mark [i] = j ;
+          C->i [nnz] = i ; C->j [nnz++] = j ;
+          x [i] = Ac->v [q] * Bc->v [p] ;
+        }
+        else x [i] += Ac->v [q] * Bc->v [p] ;
+      }
+    }
+    for (p = start ; p < nnz ; p++) C->v [p] = x [C->i [p]] ;
+  }
+
+done:
+  qc_spfree (Ac) ;
+  qc_spfree (Bc) ;
+  if (mark) free (mark) ;
+  if (x) free (x) ;
+  return C ;
+}
+
+
+/*
+ * Ruiz equilibration of the SOCP data
+ */
+
+/* allocate n doubles set to one (at least one, so that malloc does not
+ * return NULL for empty vectors) */
+static double *ones_alloc (long n)
+{
+  long k ;
+  double *x = (double *) malloc ((n > 0 ? n : 1) * sizeof (double)) ;
+  if (!x) return NULL ;
+  for (k = 0 ; k < n ; k++) x [k] = 1 ;
+  return x ;
+}
+
+/* the largest magnitude of each row and col of the CSC matrix (p, i, x) */
+static void max_abs (const qc_int *p, const qc_int *i, const double *x, long n,
+  double *rows, double *cols)
+{
+  long j, k ;
+  double a ;
+  if (!p) return ;
+  for (j = 0 ; j < n ; j++)
+  {
+    for (k = p [j] ; k < p [j+1] ; k++)
+    {
+      a = fabs (x [k]) ;
+      if (a > rows [i [k]]) rows [i [k]] = a ;
+      if (a > cols [j]) cols [j] = a ;
+    }
+  }
+}
+
+/* scale the rows and cols of the CSC matrix (p, i, x) */
+static void scale_csc (const qc_int *p, const qc_int *i, double *x, long n,
+  const double *rows, const double *cols)
+{
+  long j, k ;
+  if (!p) return ;
+  for (j = 0 ; j < n ; j++)
+  {
+    for (k = p [j] ; k < p [j+1] ; k++) x [k] *= rows [i [k]] * cols [j] ;
+  }
+}
+
+/* replace the norms v by 1/sqrt(v) (or 1 for empty rows and cols) */
+static void inv_sqrt (double *v, long n)
+{
+  long k ;
+  for (k = 0 ; k < n ; k++) v [k] = v [k] > 0 ? 1 / sqrt (v [k]) : 1 ;
+}
+
+qc_socp *qc_equilibrate (qc_socp *data, long iters)
+{
+  long it, k, t, start ;
+  double *e, *f, *d, a ;
+  if (!data) return NULL ;
+  data->x_scale = ones_alloc (data->n) ;
+  data->y_scale = ones_alloc (data->p) ;
+  data->z_scale = ones_alloc (data->m) ;
+  e = ones_alloc (data->m) ;
+  f = ones_alloc (data->p) ;
+  d = ones_alloc (data->n) ;
+  if (!data->x_scale || !data->y_scale || !data->z_scale || !e || !f || !d)
+  {
+    free (e) ; free (f) ; free (d) ;
+    return NULL ;
+  }
+  for (it = 0 ; it < iters ; it++)
+  {
+    for (k = 0 ; k < data->m ; k++) e [k] = 0 ;
+    for (k = 0 ; k < data->p ; k++) f [k] = 0 ;
+    for (k = 0 ; k < data->n ; k++) d [k] = 0 ;
+    max_abs (data->Gp, data->Gi, data->Gx, data->n, e, d) ;
+    max_abs (data->Ap, data->Ai, data->Ax, data->n, f, d) ;
+    /* the same scaling for all rows of a second-order cone */
+    start = data->l ;
+    for (k = 0 ; k < data->nsoc ; k++)
+    {
+      a = 0 ;
+      for (t = start ; t < start + data->q [k] ; t++) if (e [t] > a) a = e [t] ;
+      for (t = start ; t < start + data->q [k] ; t++) e [t] = a ;
+      start += data->q [k] ;
+    }
+    inv_sqrt (e, data->m) ;
+    inv_sqrt (f, data->p) ;
+    inv_sqrt (d, data->n) ;
+    scale_csc (data->Gp, data->Gi, data->Gx, data->n, e, d) ;
+    scale_csc (data->Ap, data->Ai, data->Ax, data->n, f, d) ;
+    for (k = 0 ; k < data->m ; k++) data->z_scale [k] *= e [k] ;
+    for (k = 0 ; k < data->p ; k++) data->y_scale [k] *= f [k] ;
+    for (k = 0 ; k < data->n ; k++) data->x_scale [k] *= d [k] ;
+  }
+  for (k = 0 ; k < data->n ; k++) data->c [k] *= data->x_scale [k] ;
+  for (k = 0 ; k < data->m ; k++) data->h [k] *= data->z_scale [k] ;
+  for (k = 0 ; k < data->p ; k++) data->b [k] *= data->y_scale [k] ;
+  free (e) ; free (f) ; free (d) ;
+  return data ;
+}
+
+void qc_unscale (const qc_socp *data, double *x, double *y, double *z)
+{
+  long k ;
+  if (!data->x_scale) return ;
+  if (x) for (k = 0 ; k < data->n ; k++) x [k] *= data->x_scale [k] ;
+  if (y) for (k = 0 ; k < data->p ; k++) y [k] *= data->y_scale [k] ;
+  if (z) for (k = 0 ; k < data->m ; k++) z [k] *= data->z_scale [k] ;
+}
+
+void qc_add_norm (double *norm, double v, int inf)
+{
+  if (inf) { if (fabs (v) > *norm) *norm = fabs (v) ; }
+  else *norm += v * v ;
+}
+
+int qc_add_norms (const qc_matrix *A, double *rows, long stride, double *cols, int inf)
+{
+  long j, p ;
+  qc_matrix *C ;
+  if (A->nnz == 0) return 0 ;
+  C = qc_compress (A) ;   /* sums the duplicate entries */
+  if (!C) return 1 ;
+  for (j = 0 ; j < C->n ; j++)
+  {
+    for (p = C->j [j] ; p < C->j [j+1] ; p++)
+    {
+      qc_add_norm (&rows [stride * C->i [p]], C->v [p], inf) ;
+      qc_add_norm (&cols [j], C->v [p], inf) ;
+    }
+  }
+  qc_spfree (C) ;
+  return 0 ;
+}
+
+void qc_finish_norms (double *norms, long n, int inf)
+{
+  long k ;
+  if (!inf) for (k = 0 ; k < n ; k++) norms [k] = sqrt (norms [k]) ;
+}
@@ -7,9 +7,23 @@
 #ifndef __QCML_UTILS_H__
 #define __QCML_UTILS_H__
 
+#include <limits.h>
+
 #define QC_CSC 0
 #define QC_COO 1
 
+/* integer type for sparse matrix indices and cone sizes
+ * compile with -DQC_INT32 to use 32-bit indices; all code using these
+ * utilities must then be compiled with the same flag
+ */
+#ifdef QC_INT32
+typedef int qc_int;
+#define QC_INT_MAX INT_MAX
+#else
+typedef long qc_int;
+#define QC_INT_MAX LONG_MAX
+#endif
+
 #ifdef __cplusplus
 extern "C" {
 #endif
@@ -20,8 +34,8 @@ extern "C" {
  */
 typedef struct coo {
   double *v;  /* nonzero values */
-  long *i;    /* row pointer    */
-  long *j;    /* col pointer    */
+  qc_int *i;  /* row pointer    */
+  qc_int *j;  /* col pointer    */
   long nnz;   /* number of nonzeros, -1 if CSC */
   long m;     /* number of rows in the matrix  */
   long n;     /* number of cols in the matrix  */
@@ -34,16 +48,21 @@ typedef struct socp {
   long p;     /* number of equality constraints  */
   long l;     /* number of linear cones          */
   long nsoc;  /* number of second-order cones    */
-  long *q;    /* list of second-order cone sizes */
+  qc_int *q;  /* list of second-order cone sizes */
+  long nqblocks;   /* number of blocks of cones   */
+  qc_int *qblocks; /* (count, size) of each block */
   double *Gx; /* nonzero values of G (in CSC)    */
-  long *Gp;   /* column pointers of G (in CSC)   */
-  long *Gi;   /* row values of G (in CSC)        */
+  qc_int *Gp; /* column pointers of G (in CSC)   */
+  qc_int *Gi; /* row values of G (in CSC)        */
   double *Ax; /* nonzero values of A (in CSC)    */
-  long *Ap;   /* column pointers of A (in CSC)   */
-  long *Ai;   /* row values of A (in CSC)        */
+  qc_int *Ap; /* column pointers of A (in CSC)   */
+  qc_int *Ai; /* row values of A (in CSC)        */
   double *c;  /* c vector (dense)                */
   double *h;  /* h vector (dense)                */
   double *b;  /* b vector (dense)                */
+  double *x_scale; /* scaling of x, y, and z; NULL */
+  double *y_scale; /* unless the data was          */
+  double *z_scale; /* equilibrated                 */
 } qc_socp;
 
 /* free an allocated socp data struct
@@ -57,6 +76,44 @@ qc_matrix *qc_spfree(qc_matrix *A);
 /* compress a COO matrix into CSC, allocates new matrix memory */
 qc_matrix *qc_compress(const qc_matrix *T);
 
+/* sparse matrix operations for evaluating parameter expressions
+ *     each allocates and returns a new COO matrix (or NULL if out of memory)
+ *     which must be freed with qc_spfree; duplicate entries are allowed
+ */
+qc_matrix *qc_dense2coo(const double *x, long m, long n); /* column major x  */
+qc_matrix *qc_speye(long n, double a);                    /* a*I             */
+qc_matrix *qc_diag(const double *d, long n);              /* diag(d)         */
+qc_matrix *qc_ones(long n, double a, int transpose);      /* a*ones(n,1)     */
+qc_matrix *qc_scale(const qc_matrix *A, double a);        /* a*A             */
+qc_matrix *qc_transpose(const qc_matrix *A);              /* A'              */
+qc_matrix *qc_add(const qc_matrix *A, const qc_matrix *B);      /* A + B     */
+qc_matrix *qc_multiply(const qc_matrix *A, const qc_matrix *B); /* A * B     */
+
+/* equilibrate G and A with iters Ruiz iterations,
+ *     G = E*G*D, A = F*A*D, h = E*h, b = F*b, c = D*c
+ * where E is constant within each second-order cone; the diagonals D, F,
+ * and E are kept in x_scale, y_scale, and z_scale (the objective is not
+ * scaled); returns NULL if out of memory
+ */
+qc_socp *qc_equilibrate(qc_socp *data, long iters);
+
+/* undoes the scaling of an equilibrated problem on the solution x, y, and z
+ * of the solver (before recovering the variables with socp2prob)
+ */
+void qc_unscale(const qc_socp *data, double *x, double *y, double *z);
+
+/* row and column norms of blocks of G and A (used by the matrix-free
+ * operators); with inf, the inf-norms are computed, and otherwise the 2-norms,
+ * which are accumulated squared until qc_finish_norms takes their square root
+ *     qc_add_norm adds the entry v to *norm
+ *     qc_add_norms adds the entries of A (duplicates are summed) to the norms
+ *         of the rows rows[stride*i] and the columns cols[j]; returns 1 if
+ *         out of memory and 0 otherwise
+ */
+void qc_add_norm(double *norm, double v, int inf);
+int qc_add_norms(const qc_matrix *A, double *rows, long stride, double *cols, int inf);
+void qc_finish_norms(double *norms, long n, int inf);
+
 #ifdef __cplusplus
 }
 #endif
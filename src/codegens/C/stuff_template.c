@@ -2,7 +2,7 @@
 #include "%(name)s.h"
 
 /* ----------------------- BEGIN GENERATED CODE --------------------------- */
-%(prob2socp)s
+%(frozen)s%(prob2socp)s
 
-%(socp2prob)s
+%(socp2prob)s%(operators)s
 /* ------------------------ END GENERATED CODE ---------------------------- */
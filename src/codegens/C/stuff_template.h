@@ -10,6 +10,8 @@
 
 #include "qcml_utils.h"
 
+%(index_check)s
+
 #ifdef __cplusplus
 extern "C" {
 #endif
@@ -39,7 +41,7 @@ typedef struct %(name)s_vars {
 /* assigns the pointers for the variables in '%(name)s' to point to the proper
  * memory locations in the solution vector
  */
-%(socp2prob_prototype)s;
+%(socp2prob_prototype)s;%(operator_prototypes)s
 
 #ifdef __cplusplus
 }
@@ -5,6 +5,8 @@ from cvx.codegen import CVXCodegen
 from matlab.codegen import MatlabCodegen
 #from pdos import PDOSCodegen
 from C.codegen import C_Codegen
+from C.ctypes_codegen import CtypesCodegen, CtypesOperatorCodegen
+from C.operator_codegen import C_OperatorCodegen
 #from pdos_elem import PDOSElemCodegen
 from python.operator_codegen import PythonOperatorCodegen
-
+from python.qp_codegen import PythonQPCodegen
@@ -2,15 +2,29 @@ from .. ast import NodeVisitor
 from .. ast.constraints import  SOC, SOCProd, LinearConstraint
 from .. properties.shape import isscalar, isvector, ismatrix
 from .. properties.curvature import isconstant
+from .. properties.sign import ispositive, isnegative
 from .. codes import ConstantCoeff, ScalarParameterCoeff, ParameterCoeff, \
-    EyeCoeff, OnesCoeff
+    EyeCoeff, OnesCoeff, DiagonalParameterCoeff, DenseParameterCoeff
+from .. codes.coefficients.coefficient import frozen
+from .. exceptions import QCMLException
 
 from abc import ABCMeta, abstractmethod, abstractproperty
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import os
 
 CodegenVariable = namedtuple('CodegenVariable', ['start', 'length'])
 
+# integer types supported for the indices of the sparse matrices G and A
+INDEX_TYPES = ("int32", "int64")
+
+# number of Ruiz iterations used to equilibrate G and A
+RUIZ_ITERATIONS = 10
+
+# row orders of a product of cones: the rows of each cone together
+# (interleaved, as ECOS expects them), or the rows of each argument together
+# (blocked, a struct of arrays)
+CONE_LAYOUTS = ("interleaved", "blocked")
+
 def write_file(new_file, code):
     with open(new_file, 'w') as output:
         output.write(code)
@@ -48,14 +62,20 @@ class Codegen(NodeVisitor):
         These functions stuff the data into the datastructures set up in
         function_datastructures.
     """
+    # whether the code generator handles the quadratic terms kept in the
+    # objective by `canonicalize(quadratic=True)`
+    quadratic = False
+    # the row order of the products of cones; see CONE_LAYOUTS
+    cone_layout = "interleaved"
 
     def __init__(self):
         """ Walks the tree and creates the data structures.
             Creates the functions to stuff and un-stuff the matrices.
         """
-        self.primal_vars = {}      # primal variables
-        self.dual_conic_vars = {}       # dual variables (ECOS' z variable)
-        self.dual_equality_vars = {}    # dual variables (ECOS' y variable)
+        # (ordered, so the generated code does not depend on string hashes)
+        self.primal_vars = OrderedDict()        # primal variables
+        self.dual_conic_vars = OrderedDict()    # dual variables (ECOS' z variable)
+        self.dual_equality_vars = OrderedDict() # dual variables (ECOS' y variable)
         self.num_vars = 0
         self.expr_stack = []
         self.num_lineqs = 0
@@ -64,6 +84,11 @@ class Codegen(NodeVisitor):
         self.cone_list = []
         self.objective_offset = 0
         self.objective_multiplier = 1
+        # compile-time upper bounds on the nonzeros of G and A, in terms of
+        # the abstract dims and the nonzeros of the sparse parameters
+        self.nnz_bounds = {'G': 0, 'A': 0}
+        # values of the parameters frozen at codegen time; see `freeze`
+        self.frozen_params = {}
         self._code = {} # Could use ordereddict, but that's Python >= 2.7
         self._codekeyorder = None
         super(Codegen, self).__init__()
@@ -131,6 +156,47 @@ class Codegen(NodeVisitor):
         """
         return "%s" % ad
 
+    def count_nnz(self, matrix, row_start, row_end, expr, row_stride = 1):
+        """ Adds the nonzeros of the block `expr` to the bound on the nonzeros
+            of `matrix` ('G' or 'A'); a scalar is promoted to a column with
+            one entry in every `row_stride` rows.
+        """
+        if expr.isscalar:
+            self.nnz_bounds[matrix] += (row_end - row_start + row_stride - 1) / row_stride
+        else:
+            self.nnz_bounds[matrix] += expr.nnz_bound()
+
+    def freeze(self, params):
+        """ Freezes the parameters in the dict `params` to the given values,
+            which must be set before visiting the problem.
+
+            A frozen parameter is a constant in the generated code; it is no
+            longer an input of prob2socp, and the parts of G, A, c, h, and b
+            that only involve frozen parameters are evaluated at codegen time.
+        """
+        self.frozen_params = dict(params)
+
+    @property
+    def parameters(self):
+        """ The parameters (name and node) that are inputs of the generated
+            code, i.e., those that are not frozen.
+        """
+        return OrderedDict((k, v) for k, v in self.program.parameters.iteritems()
+            if k not in self.frozen_params)
+
+    def cone_blocks(self):
+        """ The second-order cones as a list of (count, size) blocks of
+            consecutive cones of the same size, e.g., [(1, 4), (n, 3)]. In
+            the blocked layout, each block is one product of cones.
+        """
+        blocks = []
+        for num, size in self.cone_list:
+            if blocks and blocks[-1][1] == size and self.cone_layout == "interleaved":
+                blocks[-1] = (blocks[-1][0] + num, size)
+            else:
+                blocks.append((num, size))
+        return blocks
+
     def handle_constant_offset_in_objective(self, constant_expr):
         pass
 
@@ -173,8 +239,9 @@ class Codegen(NodeVisitor):
     def printshapes(self, program_node):
         # for function documentation
         return (
-            "  '%s' has shape %s" % (v, v.shape)
-            for v in program_node.parameters.values()
+            "  '%s' has shape %s%s" % (v, v.shape, " (%s)" % v.structure if v.structure else "")
+            for k, v in program_node.parameters.iteritems()
+            if k not in self.frozen_params
         )
 
     @property
@@ -197,20 +264,33 @@ class Codegen(NodeVisitor):
                 and dims (do not need to also have access to problem)
         """
         self.program = node
+        if node.quadratic and not self.quadratic:
+            raise QCMLException("%s: Cannot generate code for a quadratic objective; canonicalize without `quadratic` or use the \"qp\" code generator." % self.__class__.__name__)
         # keep track of original variables
        # self.orig_varnames = set(node.variables.keys())
 
         # create variable ordering
         # XXX: at this moment, assumes that variables are vectors (not arrays)
-        self.primal_vars = {
-            name: self._make_codegen_variable(variable_obj) \
+        # in declaration order, followed by the variables introduced by
+        # canonicalization in the order they were created
+        self.primal_vars = OrderedDict(
+            (name, self._make_codegen_variable(variable_obj))
             for name, variable_obj in node.variables.iteritems()
-        }
+            if name not in node.eliminated
+        )
 
-        self.primal_vars.update({
-            name: self._make_codegen_variable(variable_obj) \
+        self.primal_vars.update(
+            (name, self._make_codegen_variable(variable_obj))
             for name, variable_obj in node.new_variables.iteritems()
-        })
+        )
+
+        # the variables eliminated by the presolve are recovered from the
+        # variables they alias
+        self.primal_vars.update(
+            (name, self.primal_vars[node.eliminated[name].value])
+            for name in node.variables
+            if name in node.eliminated
+        )
 
         # set up the functions we want to write
         self.functions_setup()
@@ -226,15 +306,43 @@ class Codegen(NodeVisitor):
         n = self.primal_vars[k].length
 
         if n == 1:
-            lineq = {k: ConstantCoeff(1)}
+            lineq = OrderedDict([(k, ConstantCoeff(1))])
         else:
-            lineq = {k: EyeCoeff(n, ConstantCoeff(1))}
+            lineq = OrderedDict([(k, EyeCoeff(n, ConstantCoeff(1)))])
 
         self.expr_stack.append(lineq)
 
+    def frozen_coeff(self, node):
+        """ The coefficient for the frozen parameter `node`.
+        """
+        import numpy as np
+        import scipy.sparse as sp
+        value = self.frozen_params[node.value]
+        if any(not x.concrete for x in node.shape.dimensions):
+            raise QCMLException("QCML codegen: the dimensions of the frozen parameter '%s' must be set" % node.value)
+        rows, cols = int(node.shape.row), int(node.shape.col)
+
+        if sp.issparse(value): matrix = value
+        else: matrix = np.array(value, dtype=float, ndmin=1)
+        if node.structure == 'diagonal':
+            matrix = sp.diags(np.asarray(matrix.todense() if sp.issparse(matrix) else matrix).ravel(), 0)
+        elif cols == 1 and not sp.issparse(matrix):
+            matrix = matrix.reshape((-1, 1))
+        if matrix.shape != (rows, cols):
+            raise QCMLException("QCML codegen: the frozen parameter '%s' should have shape %s, not %s" % \
+                (node.value, (rows, cols), matrix.shape))
+        entries = matrix.data if sp.issparse(matrix) else matrix
+        if not np.all(np.isfinite(entries)):
+            raise QCMLException("QCML codegen: the frozen parameter '%s' is not finite" % node.value)
+        if (ispositive(node) and np.any(entries < 0)) or (isnegative(node) and np.any(entries > 0)):
+            raise QCMLException("QCML codegen: the frozen parameter '%s' has the wrong sign" % node.value)
+        return frozen(matrix, node.value)
+
     def visit_Parameter(self, node):
-        if isscalar(node):
-            self.expr_stack.append({'1':ScalarParameterCoeff(node.value)})
+        if node.value in self.frozen_params:
+            self.expr_stack.append(OrderedDict([('1', self.frozen_coeff(node))]))
+        elif isscalar(node):
+            self.expr_stack.append(OrderedDict([('1', ScalarParameterCoeff(node.value))]))
         # elif isvector(node):
         #     self.expr_stack.append({'1':VectorParameterCoeff(node.value)})
         else:
@@ -246,10 +354,16 @@ class Codegen(NodeVisitor):
                     dims.append(x)
 
             shape = (dims[0], 1) if isvector(node) else dims
-            self.expr_stack.append({'1':ParameterCoeff(node.value, shape)})
+            if node.structure == 'diagonal':
+                coeff = DiagonalParameterCoeff(node.value, dims[0])
+            elif node.structure == 'dense':
+                coeff = DenseParameterCoeff(node.value, shape)
+            else:
+                coeff = ParameterCoeff(node.value, shape)
+            self.expr_stack.append(OrderedDict([('1', coeff)]))
 
     def visit_Number(self, node):
-        self.expr_stack.append({'1':ConstantCoeff(node.value)})
+        self.expr_stack.append(OrderedDict([('1', ConstantCoeff(node.value))]))
 
     def visit_Transpose(self, node):
         self.generic_visit(node)
@@ -364,9 +478,11 @@ class Codegen(NodeVisitor):
                 xstart, xlength = self.primal_vars[k]
                 xend = xstart + xlength
                 if node.op == '==':
+                    self.count_nnz('A', start, self.num_lineqs, v)
                     A_string = self.stuff_A(start, self.num_lineqs, xstart, xend, v)
                     self.prob2socp.add_lines(A_string)
                 else:
+                    self.count_nnz('G', start, self.num_lps, v)
                     G_string = self.stuff_G(start, self.num_lps, xstart, xend, v)
                     self.prob2socp.add_lines(G_string)
 
@@ -409,6 +525,7 @@ class Codegen(NodeVisitor):
                 else:
                     xstart, xlength = self.primal_vars[k]
                     xend = xstart + xlength
+                    self.count_nnz('G', conestart, coneend, v)
                     self.prob2socp.add_lines(self.stuff_G(conestart, coneend, xstart, xend, -v))
 
         self.prob2socp.newline()
@@ -421,9 +538,10 @@ class Codegen(NodeVisitor):
         # we assume linear constraints have already been handled
         start = self.num_lps + self.num_conic
         stride = node.nargs + 1
-        self.num_conic += stride * node.shape.size(abstractdim_rewriter=self.abstractdim_rewriter)
+        num = node.shape.size(abstractdim_rewriter=self.abstractdim_rewriter)
+        self.num_conic += stride * num
 
-        self.cone_list.append( (node.shape.size(abstractdim_rewriter=self.abstractdim_rewriter), str(node.nargs + 1)) )
+        self.cone_list.append( (num, str(node.nargs + 1)) )
 
         self.generic_visit(node)
 
@@ -433,15 +551,22 @@ class Codegen(NodeVisitor):
 
         while self.expr_stack:
             e = self.expr_stack.pop()
-            conestart = start + count
+            if self.cone_layout == "blocked":
+                # the rows of the argument are contiguous
+                conestart = start + count * num
+                rows = (conestart, conestart + num, 1)
+            else:
+                conestart = start + count
+                rows = (conestart, coneend, stride)
             count -= 1
             for k,v in e.iteritems():
                 if k == '1':
-                    self.prob2socp.add_lines(self.stuff_h(conestart, coneend, v, stride))
+                    self.prob2socp.add_lines(self.stuff_h(rows[0], rows[1], v, rows[2]))
                 else:
                     xstart, xlength = self.primal_vars[k]
                     xend = xstart + xlength
-                    self.prob2socp.add_lines(self.stuff_G(conestart, coneend, xstart, xend, -v, stride))
+                    self.count_nnz('G', rows[0], rows[1], v, rows[2])
+                    self.prob2socp.add_lines(self.stuff_G(rows[0], rows[1], xstart, xend, -v, rows[2]))
 
         self.prob2socp.newline()
         assert (not self.expr_stack), "Expected empty expression stack but still has %s left" % self.expr_stack
@@ -145,8 +145,10 @@ class OperatorCodegen(Codegen):
                 xstart, xlength = self.primal_vars[k]
                 xend = xstart + xlength
                 if node.op == '==':
+                    self.count_nnz('A', start, self.num_lineqs, v)
                     self.stuff_A(start, self.num_lineqs, xstart, xend, v)
                 else:
+                    self.count_nnz('G', start, self.num_lps, v)
                     self.stuff_G(start, self.num_lps, xstart, xend, v)
 
         self.prob2socp.newline()
@@ -191,6 +193,7 @@ class OperatorCodegen(Codegen):
                 else:
                     xstart, xlength = self.primal_vars[k]
                     xend = xstart + xlength
+                    self.count_nnz('G', conestart, coneend, v)
                     self.stuff_G(conestart, coneend, xstart, xend, -v)
 
         self.prob2socp.newline()
@@ -226,6 +229,7 @@ class OperatorCodegen(Codegen):
                 else:
                     xstart, xlength = self.primal_vars[k]
                     xend = xstart + xlength
+                    self.count_nnz('G', conestart, coneend, v, stride)
                     self.stuff_G(conestart, coneend, xstart, xend, -v, stride)
 
         self.prob2socp.newline()
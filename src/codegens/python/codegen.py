@@ -1,8 +1,11 @@
-from .. base_codegen import Codegen
+from .. base_codegen import Codegen, INDEX_TYPES, CONE_LAYOUTS, RUIZ_ITERATIONS
 from ... codes import OnesCoeff, ConstantCoeff
+from ... codes.coefficients.coefficient import parameters
 from ... codes.function import PythonFunction
 from ... codes.encoders import toPython
+from ... codes.encoders.python_encoder import assignment
 from ... properties.abstract_dim import AbstractDim
+from ... exceptions import QCMLException
 
 # for testing
 from ... mixins import SSALikeMixin, SmithFormMixin
@@ -12,14 +15,101 @@ def wrap_self(f):
         return f(*args, **kwargs)
     return wrapped_code
 
+# generator for the `cached` helper of prob_to_socp: when the caller passes a
+# dict as `cache`, a conversion is only redone if the parameters it reads are
+# not the ones it was last done with. Numbers are compared by value, and arrays
+# by identity and by a fingerprint of their shape, dtype, and a hash of all of
+# their entries (and of the indices of a sparse matrix), so that changes made
+# in place are noticed too; hashing the buffer is far cheaper than the
+# conversion it saves. The dict holds at most one entry per conversion in the
+# problem, (names of the parameters, parameters, fingerprints, value), which
+# is replaced when the conversion is redone, so its size is bounded by the
+# problem and not by the number of calls; see `invalidate`
+def python_cache():
+    yield "def fingerprint(a):"
+    yield "    if np.isscalar(a): return a"
+    yield "    if sp.issparse(a):"
+    yield "        fields = ('data', 'indices', 'indptr', 'row', 'col', 'offsets')"
+    yield "        return (a.format, a.shape, a.nnz) + tuple(fingerprint(getattr(a, f)) for f in fields if hasattr(a, f))"
+    yield "    a = np.ascontiguousarray(a)"
+    yield "    return (a.shape, a.dtype.str, hash(a.tostring()))"
+    yield ""
+    yield "def cached(key, names, args, convert):"
+    yield "    if cache is None: return convert()"
+    yield "    prints = tuple(fingerprint(a) for a in args)"
+    yield "    if key in cache:"
+    yield "        _, old, old_prints, value = cache[key]"
+    yield "        if all(a is b or (np.isscalar(a) and np.isscalar(b) and a == b) for a, b in zip(old, args)) \\"
+    yield "                and old_prints == prints:"
+    yield "            return value"
+    yield "    value = convert()"
+    yield "    cache[key] = (names, args, prints, value)"
+    yield "    return value"
+    yield ""
+
+def invalidate(cache, name):
+    """ Drops the conversions of the parameter `name` from the `cache` dict
+        passed to prob_to_socp, so that they are redone on the next call.
+
+        The cache already notices parameters modified in place (it hashes
+        their entries on every call); this frees the memory held by the
+        conversions of a parameter that is no longer used.
+    """
+    for key in [key for key, entry in cache.items() if name in entry[0]]:
+        del cache[key]
+
+# generator for the `concatenate` helper of prob_to_socp, which copies the
+# index or value blocks of G or A into one array, allocated to the total number
+# of nonzeros up front (instead of growing it as the blocks are read)
+def python_concatenate():
+    yield "def concatenate(sizes, blocks, dtype):"
+    yield "    result = np.empty((sum(sizes),), dtype=dtype)"
+    yield "    k = 0"
+    yield "    for size, block in zip(sizes, blocks):"
+    yield "        if isinstance(block, np.ndarray): result[k:k+size] = block"
+    yield "        else: result[k:k+size] = np.fromiter(block, dtype=dtype, count=size)"
+    yield "        k += size"
+    yield "    return result"
+
+def cached(key, names, value):
+    """ The python expression for `value`, which reads the parameters `names`,
+        looked up in the cache under `key`.
+    """
+    args = ''.join("params['%s'], " % name for name in names)
+    return "cached(%r, %r, (%s), lambda: %s)" % ("%s: %s" % (key, value), tuple(names), args, value)
+
 class PythonCodegen(Codegen):
-    def __init__(self):
+    def __init__(self, index_type = "int64", equilibrate = False, cone_layout = "interleaved"):
         super(PythonCodegen, self).__init__()
+        # the integer type of the sparse matrix indices
+        if index_type not in INDEX_TYPES:
+            raise QCMLException("Python codegen: index_type must be one of %s" % (INDEX_TYPES,))
+        self.index_type = index_type
+
+        # the row order of the products of cones; in the blocked layout, the
+        # cones are only described by their blocks, 'q_blocks', since the
+        # rows of a cone are not contiguous
+        if cone_layout not in CONE_LAYOUTS:
+            raise QCMLException("Python codegen: cone_layout must be one of %s" % (CONE_LAYOUTS,))
+        if cone_layout == "blocked" and equilibrate:
+            raise QCMLException("Python codegen: Cannot equilibrate the blocked cone layout.")
+        self.cone_layout = cone_layout
+
+        # scale the rows and columns of G and A (Ruiz equilibration); the
+        # scale factors are returned in 'scaling' by prob_to_socp and undone
+        # by socp_to_prob
+        self.equilibrate = equilibrate
+        recover_args = ['x', 'y', 'z', 'dims={}'] + (['scaling=None'] if equilibrate else [])
+
         self._code = {
-            'prob2socp': PythonFunction('prob_to_socp', ['params', 'dims={}']),
-            'socp2prob': PythonFunction('socp_to_prob', ['x', 'y', 'z', 'dims={}']),
+            'prob2socp': PythonFunction('prob_to_socp', ['params', 'dims={}', 'cache=None']),
+            'socp2prob': PythonFunction('socp_to_prob', recover_args),
+            'norms': PythonFunction('socp_norms', ['data', 'ord=2']),
         }
-        self._codekeyorder = ['prob2socp', 'socp2prob']
+        self._codekeyorder = ['prob2socp', 'socp2prob', 'norms']
+
+        # number of conversions of parameters into sparse matrices
+        self.conversions = 0
 
     @property
     def prob2socp(self):
@@ -29,6 +119,10 @@ class PythonCodegen(Codegen):
     def socp2prob(self):
         return self.code['socp2prob']
 
+    @property
+    def socp_norms(self):
+        return self.code['norms']
+
     @property
     def extension(self):
         return ".py"
@@ -40,18 +134,24 @@ class PythonCodegen(Codegen):
     def python_dimensions(self):
         yield "p, m, n = %s, %s, %s" % (self.num_lineqs, self.num_conic + self.num_lps, self.num_vars)
 
-    # function to get cone dimensions
+    # function to get cone dimensions; the (count, size) blocks of cones are
+    # given without expanding them into one size per cone in 'q_blocks'
     def python_cone_sizes(self):
+        blocks = "[%s]" % ', '.join("(%s, %s)" % block for block in self.cone_blocks())
+        if self.cone_layout == "blocked":
+            yield "cones = {'l': %s, 'q_blocks': %s, 's': [], 'layout': 'blocked'}" % (self.num_lps, blocks)
+            return
+
         def cone_tuple_to_str(x):
             num, sz = x
             if num == 1: return "[%s]" % sz
             else: return "%s*[%s]" % (num, sz)
         cone_list_str = '[]'
         if self.cone_list:
-            cone_list_str = map(cone_tuple_to_str, self.cone_list)
+            cone_list_str = map(cone_tuple_to_str, self.cone_blocks())
             cone_list_str = '+'.join(cone_list_str)
 
-        yield "cones = {'l': %s, 'q': %s, 's': []}" % (self.num_lps, cone_list_str)
+        yield "cones = {'l': %s, 'q': %s, 'q_blocks': %s, 's': []}" % (self.num_lps, cone_list_str, blocks)
 
     def python_recover(self):
         for k in self.program.variables.keys():
@@ -69,12 +169,19 @@ class PythonCodegen(Codegen):
         self.prob2socp.document("maps 'params' into a dictionary of SOCP matrices")
         self.prob2socp.document("'params' ought to contain:")
         self.prob2socp.document(self.printshapes(self.program))
+        self.prob2socp.document("if 'cache' is a dict, the sparse matrices made from the parameters are")
+        self.prob2socp.document("kept in it and reused while the parameters are unchanged (their entries are")
+        self.prob2socp.document("hashed on each call, so changes made in place are noticed)")
 
         # now import cvxopt and itertools
         self.prob2socp.add_lines("import numpy as np")
         self.prob2socp.add_lines("import scipy.sparse as sp")
         self.prob2socp.add_lines("import itertools")
         self.prob2socp.newline()
+        # the parameters are replaced by their sparse matrices, so work on a
+        # copy of the caller's dict
+        self.prob2socp.add_lines("params = dict(params)")
+        self.prob2socp.add_lines(line for line in python_cache() if self.conversions)
         # self.prob2socp.add_comment("convert possible numpy parameters to cvxopt matrices")
         # self.prob2socp.add_lines("from qcml.helpers import convert_to_cvxopt")
         # self.prob2socp.add_lines("params = convert_to_cvxopt(params)")
@@ -85,30 +192,101 @@ class PythonCodegen(Codegen):
         self.prob2socp.add_lines("c = np.zeros((n,))")
         self.prob2socp.add_lines("h = np.zeros((m,))")
         self.prob2socp.add_lines("b = np.zeros((p,))")
-        self.prob2socp.add_lines("Gi, Gj, Gv = [], [], []")
-        self.prob2socp.add_lines("Ai, Aj, Av = [], [], []")
+        self.prob2socp.add_lines("Gnnz, Gi, Gj, Gv = [], [], [], []")
+        self.prob2socp.add_lines("Annz, Ai, Aj, Av = [], [], [], []")
         self.prob2socp.add_lines(self.python_cone_sizes())
 
     def functions_return(self):
         # TODO: what to do when m, n, or p is 0?
         # it "just worked" with CVXOPT, but not with scipy/numpy anymore...
-        self.prob2socp.add_comment("construct index and value lists for G and A")
-        self.prob2socp.add_lines("Gi = np.fromiter(itertools.chain.from_iterable(Gi), dtype=np.int)")
-        self.prob2socp.add_lines("Gj = np.fromiter(itertools.chain.from_iterable(Gj), dtype=np.int)")
-        self.prob2socp.add_lines("Gv = np.fromiter(itertools.chain.from_iterable(Gv), dtype=np.double)")
-        self.prob2socp.add_lines("Ai = np.fromiter(itertools.chain.from_iterable(Ai), dtype=np.int)")
-        self.prob2socp.add_lines("Aj = np.fromiter(itertools.chain.from_iterable(Aj), dtype=np.int)")
-        self.prob2socp.add_lines("Av = np.fromiter(itertools.chain.from_iterable(Av), dtype=np.double)")
-        self.prob2socp.add_lines("if m > 0: G = sp.csc_matrix((Gv, np.vstack((Gi, Gj))), (m,n))")
+        self.prob2socp.add_comment("construct index and value arrays for G and A")
+        self.prob2socp.add_lines(python_concatenate())
+        if self.index_type == "int32":
+            # (before the indices are cast, which would wrap them silently)
+            self.prob2socp.add_comment("check that the dimensions and nonzeros fit in the index type")
+            self.prob2socp.add_lines("if max(m, n, p, sum(Gnnz), sum(Annz)) > np.iinfo(np.int32).max:")
+            self.prob2socp.add_lines("    raise OverflowError('SOCP data is too large for 32-bit indices')")
+        for mat in ['G', 'A']:
+            self.prob2socp.add_lines("%si = concatenate(%snnz, %si, dtype=np.%s)" % (mat, mat, mat, self.index_type))
+            self.prob2socp.add_lines("%sj = concatenate(%snnz, %sj, dtype=np.%s)" % (mat, mat, mat, self.index_type))
+            self.prob2socp.add_lines("%sv = concatenate(%snnz, %sv, dtype=np.double)" % (mat, mat, mat))
+        self.prob2socp.add_lines("if m > 0: G = sp.coo_matrix((Gv, (Gi, Gj)), (m,n)).tocsc()")
         self.prob2socp.add_lines("else: G, h = None, None")
-        self.prob2socp.add_lines("if p > 0: A = sp.csc_matrix((Av, np.vstack((Ai, Aj))), (p,n))")
+        self.prob2socp.add_lines("if p > 0: A = sp.coo_matrix((Av, (Ai, Aj)), (p,n)).tocsc()")
         self.prob2socp.add_lines("else: A, b = None, None")
-        self.prob2socp.add_lines("return {'c': c, 'G': G, 'h': h, 'A': A, 'b': b, 'dims': cones}")
+        if self.equilibrate:
+            self.prob2socp.add_comment("equilibrate G and A (equal scaling within each second-order cone)")
+            self.prob2socp.add_lines(self.python_equilibrate())
+        self.prob2socp.add_lines(self.python_index_arrays(['G', 'A']))
+        if self.equilibrate:
+            self.prob2socp.add_lines("return {'c': c, 'G': G, 'h': h, 'A': A, 'b': b, 'dims': cones, 'scaling': scaling}")
+        else:
+            self.prob2socp.add_lines("return {'c': c, 'G': G, 'h': h, 'A': A, 'b': b, 'dims': cones}")
 
         self.socp2prob.document("recovers the problem variables from the solver variable 'x' and dual variables 'y' (equality constraints) and 'z' (conic constraints)")
+        if self.equilibrate:
+            self.socp2prob.document("if given, 'scaling' (from prob_to_socp) is undone first")
+            self.socp2prob.add_lines("if scaling is not None:")
+            self.socp2prob.add_lines("    x, y, z = [v if v is None else s * v for (s, v) in zip((scaling['x'], scaling['y'], scaling['z']), (x, y, z))]")
         # recover the old variables
         self.socp2prob.add_lines("return {%s}" % ', '.join(self.python_recover()))
 
+        self.socp_norms.document("computes the ord-norms (2 or np.inf) of the rows and columns of G and A")
+        self.socp_norms.document("returns a dictionary of (row norms, column norms) for 'G' and 'A'")
+        self.socp_norms.add_lines(self.python_norms())
+
+    # generator to cast the index arrays of the CSC matrices `mats` to the
+    # index type (scipy picks its own when converting to CSC)
+    def python_index_arrays(self, mats):
+        yield "# the indices of the CSC matrices have the index type"
+        for mat in mats:
+            yield "if %s is not None: %s.indices, %s.indptr = %s.indices.astype(np.%s), %s.indptr.astype(np.%s)" % \
+                (mat, mat, mat, mat, self.index_type, mat, self.index_type)
+
+    # generator for the Ruiz equilibration of the stuffed G and A
+    #   G = E*G*D, A = F*A*D, h = E*h, b = F*b, and c = D*c
+    # so the primal and dual solutions are x = D*x, y = F*y, and z = E*z;
+    # the objective is unchanged
+    def python_equilibrate(self):
+        yield "D, E, F = np.ones((n,)), np.ones((m,)), np.ones((p,))"
+        yield "# the cone of each row of G (each linear cone is its own cone)"
+        yield "cone = np.repeat(np.arange(cones['l'] + len(cones['q'])), [1]*cones['l'] + cones['q'])"
+        yield "def inv_sqrt(v):"
+        yield "    return np.where(v > 0, 1.0 / np.sqrt(np.where(v > 0, v, 1)), 1.0)"
+        yield "for k in range(%d):" % RUIZ_ITERATIONS
+        yield "    cols = np.zeros((n,))"
+        yield "    if m > 0:"
+        yield "        absG = abs(G)"
+        yield "        rows = np.zeros((cones['l'] + len(cones['q']),))"
+        yield "        np.maximum.at(rows, cone, absG.max(axis=1).toarray().ravel())"
+        yield "        e = inv_sqrt(rows)[cone]"
+        yield "        cols = np.maximum(cols, absG.max(axis=0).toarray().ravel())"
+        yield "    if p > 0:"
+        yield "        absA = abs(A)"
+        yield "        f = inv_sqrt(absA.max(axis=1).toarray().ravel())"
+        yield "        cols = np.maximum(cols, absA.max(axis=0).toarray().ravel())"
+        yield "    d = inv_sqrt(cols)"
+        yield "    if m > 0: G, E = sp.diags(e) * G * sp.diags(d), E * e"
+        yield "    if p > 0: A, F = sp.diags(f) * A * sp.diags(d), F * f"
+        yield "    D = D * d"
+        yield "c = D * c"
+        yield "if m > 0: G, h = G.tocsc(), E * h"
+        yield "if p > 0: A, b = A.tocsc(), F * b"
+        yield "scaling = {'x': D, 'y': F, 'z': E}"
+
+    # generator for the row and column norms of the stuffed G and A
+    def python_norms(self):
+        yield "import numpy as np"
+        yield "if ord not in (2, np.inf): raise ValueError(\"ord must be 2 or np.inf\")"
+        yield "def norms(M):"
+        yield "    if M is None: return None"
+        yield "    if ord == 2:"
+        yield "        M = M.multiply(M)"
+        yield "        return np.sqrt(np.asarray(M.sum(axis=1)).ravel()), np.sqrt(np.asarray(M.sum(axis=0)).ravel())"
+        yield "    M = abs(M)"
+        yield "    return M.max(axis=1).toarray().ravel(), M.max(axis=0).toarray().ravel()"
+        yield "return {'G': norms(data['G']), 'A': norms(data['A'])}"
+
     def stuff_c(self, start, end, expr):
         yield "c[%s:%s] = np.squeeze(%s)" % (start, end, toPython(expr))
 
@@ -133,16 +311,23 @@ class PythonCodegen(Codegen):
         if (isinstance(n, AbstractDim) or n > 1) and expr.isscalar:
             expr = OnesCoeff(n,ConstantCoeff(1))*expr
         to_sparse = expr.to_sparse()
-        if to_sparse: yield toPython(to_sparse)
+        if to_sparse and parameters(to_sparse.rhs):
+            lhs, rhs = assignment(to_sparse)
+            yield "%s = %s" % (lhs, cached(self.conversions, parameters(to_sparse.rhs), rhs))
+            self.conversions += 1
+        elif to_sparse: yield toPython(to_sparse)
+        # the nonzeros are counted before the next block reuses `result`
+        yield "%snnz.append(%s)" % (mat, toPython(expr.nnz()))
         yield "%si.append(%s)" % (mat, toPython(expr.I(rstart, rstride)))
         yield "%sj.append(%s)" % (mat, toPython(expr.J(cstart)))
         yield "%sv.append(%s)" % (mat, toPython(expr.V()))
 
+    # the conversions are counted as the problem is visited
     def stuff_G(self, rstart, rend, cstart, cend, expr, rstride = 1):
-        return self.stuff_matrix("G", rstart, rend, cstart, cend, expr, rstride)
+        return list(self.stuff_matrix("G", rstart, rend, cstart, cend, expr, rstride))
 
     def stuff_A(self, rstart, rend, cstart, cend, expr, rstride = 1):
-        return self.stuff_matrix("A", rstart, rend, cstart, cend, expr, rstride)
+        return list(self.stuff_matrix("A", rstart, rend, cstart, cend, expr, rstride))
 
     def abstractdim_rewriter(self, ad):
         return "dims['%s']" % ad
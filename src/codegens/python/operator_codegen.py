@@ -1,6 +1,9 @@
 from .. base_operator_codegen import OperatorCodegen
 from ... codes.function import PythonFunction
 from ... codes.encoders import toPython
+from ... codes import EyeCoeff, OnesCoeff
+from ... codes.coefficients.coefficient import parameters
+from . codegen import python_cache, cached
 from ... properties.abstract_dim import AbstractDim
 
 def wrap_self(f):
@@ -16,10 +19,21 @@ class PythonOperatorCodegen(OperatorCodegen):
             'fG': PythonFunction('fG', ['x']),
             'fAT': PythonFunction('fAT', ['y']),
             'fGT': PythonFunction('fGT', ['y']),
-            'prob2socp': PythonFunction('prob_to_socp', ['params', 'dims={}']),
+            'prob2socp': PythonFunction('prob_to_socp', ['params', 'dims={}', 'cache=None']),
             'socp2prob': PythonFunction('socp_to_prob', ['x', 'y', 'z', 'dims={}']),
+            'norms': PythonFunction('socp_norms', ['data', 'ord=2']),
         }
-        self._codekeyorder = ['fA', 'fG', 'fAT', 'fGT', 'prob2socp', 'socp2prob']
+        self._codekeyorder = ['fA', 'fG', 'fAT', 'fGT', 'prob2socp', 'socp2prob', 'norms']
+
+        # lines evaluating the coefficients of the operators; these are run
+        # once in prob_to_socp, so that fA, fG, etc. only perform matvecs
+        self.operators = []
+        # whether any coefficient is a (sparse) matrix
+        self.has_matrix_operators = False
+        # number of matrix coefficients evaluated through the cache
+        self.conversions = 0
+        # (operator, row slice, col slice) of the blocks of A and G
+        self.blocks = {'fA': [], 'fG': []}
 
     @property
     def prob2socp(self):
@@ -29,6 +43,10 @@ class PythonOperatorCodegen(OperatorCodegen):
     def socp2prob(self):
         return self.code['socp2prob']
 
+    @property
+    def socp_norms(self):
+        return self.code['norms']
+
     @property
     def fA(self):
         return self.code['fA']
@@ -61,10 +79,11 @@ class PythonOperatorCodegen(OperatorCodegen):
             else: return "%s*[%s]" % (num, sz)
         cone_list_str = '[]'
         if self.cone_list:
-            cone_list_str = map(cone_tuple_to_str, self.cone_list)
+            cone_list_str = map(cone_tuple_to_str, self.cone_blocks())
             cone_list_str = '+'.join(cone_list_str)
+        blocks = "[%s]" % ', '.join("(%s, %s)" % block for block in self.cone_blocks())
 
-        yield "cones = {'l': %s, 'q': %s, 's': []}" % (self.num_lps, cone_list_str)
+        yield "cones = {'l': %s, 'q': %s, 'q_blocks': %s, 's': []}" % (self.num_lps, cone_list_str, blocks)
 
     def python_recover(self):
         for k in self.program.variables.keys():
@@ -82,6 +101,9 @@ class PythonOperatorCodegen(OperatorCodegen):
         self.prob2socp.document("maps 'params' into a dictionary of SOCP data")
         self.prob2socp.document("'params' ought to contain:")
         self.prob2socp.document(self.printshapes(self.program))
+        self.prob2socp.document("if 'cache' is a dict, the matrices of the operators are kept in it and")
+        self.prob2socp.document("reused while the parameters are unchanged (their entries are hashed on each")
+        self.prob2socp.document("call, so changes made in place are noticed)")
 
         # now import cvxopt and itertools
         self.prob2socp.add_lines("import numpy as np")
@@ -102,10 +124,11 @@ class PythonOperatorCodegen(OperatorCodegen):
         # self.prob2socp.add_lines("Ai, Aj, Av = [], [], []")
         self.prob2socp.add_lines(self.python_cone_sizes())
 
-        self.fA.add_lines("y = np.zeros((p,))")
-        self.fAT.add_lines("x = np.zeros((n,))")
-        self.fG.add_lines("y = np.zeros((m,))")
-        self.fGT.add_lines("x = np.zeros((n,))")
+        # the operators accept vectors as well as (n, k) blocks of vectors
+        self.fA.add_lines("y = np.zeros((p,) + x.shape[1:])")
+        self.fAT.add_lines("x = np.zeros((n,) + y.shape[1:])")
+        self.fG.add_lines("y = np.zeros((m,) + x.shape[1:])")
+        self.fGT.add_lines("x = np.zeros((n,) + y.shape[1:])")
 
     def functions_return(self):
         # TODO: what to do when m, n, or p is 0?
@@ -122,6 +145,8 @@ class PythonOperatorCodegen(OperatorCodegen):
         # self.prob2socp.add_lines("if p > 0: A = sp.csc_matrix((Av, np.vstack((Ai, Aj))), (p,n))")
         # self.prob2socp.add_lines("else: A, b = None, None")
 
+        self.prob2socp.add_lines(self.python_operators())
+
         self.fA.add_lines("return y")
         self.fAT.add_lines("return x")
         self.fG.add_lines("return y")
@@ -136,31 +161,126 @@ class PythonOperatorCodegen(OperatorCodegen):
         self.prob2socp.add_lines(self.fGT.code)
         self.prob2socp.newline()
 
-        self.prob2socp.add_lines("return {'c': c, 'G': fG, 'GT': fGT, 'h': h, 'A': fA, 'AT': fAT, 'b': b, 'dims': cones}")
+        self.prob2socp.add_lines(self.python_linear_operator())
+        self.prob2socp.newline()
+
+        self.prob2socp.add_lines(self.python_norms())
+        self.prob2socp.newline()
+
+        self.prob2socp.add_lines("return {'c': c, 'G': fG, 'GT': fGT, 'h': h, 'A': fA, 'AT': fAT, 'b': b, 'dims': cones, 'Gop': linear_operator((m,n), fG, fGT), 'Aop': linear_operator((p,n), fA, fAT), 'norms': norms}")
+
+        self.socp_norms.document("computes the ord-norms (2 or np.inf) of the rows and columns of G and A")
+        self.socp_norms.document("returns a dictionary of (row norms, column norms) for 'G' and 'A'")
+        self.socp_norms.add_lines("return data['norms'](ord)")
 
         self.socp2prob.document("recovers the problem variables from the solver variable 'x' and dual variables 'y' (equality constraints) and 'z' (conic constraints)")
         # recover the old variables
         self.socp2prob.add_lines("return {%s}" % ', '.join(self.python_recover()))
 
     def stuff_c(self, start, end, expr):
-        yield "c[%s:%s] = %s" % (start, end, toPython(expr))
+        yield "c[%s:%s] = np.squeeze(%s)" % (start, end, toPython(expr))
 
     def stuff_b(self, start, end, expr):
-        yield "b[%s:%s] = %s" % (start, end, toPython(expr))
+        yield "b[%s:%s] = np.squeeze(%s)" % (start, end, toPython(expr))
 
     def stuff_h(self, start, end, expr, stride = None):
         if stride is not None:
-            yield "h[%s:%s:%s] = %s" % (start, end, stride, toPython(expr))
+            yield "h[%s:%s:%s] = np.squeeze(%s)" % (start, end, stride, toPython(expr))
         else:
-            yield "h[%s:%s] = %s" % (start, end, toPython(expr))
+            yield "h[%s:%s] = np.squeeze(%s)" % (start, end, toPython(expr))
+
+    # generator to wrap the operators as scipy LinearOperators
+    def python_linear_operator(self):
+        yield "def linear_operator(shape, f, fT):"
+        yield "    # f and fT are applied to the whole block in matmat and rmatmat"
+        yield "    from scipy.sparse.linalg import LinearOperator"
+        yield "    op = LinearOperator(shape, matvec=f, rmatvec=fT, matmat=f, dtype=np.double)"
+        yield "    op._rmatmat = fT"
+        yield "    if not hasattr(op, 'rmatmat'): op.rmatmat = fT  # scipy < 1.4"
+        yield "    return op"
+
+    # generator for the row and column norms of G and A; these are computed
+    # from the evaluated coefficients of the blocks, without applying fG, etc.
+    def python_norms(self):
+        yield "def add_norms(rows, cols, op, rs, cs, ord):"
+        yield "    # adds the ord-norms (squared for ord=2) of the rows and cols of the"
+        yield "    # block op; a scalar op stands for a scaled identity, column, or row of ones"
+        yield "    nr, nc = rows[rs].shape[0], cols[cs].shape[0]"
+        yield "    if sp.issparse(op) and ord == 2:"
+        yield "        op = op.multiply(op)"
+        yield "        r, c = np.asarray(op.sum(axis=1)).ravel(), np.asarray(op.sum(axis=0)).ravel()"
+        yield "    elif sp.issparse(op):"
+        yield "        op = abs(op)"
+        yield "        r, c = op.max(axis=1).toarray().ravel(), op.max(axis=0).toarray().ravel()"
+        yield "    elif ord == 2:"
+        yield "        r, c = op**2 * (nc if nr == 1 else 1), op**2 * (nr if nc == 1 else 1)"
+        yield "    else:"
+        yield "        r, c = abs(op), abs(op)"
+        yield "    if ord == 2: rows[rs] += r; cols[cs] += c"
+        yield "    else: rows[rs] = np.maximum(rows[rs], r); cols[cs] = np.maximum(cols[cs], c)"
+        yield ""
+        yield "def norms(ord=2):"
+        yield "    if ord not in (2, np.inf): raise ValueError(\"ord must be 2 or np.inf\")"
+        yield "    Grows, Gcols = np.zeros((m,)), np.zeros((n,))"
+        yield "    Arows, Acols = np.zeros((p,)), np.zeros((n,))"
+        for func, matrix in [('fG', 'G'), ('fA', 'A')]:
+            for op, rs, cs in self.blocks[func]:
+                yield "    add_norms(%srows, %scols, %s, %s, %s, ord)" % (matrix, matrix, op, rs, cs)
+        yield "    if ord == 2:"
+        yield "        Grows, Gcols, Arows, Acols = map(np.sqrt, (Grows, Gcols, Arows, Acols))"
+        yield "    return {'G': (Grows, Gcols) if m > 0 else None, 'A': (Arows, Acols) if p > 0 else None}"
+
+    # generator to evaluate the coefficients of the operators
+    def python_operators(self):
+        if self.operators:
+            yield "# evaluate the coefficients of the operators once"
+        if self.has_matrix_operators:
+            yield "def prepare(A, rows, cols):"
+            yield "    # CSR for the forward product and CSC (transposed) for the adjoint"
+            yield "    if sp.issparse(A): A = A.tocsr()"
+            yield "    else: A = sp.csr_matrix(np.reshape(np.asarray(A), (rows, cols)))"
+            yield "    return A, A.tocsc().T"
+        if self.conversions:
+            for line in python_cache():
+                yield line
+        for line in self.operators:
+            yield line
+        if self.operators:
+            yield ""
 
     def stuff_function(self, func, rstart, rend, cstart, cend, expr, rstride):
-        self.code[func].add_lines("y[%s:%s:%s] += %s * x[%s:%s]" % (rstart, rend, rstride, toPython(expr), cstart, cend))
+        """ Adds the products with the block `expr` to the operator `func`
+            and its adjoint.
+
+            Scaled identities and (scaled) ones are applied as scalars; all
+            other coefficients are evaluated once in prob_to_socp.
+        """
+        op = "op%d" % len(self.operators)
+        y = "y[%s:%s:%s]" % (rstart, rend, rstride)
+        x = "x[%s:%s]" % (cstart, cend)
         n = (rend - rstart) / rstride
-        if (isinstance(n, AbstractDim) or n > 1) and expr.isscalar:
-            self.code[func + 'T'].add_lines("x[%s:%s] += %s * np.sum(y[%s:%s:%s])" % (cstart, cend, toPython(expr.trans()), rstart, rend, rstride))
+        if expr.isscalar or isinstance(expr, (EyeCoeff, OnesCoeff)):
+            coeff = expr if expr.isscalar else expr.coeff
+            self.operators.append("%s = %s" % (op, toPython(coeff)))
+            if isinstance(expr, OnesCoeff) and expr.transpose:
+                forward, adjoint = "%s * np.sum(%s, axis=0)" % (op, x), "%s * %s" % (op, y)
+            elif isinstance(expr, OnesCoeff) or ((isinstance(n, AbstractDim) or n > 1) and expr.isscalar):
+                forward, adjoint = "%s * %s" % (op, x), "%s * np.sum(%s, axis=0)" % (op, y)
+            else:
+                forward, adjoint = "%s * %s" % (op, x), "%s * %s" % (op, y)
         else:
-            self.code[func + 'T'].add_lines("x[%s:%s] += %s * y[%s:%s:%s]" % (cstart, cend, toPython(expr.trans()), rstart, rend, rstride))
+            self.has_matrix_operators = True
+            value = "prepare(%s, len(xrange(%s, %s, %s)), %s)" % \
+                (toPython(expr), rstart, rend, rstride, cend - cstart)
+            if parameters(expr):
+                value = cached(op, parameters(expr), value)
+                self.conversions += 1
+            self.operators.append("%s, %sT = %s" % (op, op, value))
+            forward, adjoint = "%s.dot(%s)" % (op, x), "%sT.dot(%s)" % (op, y)
+
+        self.blocks[func].append( (op, "slice(%s, %s, %s)" % (rstart, rend, rstride), "slice(%s, %s)" % (cstart, cend)) )
+        self.code[func].add_lines("%s += %s" % (y, forward))
+        self.code[func + 'T'].add_lines("%s += %s" % (x, adjoint))
         #yield expr
 
         # to_sparse = expr.to_sparse()
@@ -0,0 +1,116 @@
+from . codegen import PythonCodegen, python_cache, python_concatenate
+from ... codes import ConstantCoeff, EyeCoeff
+from ... codes.function import PythonFunction
+from ... exceptions import QCMLException
+
+class PythonQPCodegen(PythonCodegen):
+    """ Generates Python code for a QP solver (with the data of OSQP),
+
+            minimize    (1/2) x'*P*x + q'*x
+            subject to  l <= A*x <= u
+
+        from a problem canonicalized with `canonicalize(quadratic=True)`; P
+        holds the quadratic terms of the objective. The first rows of A are
+        the equality constraints (with l = u), and the rest are the linear
+        inequalities (with l = -inf).
+
+        The problem may not have any second-order cone constraints.
+    """
+    quadratic = True
+
+    def __init__(self, index_type = "int64"):
+        super(PythonQPCodegen, self).__init__(index_type)
+
+        self._code = {
+            'prob2socp': PythonFunction('prob_to_qp', ['params', 'dims={}', 'cache=None']),
+            'socp2prob': PythonFunction('qp_to_prob', ['x', 'y=None', 'dims={}']),
+        }
+        self._codekeyorder = ['prob2socp', 'socp2prob']
+
+    @property
+    def socp_norms(self):
+        raise QCMLException("QP codegen: There are no SOCP norms to compute.")
+
+    def python_recover(self):
+        yield "sol = {%s}" % ', '.join(
+            "'%s' : x[%s:%s]" % (k, start, start + length)
+            for k, (start, length) in ((k, self.primal_vars[k]) for k in self.program.variables.keys()))
+        # the duals of the inequalities follow those of the equalities
+        duals = ["'%s' : y[%s:%s]" % (k, start, start + length)
+            for k, (start, length) in self.dual_equality_vars.iteritems()]
+        duals += ["'%s' : y[%s:%s]" % (k, self.num_lineqs + start, self.num_lineqs + start + length)
+            for k, (start, length) in self.dual_conic_vars.iteritems()]
+        if duals:
+            yield "if y is not None: sol.update({%s})" % ', '.join(duals)
+        yield "return sol"
+
+    def functions_setup(self):
+        # add some documentation
+        self.prob2socp.document("maps 'params' into a dictionary of QP matrices P, q, A, l, u")
+        self.prob2socp.document("'params' ought to contain:")
+        self.prob2socp.document(self.printshapes(self.program))
+        self.prob2socp.document("if 'cache' is a dict, the sparse matrices made from the parameters are")
+        self.prob2socp.document("kept in it and reused while the parameters are unchanged (their entries are")
+        self.prob2socp.document("hashed on each call, so changes made in place are noticed)")
+
+        self.prob2socp.add_lines("import numpy as np")
+        self.prob2socp.add_lines("import scipy.sparse as sp")
+        self.prob2socp.add_lines("import itertools")
+        self.prob2socp.newline()
+        self.prob2socp.add_lines("params = dict(params)")
+        self.prob2socp.add_lines(line for line in python_cache() if self.conversions)
+
+        # set up the data structures
+        self.prob2socp.add_lines(self.python_dimensions())
+        self.prob2socp.add_lines("c = np.zeros((n,))")
+        self.prob2socp.add_lines("h = np.zeros((m,))")
+        self.prob2socp.add_lines("b = np.zeros((p,))")
+        self.prob2socp.add_lines("Pnnz, Pi, Pj, Pv = [], [], [], []")
+        self.prob2socp.add_lines("Gnnz, Gi, Gj, Gv = [], [], [], []")
+        self.prob2socp.add_lines("Annz, Ai, Aj, Av = [], [], [], []")
+
+    def stuff_P(self):
+        """ Stuffs the (diagonal) P, with 2*c on the columns of y for every
+            c * ||y||^2 in the objective.
+        """
+        for name, coeff in self.program.quadratic.iteritems():
+            self.prob2socp.add_comment("for the quadratic term %s*square(norm(%s))" % (coeff, name))
+            self.visit(coeff)
+            coeff = ConstantCoeff(2) * self.expr_stack.pop()['1']
+            start, length = self.primal_vars[name]
+            if not length == 1:
+                coeff = EyeCoeff(length, coeff)
+            self.prob2socp.add_lines(list(self.stuff_matrix("P", start, start + length, start, start + length, coeff, 1)))
+            self.prob2socp.newline()
+
+    def functions_return(self):
+        self.stuff_P()
+
+        self.prob2socp.add_comment("construct index and value arrays for P, G, and A")
+        self.prob2socp.add_lines(python_concatenate())
+        if self.index_type == "int32":
+            self.prob2socp.add_comment("check that the dimensions and nonzeros fit in the index type")
+            self.prob2socp.add_lines("if max(m + p, n, sum(Pnnz), sum(Gnnz) + sum(Annz)) > np.iinfo(np.int32).max:")
+            self.prob2socp.add_lines("    raise OverflowError('QP data is too large for 32-bit indices')")
+        for mat in ['P', 'G', 'A']:
+            self.prob2socp.add_lines("%si = concatenate(%snnz, %si, dtype=np.%s)" % (mat, mat, mat, self.index_type))
+            self.prob2socp.add_lines("%sj = concatenate(%snnz, %sj, dtype=np.%s)" % (mat, mat, mat, self.index_type))
+            self.prob2socp.add_lines("%sv = concatenate(%snnz, %sv, dtype=np.double)" % (mat, mat, mat))
+        self.prob2socp.add_lines("P = sp.coo_matrix((Pv, (Pi, Pj)), (n,n)).tocsc()")
+        self.prob2socp.add_lines("G = sp.coo_matrix((Gv, (Gi, Gj)), (m,n))")
+        self.prob2socp.add_lines("A = sp.coo_matrix((Av, (Ai, Aj)), (p,n))")
+        self.prob2socp.add_comment("the equality constraints come first, with l = u")
+        self.prob2socp.add_lines("A = sp.vstack([A, G]).tocsc()")
+        self.prob2socp.add_lines("l = np.hstack([b, -np.inf * np.ones((m,))])")
+        self.prob2socp.add_lines("u = np.hstack([b, h])")
+        self.prob2socp.add_lines(self.python_index_arrays(['P', 'A']))
+        self.prob2socp.add_lines("return {'P': P, 'q': c, 'A': A, 'l': l, 'u': u}")
+
+        self.socp2prob.document("recovers the problem variables from the solver variable 'x' and, if given, the dual variables 'y' of l <= A*x <= u")
+        self.socp2prob.add_lines(self.python_recover())
+
+    def visit_SOC(self, node):
+        raise QCMLException("QP codegen: The problem is not a QP; it has the second-order cone constraint %s." % node)
+
+    def visit_SOCProd(self, node):
+        raise QCMLException("QP codegen: The problem is not a QP; it has the second-order cone constraint %s." % node)
@@ -13,4 +13,5 @@ from . code import Just, LoopRows, LoopCols, LoopOver, Range, Repeat, \
     Assign, NNZ
 from . coefficients.coefficient import ConstantCoeff, OnesCoeff, \
     NegateCoeff, AddCoeff, MulCoeff, EyeCoeff, TransposeCoeff, \
-    ParameterCoeff, ScalarParameterCoeff, SliceCoeff
+    ParameterCoeff, ScalarParameterCoeff, SliceCoeff, TemporaryCoeff, \
+    DiagonalParameterCoeff, DenseParameterCoeff, FrozenCoeff
@@ -35,12 +35,17 @@ class LoopCols(LoopIndex):
 
 class LoopOver(Code):
     """ Loops over the values in a matrix and apply the operation. The
-        operation is specified as a format string.
+        operation is specified as a format string. If given, the values are
+        first multiplied by the (scalar) coefficient `scale`.
     """
-    def __init__(self, matrix, op = "%s"):
-        if isinstance(matrix, LoopOver): self.matrix = matrix.matrix
+    def __init__(self, matrix, op = "%s", scale = None):
+        if isinstance(matrix, LoopOver):
+            self.matrix = matrix.matrix
+            op = op % matrix.op
+            scale = scale if scale is not None else matrix.scale
         else: self.matrix = matrix
         self.op = op
+        self.scale = scale
         super(LoopOver, self).__init__()
 
 class Range(Code):
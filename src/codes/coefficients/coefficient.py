@@ -7,8 +7,39 @@
     coefficient math has already passed DCP checking.
 
     TODO: AddCoeff test cases to CoeffExpr
+
+    Each coefficient also carries a symbolic sparsity model: its `shape()`,
+    its `structure()` (DENSE, DIAGONAL, or SPARSE), and `nnz_bound()`, an
+    upper bound on its nonzeros in terms of the abstract dims and the
+    nonzeros of the sparse parameters, e.g. `nnz(A) + n`. Unlike `nnz()`, this
+    is known at compile time. The bounds are only reported (and used by the
+    planner); the generated code still allocates G and A from the exact
+    nonzeros it counts when the parameters are given, which are never more.
+
+    Parameters frozen at codegen time are FrozenCoeffs, which hold their
+    value. Sums and products of frozen coefficients (and of constants,
+    identities, and ones) are evaluated as the coefficients are built, so
+    only the parts that involve the other parameters are left to evaluate
+    when the data is stuffed.
 """
 from .. import code
+from ... properties.abstract_dim import AbstractDim
+
+# the structure of a coefficient; SPARSE means that the pattern is only known
+# when the parameters are given
+DENSE, DIAGONAL, SPARSE = "dense", "diagonal", "sparse"
+
+def dim(x):
+    """ Wraps the dimension `x` (an int, a name, or an AbstractDim) as an
+        AbstractDim, so that nonzero counts can be added and multiplied.
+    """
+    if isinstance(x, AbstractDim): return x
+    return AbstractDim(x)
+
+def dense_nnz(shape):
+    rows, cols = shape
+    return dim(rows) * dim(cols)
+
 class CoeffExpr(code.Code):
     # operations only occur on objects with the same shape
     def __add__(self, other): return codegen_add(self, other)
@@ -31,6 +62,11 @@ class CoeffExpr(code.Code):
     def J(self, col_offset, stride=1): return ""
     def V(self): return ""
 
+    # symbolic sparsity model
+    def shape(self): return (1, 1)
+    def structure(self): return DENSE
+    def nnz_bound(self): return dense_nnz(self.shape())
+
 class ConstantCoeff(CoeffExpr):
     def __init__(self, value):
         self.value = value
@@ -44,12 +80,24 @@ class ConstantCoeff(CoeffExpr):
     def V(self): return code.Just(self)
 
 class ParameterCoeff(CoeffExpr):
-    def __init__(self, value, shape):
+    def __init__(self, value, shape, structure = None):
         self.value = value
         self.isknown = True
         self.isscalar = False
         self.is_matrix_param = True
         self.rows, self.cols = shape
+        # vectors are stored densely; the pattern of a matrix is only known
+        # when it is given
+        if structure is None:
+            structure = DENSE if self.cols == 1 else SPARSE
+        self._structure = structure
+
+    def shape(self): return (self.rows, self.cols)
+    def structure(self): return self._structure
+    def nnz_bound(self):
+        if self._structure == DENSE: return dense_nnz(self.shape())
+        if self._structure == DIAGONAL: return dim(self.rows)
+        return dim("nnz(%s)" % self.value)
 
     def nnz(self): return code.NNZ(self)
     def to_sparse(self): return code.Assign(self, self)
@@ -58,6 +106,98 @@ class ParameterCoeff(CoeffExpr):
     def V(self): return code.LoopOver(self)
 
 
+class TemporaryCoeff(ParameterCoeff):
+    """ A (sparse) matrix holding the value of a coefficient expression that
+        was evaluated ahead of time; `value` is the name of the matrix in the
+        generated code. Only used by the C codegen.
+    """
+    def __init__(self, value):
+        super(TemporaryCoeff, self).__init__(value, (None, None))
+
+class DiagonalParameterCoeff(ParameterCoeff):
+    """ A diagonal matrix parameter, given by the vector of its diagonal.
+    """
+    def __init__(self, value, n):
+        super(DiagonalParameterCoeff, self).__init__(value, (n, n), DIAGONAL)
+        self.n = dim(n)
+
+    def nnz(self): return self.n
+    def to_sparse(self): return ""
+    def I(self, row_offset, stride=1): return code.Range(row_offset, row_offset + stride*self.n, stride)
+    def J(self, col_offset, stride=1): return code.Range(col_offset, col_offset + stride*self.n, stride)
+    def V(self): return code.LoopOver(self)
+
+class DenseParameterCoeff(ParameterCoeff):
+    """ A dense matrix parameter, stored in column major order; it is stuffed
+        entry by entry instead of being converted to a sparse matrix first.
+    """
+    def __init__(self, value, shape):
+        super(DenseParameterCoeff, self).__init__(value, shape, DENSE)
+
+    def nnz(self): return self.nnz_bound()
+    def to_sparse(self): return ""
+
+class FrozenCoeff(ParameterCoeff):
+    """ A matrix or vector whose value is known at codegen time, e.g., a
+        frozen parameter; `matrix` is its value as a scipy.sparse COO matrix.
+
+        It is written into the generated code as a constant. `value` is its
+        name in the generated code (if any); the C codegen names it when it
+        declares it.
+    """
+    def __init__(self, value, matrix):
+        super(FrozenCoeff, self).__init__(value, matrix.shape)
+        self.matrix = matrix
+
+    def nnz_bound(self):
+        # vectors are stored densely
+        if self.cols == 1: return dim(self.rows)
+        return dim(self.matrix.nnz)
+
+    def to_sparse(self): return ""
+
+def frozen(matrix, value = None):
+    """ The coefficient for the (numpy or scipy.sparse) `matrix`, known at
+        codegen time; a 1x1 matrix is a ConstantCoeff.
+    """
+    import scipy.sparse as sp
+    matrix = sp.csr_matrix(matrix, dtype=float)
+    if matrix.shape == (1, 1): return ConstantCoeff(float(matrix[0, 0]))
+    matrix.eliminate_zeros()
+    return FrozenCoeff(value, matrix.tocoo())
+
+def isfrozen(x):
+    return isinstance(x, FrozenCoeff)
+
+def isstructured(x):
+    """ Whether `x` is a diagonal, dense, or frozen parameter (possibly
+        negated or transposed), which knows how to stuff itself without
+        forming a sparse matrix.
+    """
+    if isinstance(x, (NegateCoeff, TransposeCoeff)): return isstructured(x.arg)
+    return isinstance(x, (DiagonalParameterCoeff, DenseParameterCoeff, FrozenCoeff))
+
+def coefficients(x, cls):
+    """ The distinct coefficients of class `cls` in the coefficient `x`, in
+        the order they first appear.
+    """
+    if isinstance(x, cls): return [x]
+    found = []
+    for attr in ('arg', 'left', 'right', 'coeff'):
+        child = getattr(x, attr, None)
+        if isinstance(child, CoeffExpr):
+            found += [c for c in coefficients(child, cls) if not any(c is f for f in found)]
+    return found
+
+def parameters(x):
+    """ The names of the parameters in the coefficient `x`, in the order they
+        first appear; frozen parameters are not included.
+    """
+    names = []
+    for c in coefficients(x, ParameterCoeff):
+        if not isfrozen(c) and c.value not in names: names.append(c.value)
+    return names
+
 class ScalarParameterCoeff(ParameterCoeff):
     def __init__(self,value):
         super(ScalarParameterCoeff, self).__init__(value, (1,1))
@@ -77,6 +217,10 @@ class NegateCoeff(CoeffExpr):
         self.isscalar = arg.isscalar
         self.is_matrix_param = arg.is_matrix_param
 
+    def shape(self): return self.arg.shape()
+    def structure(self): return self.arg.structure()
+    def nnz_bound(self): return self.arg.nnz_bound()
+
     def nnz(self): return self.arg.nnz()
     def to_sparse(self): return self.arg.to_sparse()
     def I(self, row_offset, stride=1): return self.arg.I(row_offset, stride)
@@ -96,6 +240,10 @@ class EyeCoeff(CoeffExpr):
         self.isscalar = False
         self.is_matrix_param = False
 
+    def shape(self): return (self.n, self.n)
+    def structure(self): return DIAGONAL
+    def nnz_bound(self): return dim(self.n)
+
     def nnz(self): return self.n
     def I(self, row_offset, stride=1): return code.Range(row_offset, row_offset + stride*self.n, stride)
     def J(self, col_offset, stride=1): return code.Range(col_offset, col_offset + stride*self.n, stride)
@@ -115,6 +263,8 @@ class OnesCoeff(CoeffExpr):
         else:
             self.is_matrix_param = False
 
+    def shape(self): return (1, self.n) if self.transpose else (self.n, 1)
+
     def nnz(self): return self.n
 
     def I(self, row_offset, stride=1):
@@ -145,6 +295,23 @@ class AddCoeff(CoeffExpr):
         self.isscalar = left.isscalar and right.isscalar
         self.is_matrix_param = left.is_matrix_param or right.is_matrix_param
 
+    def shape(self):
+        return self.right.shape() if self.left.isscalar else self.left.shape()
+
+    def structure(self):
+        left, right = self.left.structure(), self.right.structure()
+        if left == DIAGONAL and right == DIAGONAL: return DIAGONAL
+        # a scalar is added to every entry
+        if self.left.isscalar or self.right.isscalar: return DENSE
+        if DENSE in (left, right): return DENSE
+        return SPARSE
+
+    def nnz_bound(self):
+        structure = self.structure()
+        if structure == DIAGONAL: return self.left.nnz_bound()
+        if structure == DENSE: return dense_nnz(self.shape())
+        return self.left.nnz_bound() + self.right.nnz_bound()
+
     def nnz(self): return code.NNZ("result")
     def to_sparse(self): return code.Assign("result", self)
     def I(self, row_offset, stride=1): return code.LoopRows("result", row_offset, stride)
@@ -159,29 +326,59 @@ class MulCoeff(CoeffExpr):
         self.isscalar = left.isscalar and right.isscalar
         self.is_matrix_param = left.is_matrix_param or right.is_matrix_param
 
+    def shape(self):
+        if self.left.isscalar: return self.right.shape()
+        if self.right.isscalar: return self.left.shape()
+        return (self.left.shape()[0], self.right.shape()[1])
+
+    def structure(self):
+        if self.left.isscalar: return self.right.structure()
+        if self.right.isscalar: return self.left.structure()
+        left, right = self.left.structure(), self.right.structure()
+        # scaling by a diagonal keeps the pattern
+        if left == DIAGONAL: return right
+        if right == DIAGONAL: return left
+        if left == DENSE and right == DENSE: return DENSE
+        return SPARSE
+
+    def nnz_bound(self):
+        if self.left.isscalar: return self.right.nnz_bound()
+        if self.right.isscalar: return self.left.nnz_bound()
+        if self.left.structure() == DIAGONAL: return self.right.nnz_bound()
+        if self.right.structure() == DIAGONAL: return self.left.nnz_bound()
+        return dense_nnz(self.shape())
+
     def nnz(self):
         if self.left.isscalar:
             return self.right.nnz()
         else:
             return code.NNZ("result")
     def to_sparse(self):
+        if self.left.isscalar and isstructured(self.right):
+            return self.right.to_sparse()
         if self.left.isscalar:
             return code.Assign(self.right, self.right)
         else:
             return code.Assign("result", self)
     def I(self, row_offset, stride=1):
+        if self.left.isscalar and isstructured(self.right):
+            return self.right.I(row_offset, stride)
         if self.left.isscalar:
             return code.LoopRows(self.right, row_offset, stride)
         else:
             return code.LoopRows("result", row_offset, stride)
     def J(self, col_offset, stride=1):
+        if self.left.isscalar and isstructured(self.right):
+            return self.right.J(col_offset, stride)
         if self.left.isscalar:
             return code.LoopCols(self.right, col_offset, stride)
         else:
             return code.LoopCols("result", col_offset, stride)
     def V(self):
+        if self.left.isscalar and isstructured(self.right):
+            return code.LoopOver(self.right.V(), scale=self.left)
         if self.left.isscalar:
-            return code.LoopOver(self.right, "{0}*%s".format(self.left.value))
+            return code.LoopOver(self.right, scale=self.left)
         else:
             return code.LoopOver("result")
 
@@ -193,6 +390,10 @@ class TransposeCoeff(CoeffExpr):
         self.isscalar = arg.isscalar
         self.is_matrix_param = arg.is_matrix_param
 
+    def shape(self): return tuple(reversed(self.arg.shape()))
+    def structure(self): return self.arg.structure()
+    def nnz_bound(self): return self.arg.nnz_bound()
+
     def nnz(self): return self.arg.nnz()
     def to_sparse(self): return self.arg.to_sparse()
     def I(self, row_offset, stride=1): return self.arg.J(row_offset, stride)
@@ -211,6 +412,19 @@ class SliceCoeff(CoeffExpr):
         self.isscalar = arg.isscalar
         self.is_matrix_param = arg.is_matrix_param
 
+    # the rows begin:end of the argument
+    def shape(self): return (self.end - self.begin, self.arg.shape()[1])
+    def structure(self):
+        # the rows of a diagonal are no longer a (square) diagonal
+        if self.arg.structure() == DIAGONAL: return SPARSE
+        return self.arg.structure()
+    def nnz_bound(self):
+        structure = self.arg.structure()
+        if structure == DENSE: return dense_nnz(self.shape())
+        # one nonzero per row of a diagonal
+        if structure == DIAGONAL: return dim(self.end - self.begin)
+        return self.arg.nnz_bound()
+
     # def __str__(self): return "(%s)[%s:%s]" % (self.arg, self.begin, self.end)
 
 """ Helper functions for expr ops.
@@ -220,6 +434,12 @@ class SliceCoeff(CoeffExpr):
 def codegen_add(x,y):
     if isinstance(x, ConstantCoeff) and isinstance(y, ConstantCoeff):
         return ConstantCoeff(x.value + y.value)
+    if isfrozen(x) and isfrozen(y):
+        return frozen(x.matrix + y.matrix)
+    if isfrozen(x) and isfoldable(y):
+        return frozen(x.matrix + folded(y, x.shape()))
+    if isfoldable(x) and isfrozen(y):
+        return frozen(folded(x, y.shape()) + y.matrix)
     if isinstance(x, ConstantCoeff) and x.value == 0:
         return y
     if isinstance(y,ConstantCoeff) and y.value == 0:
@@ -235,6 +455,8 @@ def codegen_add(x,y):
 def codegen_negate(x):
     if isinstance(x,NegateCoeff):
         return x.arg
+    if isfrozen(x):
+        return frozen(-x.matrix)
     if isinstance(x,TransposeCoeff):
         return TransposeCoeff(-x.arg)
     if isinstance(x, ConstantCoeff):
@@ -259,6 +481,10 @@ def codegen_mul(x,y):
     if isinstance(y,ConstantCoeff) and y.value == -1:
         return -x
 
+    if isfrozen(x) or isfrozen(y):
+        product = codegen_frozen_mul(x, y)
+        if product is not None: return product
+
     if isinstance(x,EyeCoeff) and y.isknown and y.isscalar:
         return EyeCoeff(x.n, x.coeff * y)
     if isinstance(y,EyeCoeff) and x.isknown and x.isscalar:
@@ -296,7 +522,9 @@ def codegen_mul(x,y):
 def codegen_transpose(x):
     if x.isscalar:
         return x
-    if isinstance(x, EyeCoeff):
+    if isfrozen(x):
+        return frozen(x.matrix.T)
+    if isinstance(x, (EyeCoeff, DiagonalParameterCoeff)):
         return x
     if isinstance(x, OnesCoeff):
         x.transpose = not x.transpose
@@ -319,6 +547,8 @@ def codegen_transpose(x):
 def codegen_slice(x, begin, end):
     if x.isscalar:
         return x
+    if isfrozen(x) and isinstance(begin, int) and isinstance(end, int):
+        return frozen(x.matrix.tocsr()[begin:end])
 
     if isinstance(x,OnesCoeff):
         if not x.transpose:
@@ -337,3 +567,58 @@ def codegen_slice(x, begin, end):
         return SliceCoeff(x.arg, x.begin + begin, x.begin + end)
 
     return SliceCoeff(x, begin, end)
+
+""" Helper functions for the products of frozen coefficients.
+
+    The identities and ones are folded into the frozen coefficient when
+    their coefficient is a constant; otherwise, their (scalar) coefficient is
+    left to multiply the folded product.
+"""
+def isfoldable(x):
+    """ Whether `x` is a scaled identity or ones with a constant coefficient.
+    """
+    return isinstance(x, (EyeCoeff, OnesCoeff)) and isinstance(x.coeff, ConstantCoeff)
+
+def folded(x, shape):
+    """ The value of the foldable `x`, which is added to a frozen coefficient
+        with the given `shape`.
+    """
+    import numpy as np
+    import scipy.sparse as sp
+    rows, cols = shape
+    if isinstance(x, EyeCoeff): return x.coeff.value * sp.eye(rows, cols)
+    return x.coeff.value * np.ones(shape)
+
+def codegen_frozen_mul(x, y):
+    """ The product of `x` and `y` (one of which is frozen) if it can be
+        (partly) evaluated at codegen time; otherwise, None.
+    """
+    import numpy as np
+    import scipy.sparse as sp
+    if isfrozen(x) and isfrozen(y):
+        return frozen(x.matrix.dot(y.matrix))
+    if isinstance(x, ConstantCoeff):
+        return frozen(x.value * y.matrix)
+    if isinstance(y, ConstantCoeff):
+        return frozen(x.matrix * y.value)
+    if isinstance(x, EyeCoeff):
+        return x.coeff * y
+    if isinstance(y, EyeCoeff):
+        return x * y.coeff
+    if isinstance(x, OnesCoeff) and x.transpose:
+        # ones^T F sums the rows of F
+        return x.coeff * frozen(y.matrix.sum(axis=0))
+    if isinstance(y, OnesCoeff) and not y.transpose:
+        # F ones sums the columns of F
+        return frozen(x.matrix.sum(axis=1)) * y.coeff
+    if isinstance(x, OnesCoeff) and isinstance(x.n, int):
+        return x.coeff * frozen(sp.csr_matrix(np.ones((x.n, 1))).dot(y.matrix))
+    if isinstance(y, OnesCoeff) and isinstance(y.n, int):
+        return frozen(x.matrix.dot(sp.csr_matrix(np.ones((1, y.n))))) * y.coeff
+    if isinstance(x, MulCoeff) and x.left.isscalar and isfrozen(x.right):
+        # (a*F)*G = a*(F*G)
+        return x.left * (x.right * y)
+    if isinstance(y, MulCoeff) and y.left.isscalar and isfrozen(y.right):
+        # F*(a*G) = a*(F*G)
+        return y.left * (x * y.right)
+    return None
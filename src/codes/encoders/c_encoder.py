@@ -12,7 +12,8 @@ from ... properties.abstract_dim import AbstractDim
 """
 
 def constant(x):
-    return str(x.value)
+    # str would round floats to 12 digits
+    return repr(x.value) if isinstance(x.value, float) else str(x.value)
 
 eye = NotImplemented
 
@@ -33,11 +34,21 @@ def scalar_parameter(x):
 def parameter(x):
     return "params->%s" % x.value
 
+def frozen(x):
+    # frozen coefficients are declared as static arrays (or a static
+    # qc_matrix) named by the C codegen; column vectors are dense
+    if x.cols == 1: return x.value
+    return "(&%s)" % x.value
+
 def negate(x):
     return "-%s" % (toC(x.arg))
 
 def add(x):
-    raise Exception("Add not implemented.... %s + %s" % (x.left, x.right))
+    # sums of matrices are evaluated into temporaries by the C codegen
+    if x.isscalar:
+        return "(%s + %s)" % (toC(x.left), toC(x.right))
+    else:
+        raise Exception("Add not implemented.... %s + %s" % (x.left, x.right))
 
 def mul(x):
     if x.left.isscalar:
@@ -50,7 +61,12 @@ def just(elem):
 
 def loop(ijv):
     def to_str(x):
+        if isinstance(x.matrix, (codes.DiagonalParameterCoeff, codes.DenseParameterCoeff)):
+            return structured_loop(ijv, x)
         matrix = toC(x.matrix)
+        def scaled(value):
+            if getattr(x, 'scale', None) is None: return value
+            return "(%s)*%s" % (toC(x.scale), value)
         # only used for transposes..
         if isinstance(x.matrix, codes.TransposeCoeff):
             if ijv == "i":
@@ -86,16 +102,34 @@ def loop(ijv):
             return  s % ({'matrix': matrix, 'offset': x.offset, 'stride': x.stride, 'ijv': ijv})
         if isinstance(x.matrix, codes.TransposeCoeff):
             if ijv == "v":
-                val = x.op % ("%s[i]" % matrix)
+                val = x.op % scaled("%s[i]" % matrix)
             return "for(i = 0; i < {length}; ++i) *%(ptr)s++ = {value};".format(length=x.matrix.arg.rows, value = val)
         elif isinstance(x.matrix, codes.ParameterCoeff) and x.matrix.cols == 1:
             if ijv == "v":
-                val = x.op % ("%s[i]" % matrix)
+                val = x.op % scaled("%s[i]" % matrix)
             return "for(i = 0; i < {length}; ++i) *%(ptr)s++ = {value};".format(length=x.matrix.rows, value = val)
         else:
-            return "for(i = 0; i < %s->nnz; ++i) *%%(ptr)s++ = %s;" % (matrix, x.op % ("%s->%s[i]" % (matrix, ijv)))
+            return "for(i = 0; i < %s->nnz; ++i) *%%(ptr)s++ = %s;" % (matrix, x.op % scaled("%s->%s[i]" % (matrix, ijv)))
     return to_str
 
+def structured_loop(ijv, x):
+    """ Loops over the entries of a dense (column major) or diagonal parameter,
+        which are stored as arrays.
+    """
+    matrix = toC(x.matrix)
+    rows, cols = x.matrix.shape()
+    if isinstance(x.matrix, codes.DiagonalParameterCoeff):
+        length, row, col = rows, "i", "i"
+    else:
+        length, row, col = x.matrix.nnz_bound(), "i %%%% %s" % rows, "i / %s" % rows
+    if ijv == "v":
+        value = "%s[i]" % matrix
+        if x.scale is not None: value = "(%s)*%s" % (toC(x.scale), value)
+        value = x.op % value
+    else:
+        value = "%s + %s*(%s)" % (x.offset, x.stride, row if ijv == "i" else col)
+    return "for(i = 0; i < %s; ++i) *%%(ptr)s++ = %s;" % (length, value)
+
 def _range(x):
     if x.stride == 1:
         return "for(i = %s; i < %s; ++i) *%%(ptr)s++ = i;" % (x.start, x.end)
@@ -111,6 +145,8 @@ def assign(x):
 def nnz(x):
     if isinstance(x.obj, codes.ParameterCoeff) and x.obj.cols == 1:
         return "%s" % (x.obj.rows)
+    if isinstance(x.obj, codes.FrozenCoeff):
+        return "%s" % x.obj.matrix.nnz
     return "%s->nnz" % (toC(x.obj))
 
 lookup = {
@@ -121,6 +157,10 @@ lookup = {
     codes.TransposeCoeff:           trans,
     codes.ParameterCoeff:           parameter,
     codes.ScalarParameterCoeff:     scalar_parameter,
+    codes.DiagonalParameterCoeff:   parameter,
+    codes.DenseParameterCoeff:      parameter,
+    codes.FrozenCoeff:              frozen,
+    codes.TemporaryCoeff:           lambda x: x.value,
     codes.AddCoeff:                 add,
     codes.MulCoeff:                 mul,
     codes.Just:                     just,
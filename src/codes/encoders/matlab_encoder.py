@@ -10,7 +10,15 @@ from ... import codes
 from ... properties.abstract_dim import AbstractDim
 
 def constant(x):
-    return str(x.value)
+    # str would round floats to 12 digits
+    return repr(x.value) if isinstance(x.value, float) else str(x.value)
+
+def frozen(x):
+    m = x.matrix
+    if x.cols == 1: return "[%s]" % '; '.join(map(repr, m.toarray().ravel().tolist()))
+    if x.rows == 1: return "[%s]" % ', '.join(map(repr, m.toarray().ravel().tolist()))
+    row, col, data = (' '.join(map(repr, v.tolist())) for v in (m.row, m.col, m.data))
+    return "sparse(1 + [%s], 1 + [%s], [%s], %d, %d)" % (row, col, data, x.rows, x.cols)
 
 def eye(x):
     return "%s * speye(%s)" % (toMatlab(x.coeff), x.n)
@@ -25,6 +33,9 @@ def trans(x):
 def parameter(x):
     return "params.%s" % x.value
 
+def diagonal_parameter(x):
+    return "spdiags(params.%s(:), 0, %s, %s)" % (x.value, x.n, x.n)
+
 def scalar_parameter(x):
     return "params.%s" % x.value
 
@@ -64,7 +75,14 @@ def loop_cols(x):
     return ret
 
 def loop_over(x):
-    return "nonzeros(%s)" % (x.op % toMatlab(x.matrix))
+    if isinstance(x.matrix, codes.DiagonalParameterCoeff):
+        # every entry of the diagonal is stuffed, even the zeros
+        value = "params.%s(:)" % x.matrix.value
+        if x.scale is not None: value = "(%s)*%s" % (toMatlab(x.scale), value)
+        return x.op % value
+    value = toMatlab(x.matrix)
+    if x.scale is not None: value = "(%s)*%s" % (toMatlab(x.scale), value)
+    return "nonzeros(%s)" % (x.op % value)
 
 def _range(x):
     if x.stride == 1: return "(%s:%s)'" % (x.start, x.end-1)
@@ -89,6 +107,9 @@ lookup = {
     codes.TransposeCoeff:         trans,
     codes.ParameterCoeff:         parameter,
     codes.ScalarParameterCoeff:   parameter,
+    codes.DiagonalParameterCoeff: diagonal_parameter,
+    codes.DenseParameterCoeff:    parameter,
+    codes.FrozenCoeff:            frozen,
     codes.NegateCoeff:            negate,
     codes.AddCoeff:               add,
     codes.MulCoeff:               mul,
@@ -1,9 +1,14 @@
 from encoder import create_encoder
 from ... import codes
+from ... codes.coefficients.coefficient import isstructured
 from ... properties.abstract_dim import AbstractDim
 
 def constant(x):
-    return str(x.value)
+    return number(x.value)
+
+def number(x):
+    # str would round floats to 12 digits
+    return repr(x) if isinstance(x, float) else str(x)
 
 def eye(x):
     return "%s * sp.eye(%s,%s,format='coo')" % (toPython(x.coeff), x.n, x.n)
@@ -21,6 +26,31 @@ def scalar_parameter(x):
 def parameter(x):
     return "params['%s']" % x.value
 
+def diagonal(x):
+    return "np.ravel(params['%s'])" % x.value
+
+def diagonal_parameter(x):
+    return "sp.diags(%s, 0)" % diagonal(x)
+
+def dense(x):
+    return "np.asarray(params['%s']).ravel(order='F')" % x.value
+
+def dense_parameter(x):
+    return "sp.coo_matrix(params['%s'])" % x.value
+
+def frozen(x):
+    """ A frozen coefficient, as a constant; vectors are dense (like the
+        vector parameters) and matrices are sparse.
+    """
+    if x.rows == 1 or x.cols == 1:
+        return "np.array(%s)" % constants(x.matrix.toarray().ravel())
+    return "sp.coo_matrix((%s, (%s, %s)), shape=(%d, %d))" % \
+        (constants(x.matrix.data), constants(x.matrix.row), constants(x.matrix.col), x.rows, x.cols)
+
+def constants(array):
+    # a tuple literal, which python evaluates once when compiling the code
+    return repr(tuple(array.tolist()))
+
 def negate(x):
     return "-(%s)" % toPython(x.arg)
 
@@ -28,32 +58,72 @@ def add(x):
     return "%s + %s" % (toPython(x.left), toPython(x.right))
 
 def mul(x):
+    if x.left.is_matrix_param and isstructured(x.right) and not isdense(x.right):
+        # the structured parameter is a sparse matrix, which numpy arrays
+        # cannot multiply, so it goes on the left
+        return "(%(rhs)s).T.dot((%(lhs)s).T).T" % {'lhs':toPython(x.left), 'rhs': toPython(x.right)}
     if x.left.is_matrix_param:
         return "%(lhs)s.dot(%(rhs)s)" % {'lhs':toPython(x.left), 'rhs': toPython(x.right)}
     else:
         return "%(lhs)s * %(rhs)s" % {'lhs':toPython(x.left), 'rhs': toPython(x.right)}
     #return "%(lhs)s.dot(%(rhs)s) if (isinstance(%(lhs)s, np.ndarray) and isinstance(%(rhs)s, np.ndarray)) else %(lhs)s * %(rhs)s" % {'lhs':toPython(x.left), 'rhs': toPython(x.right)}
 
+def isdense(x):
+    # frozen vectors are numpy arrays
+    return isinstance(x, codes.FrozenCoeff) and (x.rows == 1 or x.cols == 1)
+
 def just(elem):
     return "[%s]" % toPython(elem.x)
 
 def loop(ijv):
     def to_str(x):
+        if isinstance(x.matrix, (codes.DiagonalParameterCoeff, codes.DenseParameterCoeff)):
+            return structured_loop(ijv, x)
+        if isinstance(x.matrix, codes.FrozenCoeff):
+            return frozen_loop(ijv, x)
         matrix = toPython(x.matrix)
         if hasattr(x, 'offset') and hasattr(x, 'stride'):
             if x.offset == 0 and x.stride == 1:
                 return "(idx for idx in %s.%s)" % (matrix, ijv)
             return "(%s + %s*idx for idx in %s.%s)" % (x.offset, x.stride, matrix, ijv)
-        return "(%s for v in %s.%s)" % (x.op % "v", matrix, ijv)
+        value = "(%s)*v" % toPython(x.scale) if x.scale is not None else "v"
+        return "(%s for v in %s.%s)" % (x.op % value, matrix, ijv)
     return to_str
 
+def structured_loop(ijv, x):
+    """ The (column major) row indices, col indices, or values of a dense or
+        diagonal parameter, as arrays.
+    """
+    if ijv == "data":
+        value = diagonal(x.matrix) if isinstance(x.matrix, codes.DiagonalParameterCoeff) else dense(x.matrix)
+        if x.scale is not None: value = "(%s)*%s" % (toPython(x.scale), value)
+        return x.op % value
+    rows, cols = x.matrix.shape()
+    if ijv == "row": index = "np.tile(np.arange(%s), %s)" % (rows, cols)
+    else: index = "np.repeat(np.arange(%s), %s)" % (cols, rows)
+    return "%s + %s*%s" % (x.offset, x.stride, index)
+
+def frozen_loop(ijv, x):
+    """ The row indices, col indices, or values of the nonzeros of a frozen
+        coefficient, as constants.
+    """
+    values = constants(getattr(x.matrix.matrix, ijv))
+    if ijv == "data":
+        if x.scale is None and x.op == "%s": return values
+        value = "(%s)*v" % toPython(x.scale) if x.scale is not None else "v"
+        return "(%s for v in %s)" % (x.op % value, values)
+    if x.offset == 0 and x.stride == 1: return values
+    return "(%s + %s*idx for idx in %s)" % (x.offset, x.stride, values)
+
 def _range(x):
     return "xrange(%s, %s, %s)" % (x.start, x.end, x.stride)
 
 def repeat(x):
     return "itertools.repeat(%s, %s)" % (toPython(x.obj), x.n)
 
-def assign(x):
+def assignment(x):
+    """ The (target, value) of the Assign `x`, as python code.
+    """
     if isinstance(x.lhs, codes.TransposeCoeff):
         lhs = toPython(x.lhs.arg)
     else:
@@ -61,12 +131,17 @@ def assign(x):
 
     if isinstance(x.rhs, codes.TransposeCoeff):
         rhs = toPython(x.rhs.arg)
-        return "%s = sp.coo_matrix(%s.reshape((%s,%s))) if not sp.isspmatrix_coo(%s) else %s" % (lhs, rhs, x.rhs.arg.rows, x.rhs.arg.cols, rhs, rhs)
+        return lhs, "sp.coo_matrix(%s.reshape((%s,%s))) if not sp.isspmatrix_coo(%s) else %s" % (rhs, x.rhs.arg.rows, x.rhs.arg.cols, rhs, rhs)
     else:
         rhs = toPython(x.rhs)
-        return "%s = sp.coo_matrix(%s)" % (lhs, rhs)
+        return lhs, "sp.coo_matrix(%s)" % rhs
+
+def assign(x):
+    return "%s = %s" % assignment(x)
 
 def nnz(x):
+    # the nonzeros of a frozen coefficient are constants
+    if isinstance(x.obj, codes.FrozenCoeff): return str(x.obj.matrix.nnz)
     return "%s.nnz" % (toPython(x.obj))
 
 lookup = {
@@ -77,6 +152,9 @@ lookup = {
     codes.TransposeCoeff:           trans,
     codes.ParameterCoeff:           parameter,
     codes.ScalarParameterCoeff:     scalar_parameter,
+    codes.DiagonalParameterCoeff:   diagonal_parameter,
+    codes.DenseParameterCoeff:      dense_parameter,
+    codes.FrozenCoeff:              frozen,
     codes.AddCoeff:                 add,
     codes.MulCoeff:                 mul,
     codes.Just:                     just,
@@ -6,3 +6,8 @@ class DCPError(QCMLException):
 
 class ParseError(QCMLException):
     pass
+
+class StrategyNotApplicable(QCMLException):
+    """ A rewriting strategy (codegen mixin) cannot rewrite the problem.
+    """
+    pass
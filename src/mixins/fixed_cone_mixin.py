@@ -5,6 +5,7 @@
 #
 from .. ast.constraints import SOC, SOCProd
 from .. codes import SliceCoeff
+from .. exceptions import StrategyNotApplicable
 from variable_creation_mixin import VariableCreatorMixin
 
 class FixedConeMixin(VariableCreatorMixin):
@@ -24,6 +25,10 @@ class FixedConeMixin(VariableCreatorMixin):
                 dim = e.shape.size(abstractdim_rewriter=self.abstractdim_rewriter)
                 cone_length += dim
 
+            if cone_length > self.cone_size:
+                # slicing the arguments below needs expression slices
+                raise StrategyNotApplicable("Fixed cone: Cannot split the cone %s of size %s into cones of size %s." % (node, cone_length, self.cone_size))
+
             while cone_length > self.cone_size:
                 # maximum number of elements on the lhs
                 max_lhs = self.cone_size - 1
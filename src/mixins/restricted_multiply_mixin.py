@@ -15,19 +15,21 @@ class RestrictedMultiplyMixin(VariableCreatorMixin):
     def expand_param(self, left, right, node):
         # ONLY FOR BINARY OPERATORS
         if (left.is_matrix_param and right.is_matrix_param):
-            # introduce a new variable for expr
-            new_var = self.create_variable(node.right.shape)
+            # introduce a new variable for expr (or reuse the one for the
+            # same expr)
+            new_var, is_new = self.auxiliary_variable(str(node.right), node.right.shape)
 
-            # reset the stack and save the state
-            stack = list(self.expr_stack)
-            self.expr_stack = []
+            if is_new:
+                # reset the stack and save the state
+                stack = list(self.expr_stack)
+                self.expr_stack = []
 
-            # add an equality constraint
-            eq_constraint = (new_var == node.right)
-            self.visit(eq_constraint)
+                # add an equality constraint
+                eq_constraint = (new_var == node.right)
+                self.visit(eq_constraint)
 
-            # restore the stack
-            self.expr_stack = stack
+                # restore the stack
+                self.expr_stack = stack
             # now visit the variable
             self.visit_Variable(new_var)
             return True
@@ -10,30 +10,59 @@ This also introduces new variables, so the question is whether we can
 obtain a better sparsity pattern. At the moment, the answer is unknown.
 """
 
+from collections import OrderedDict
+
 from .. codes import ConstantCoeff, EyeCoeff
 from variable_creation_mixin import VariableCreatorMixin
 
 class SSALikeMixin(VariableCreatorMixin):
-    """ This implements the restricted multiplication behavior.
+    """ This implements the SSA-like form.
     """
     def __init__(self, *args, **kwargs):
         super(SSALikeMixin, self).__init__(*args, **kwargs)
         self.__variable_reference = {}
         self.__is_adding_new_var = False
         self.__is_objective = False
+        # the variable used for each variable in the current constraint
+        self.__in_constraint = {}
 
     def visit_ProgramObjective(self, node):
         self.__is_objective = True
         super(SSALikeMixin, self).visit_ProgramObjective(node)
         self.__is_objective = False
 
+    def __new_constraint(self):
+        if not self.__is_adding_new_var:
+            self.__in_constraint = {}
+
+    def visit_LinearConstraint(self, node):
+        self.__new_constraint()
+        super(SSALikeMixin, self).visit_LinearConstraint(node)
+
+    def visit_SOC(self, node):
+        self.__new_constraint()
+        super(SSALikeMixin, self).visit_SOC(node)
+
+    def visit_SOCProd(self, node):
+        self.__new_constraint()
+        super(SSALikeMixin, self).visit_SOCProd(node)
+
     def visit_Variable(self, node):
         k = node.value
-        n = self.primal_variables[k].length
+        n = self.primal_vars[k].length
 
-        if not self.__is_adding_new_var and \
-           not self.__is_objective and \
-           k in self.__variable_reference.keys():
+        if n == 1:
+            coeff = ConstantCoeff(1)
+        else:
+            coeff = EyeCoeff(n, ConstantCoeff(1))
+
+        if self.__is_adding_new_var or self.__is_objective:
+            newval = k
+        elif k in self.__in_constraint:
+            # every use in a constraint shares the same copy
+            self.save_auxiliary(node.shape)
+            newval = self.__in_constraint[k]
+        elif k in self.__variable_reference:
             # introduce new variable
             new_var = self.create_variable(node.shape)
             newval = new_var.value
@@ -47,13 +76,10 @@ class SSALikeMixin(VariableCreatorMixin):
 
             self.__variable_reference[k] = new_var
         else:
-            if not self.__is_objective:
-                self.__variable_reference[k] = node
+            self.__variable_reference[k] = node
             newval = k
 
-        if n == 1:
-            lineq = {newval: ConstantCoeff(1)}
-        else:
-            lineq = {newval: EyeCoeff(n, ConstantCoeff(1))}
+        if not (self.__is_adding_new_var or self.__is_objective):
+            self.__in_constraint[k] = newval
 
-        self.expr_stack.append(lineq)
+        self.expr_stack.append(OrderedDict([(newval, coeff)]))
@@ -1,8 +1,15 @@
 """
 Mixin for creating new variables in the code generator.
+
+The new variables are auxiliary: each one is tied to an expression by an
+equality row, and structurally identical expressions share a single
+auxiliary variable. The rows and columns saved by the sharing are counted in
+`auxiliary_saved`.
 """
+from collections import OrderedDict
 
 from .. ast.expressions import expression
+from .. ast import SOCP
 from .. properties import shape
 from .. codegens.base_codegen import CodegenVariable
 
@@ -11,10 +18,16 @@ class VariableCreatorMixin(object):
     """
     def __init__(self, *args, **kwargs):
         super(VariableCreatorMixin, self).__init__(*args, **kwargs)
+        # the auxiliary variables, keyed by the expression they stand for
+        self.auxiliary = OrderedDict()
+        self.auxiliary_saved = {'rows': 0, 'cols': 0}
 
     def create_variable(self, shape):
         size = shape.size(abstractdim_rewriter=self.abstractdim_rewriter)
         v = expression.Variable('', shape)
+        # the variable belongs to this codegen, not to the program (or the
+        # next codegen of the program would give it a column too)
+        SOCP.new_variables.pop(v.value, None)
 
         # add it to the list of lookups for building constraints
         # doesn't matter that it's at the end, since it's only for eq
@@ -23,3 +36,21 @@ class VariableCreatorMixin(object):
         self.num_vars += size
 
         return v
+
+    def save_auxiliary(self, shape):
+        """ Counts the rows and columns saved by reusing an auxiliary variable
+            of the given shape.
+        """
+        size = shape.size(abstractdim_rewriter=self.abstractdim_rewriter)
+        self.auxiliary_saved['rows'] += size
+        self.auxiliary_saved['cols'] += size
+
+    def auxiliary_variable(self, key, shape):
+        """ The auxiliary variable for the expression `key` (a string), and
+            whether it is new (and so still has to be tied to the expression).
+        """
+        if key in self.auxiliary:
+            self.save_auxiliary(shape)
+            return self.auxiliary[key], False
+        self.auxiliary[key] = self.create_variable(shape)
+        return self.auxiliary[key], True
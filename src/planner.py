@@ -0,0 +1,205 @@
+""" The planner chooses between the rewriting strategies (the codegen mixins)
+    by the size of the SOCP each one produces.
+
+    For a canonicalized problem with its dims set, every strategy is dry-run
+    (on a copy of the problem, without generating any code) to predict the
+    number of variables n, the number of cone rows m, the number of
+    equalities p, the number of second-order cones, and the nonzeros of G and
+    A. The strategies are then ranked by a cost model; the default is
+    `kkt_cost`, but any function of the predicted sizes can be used.
+
+        plan = p.plan({'m': 100, 'n': 50})
+        print plan
+        p.codegen("C", strategy=plan.best)
+"""
+import copy, re
+from collections import OrderedDict
+
+from . ast import SOCP
+from . codegens import PythonCodegen
+from . mixins import RestrictedMultiplyMixin, SSALikeMixin, SmithFormMixin, \
+    FixedConeMixin
+from . properties.abstract_dim import AbstractDim
+from . exceptions import QCMLException, StrategyNotApplicable
+
+# the strategies, as (mixin, codegen options)
+STRATEGIES = OrderedDict([
+    ('default',             (None, {})),
+    ('restricted_multiply', (RestrictedMultiplyMixin, {})),
+    ('ssa',                 (SSALikeMixin, {})),
+    ('smith',               (SmithFormMixin, {})),
+    ('fixed_cone',          (FixedConeMixin, {})),
+])
+
+SIZES = ['n', 'm', 'p', 'cones', 'nnz(G)', 'nnz(A)']
+
+def strategy_codegen(codegen_class, strategy):
+    """ The codegen class using the rewriting `strategy`, and its options.
+    """
+    try:
+        mixin, options = STRATEGIES[strategy]
+    except KeyError:
+        raise QCMLException("QCML plan: Invalid strategy. Must be one of: %s" % ', '.join(STRATEGIES))
+    if mixin is None:
+        return codegen_class, {}
+    name = "%s%s" % (mixin.__name__.replace("Mixin", ""), codegen_class.__name__)
+    return type(name, (mixin, codegen_class), {}), dict(options)
+
+def kkt_cost(size):
+    """ The default cost model: the nonzeros in (the upper triangle of) the
+        KKT matrix an interior-point solver like ECOS factors, i.e.,
+
+            [ 0  A'  G' ]
+            [ A  0   0  ]
+            [ G  0  -W  ]
+
+        where the scaling W of a second-order cone of size q is expanded
+        into a diagonal and two extra columns (of length q).
+    """
+    socs = size['m'] - size['l']
+    return size['n'] + size['p'] + size['m'] + size['nnz(G)'] + size['nnz(A)'] \
+        + 2 * (socs + size['cones'])
+
+def parameter_nnz(program, nnz=None):
+    """ The nonzeros of the matrix parameters of `program`, from the dict
+        `nnz`, or as many as their shape allows.
+    """
+    nnz = dict(nnz or {})
+    for k, v in program.parameters.iteritems():
+        if k not in nnz:
+            rows, cols = int(v.shape.row), int(v.shape.col)
+            nnz[k] = rows if v.structure == 'diagonal' else rows * cols
+    return nnz
+
+# the tokens of the string form of an AbstractDim: numbers, names (possibly
+# `nnz(A)`), operators, and parentheses
+TOKENS = re.compile(r"\s*(-?\d+|\w+\(\w+\)|\w+|[-+*/()])")
+
+def evaluate(dim, nnz):
+    """ The number of the (possibly abstract) dimension `dim`, whose terms
+        may contain the nonzeros of parameters, e.g., `16 + nnz(A)` or
+        `(2 + nnz(A)) * (1 + nnz(B))`.
+
+        Each abstract term of `dim` is read back from its string form (the
+        products and quotients of abstract dims are only kept as strings),
+        with the numbers in `nnz` substituted for the `nnz(...)` names.
+    """
+    if not isinstance(dim, AbstractDim):
+        return int(dim)
+
+    def name(token):
+        match = re.match(r"^nnz\((\w+)\)$", token)
+        if not match:
+            # only the abstract dims are left, so they must be set
+            raise QCMLException("QCML plan: Cannot evaluate '%s'; set the dims first" % token)
+        if match.group(1) not in nnz:
+            raise QCMLException("QCML plan: Unknown number of nonzeros of '%s'" % match.group(1))
+        return nnz[match.group(1)]
+
+    def term(key):
+        if key == 1: return 1
+        tokens = TOKENS.findall(key)
+        if ''.join(tokens) != key.replace(' ', ''):
+            raise QCMLException("QCML plan: Cannot evaluate '%s'" % key)
+        # a sum of products (and quotients) of factors, which are numbers,
+        # names, or parenthesized sums; as built by AbstractDim.__str__,
+        # __mul__, and __div__
+        def read_sum(i):
+            value, i = read_product(i)
+            while i < len(tokens) and tokens[i] == '+':
+                right, i = read_product(i + 1)
+                value += right
+            return value, i
+        def read_product(i):
+            value, i = read_factor(i)
+            while i < len(tokens) and tokens[i] in ('*', '/'):
+                op = tokens[i]
+                right, i = read_factor(i + 1)
+                value = value * right if op == '*' else value / right
+            return value, i
+        def read_factor(i):
+            if i >= len(tokens):
+                raise QCMLException("QCML plan: Cannot evaluate '%s'" % key)
+            token = tokens[i]
+            if token == '(':
+                value, i = read_sum(i + 1)
+                if i >= len(tokens) or tokens[i] != ')':
+                    raise QCMLException("QCML plan: Cannot evaluate '%s'" % key)
+                return value, i + 1
+            if re.match(r"^-?\d+$", token): return int(token), i + 1
+            if token in ('+', '-', '*', '/', ')'):
+                raise QCMLException("QCML plan: Cannot evaluate '%s'" % key)
+            return name(token), i + 1
+        value, i = read_sum(0)
+        if i != len(tokens):
+            raise QCMLException("QCML plan: Cannot evaluate '%s'" % key)
+        return value
+    return sum(dim._c[k] * term(k) for k in dim.nzkeys())
+
+def predict(program, strategy, nnz):
+    """ The sizes of the SOCP `strategy` produces for `program`.
+    """
+    codegen_class, options = strategy_codegen(PythonCodegen, strategy)
+    # the strategies may modify the problem and number new variables
+    count = SOCP.count
+    try:
+        codegen = codegen_class(**options)
+        codegen.visit(copy.deepcopy(program))
+    finally:
+        SOCP.count = count
+
+    return {
+        'n': evaluate(codegen.num_vars, nnz),
+        'm': evaluate(codegen.num_lps + codegen.num_conic, nnz),
+        'p': evaluate(codegen.num_lineqs, nnz),
+        'l': evaluate(codegen.num_lps, nnz),
+        'cones': sum(evaluate(num, nnz) for num, _ in codegen.cone_list),
+        'nnz(G)': evaluate(codegen.nnz_bounds['G'], nnz),
+        'nnz(A)': evaluate(codegen.nnz_bounds['A'], nnz),
+    }
+
+class Plan(object):
+    """ The predicted sizes and costs of the rewriting strategies for a
+        problem, and the cheapest strategy, `best`.
+
+        Printing a plan shows the comparison.
+    """
+    def __init__(self, sizes, costs, failures):
+        self.sizes = sizes          # strategy -> predicted sizes
+        self.costs = costs          # strategy -> cost
+        self.failures = failures    # strategy -> why it does not apply
+        self.best = min(costs, key=lambda k: costs[k])
+
+    def __str__(self):
+        # the best strategy is marked in the first column
+        lines = ["  %-20s %s %10s" % ("strategy", ' '.join("%8s" % k for k in SIZES), "cost")]
+        for k, size in self.sizes.iteritems():
+            lines.append("%s %-20s %s %10s" % ("*" if k == self.best else " ", k,
+                ' '.join("%8d" % size[s] for s in SIZES), self.costs[k]))
+        for k, reason in self.failures.iteritems():
+            lines.append("  %-20s not applicable: %s" % (k, reason))
+        return '\n'.join(lines)
+
+def plan(program, nnz=None, cost=kkt_cost, strategies=None):
+    """ Dry-runs the `strategies` (all of them by default) on the
+        canonicalized `program`, whose dims must be set, and ranks them by
+        `cost`.
+
+        The dict `nnz` gives the nonzeros of the sparse matrix parameters;
+        they are assumed to be dense otherwise.
+    """
+    if program.abstract_dims:
+        raise QCMLException("QCML plan: The dims %s must be set" % ', '.join(program.abstract_dims))
+    nnz = parameter_nnz(program, nnz)
+
+    sizes, costs, failures = OrderedDict(), OrderedDict(), OrderedDict()
+    for strategy in strategies or STRATEGIES:
+        try:
+            sizes[strategy] = predict(program, strategy, nnz)
+        except StrategyNotApplicable as e:
+            failures[strategy] = str(e)
+        else:
+            costs[strategy] = cost(sizes[strategy])
+    if not costs:
+        raise QCMLException("QCML plan: None of the strategies apply")
+    return Plan(sizes, costs, failures)
@@ -1,8 +1,15 @@
 import collections
+import weakref
+
+# the most results of arithmetic between AbstractDims that are remembered
+RESULTS_LIMIT = 10000
 
 def list_product(l):
     """ Take a list and return an AD by multiplying list elements together.
     """
+    if all(isinstance(x, AbstractDim) and x.concrete for x in l):
+        # only numbers; skip the intermediate ADs
+        return AbstractDim(reduce(lambda x,y: x * y._value, l, 1))
     return reduce(lambda x,y: x * y, l, AbstractDim(1))
 
 
@@ -15,6 +22,12 @@ class AbstractDim(object):
         The key 1 is used for constant terms.  All other keys should be strs
         representing abstract terms.
 
+        Instances are immutable and interned: equal ADs are the same object,
+        with their hash and string form computed once, and the results of
+        arithmetic between them are remembered (up to RESULTS_LIMIT of
+        them). Only the live instances are interned, so unused ADs are
+        freed.
+
         Designed to have reasonable arithmetic operations with plain ints.
         Didn't bother to worry about Python2 long type.  Doesn't currently deal
         with floats.
@@ -28,22 +41,61 @@ class AbstractDim(object):
         that were needed to get codegen to run on example problems.  So there
         may be things missing for general case.
     """
-    def __init__(self, *args, **kwargs):
-        self._c = collections.Counter(kwargs)
+    # the (live) instances, by their nonzero terms; equal dims are the same
+    # object
+    _interned = weakref.WeakValueDictionary()
+    # the (live) instances made from a single int or str
+    _simple = weakref.WeakValueDictionary()
+    # the results of arithmetic between instances, by (op, left, right); it is
+    # emptied when it holds RESULTS_LIMIT of them
+    _results = {}
+
+    def __new__(cls, *args, **kwargs):
+        if len(args) == 1 and not kwargs and type(args[0]) in (int, str):
+            simple = cls._simple.get(args[0])
+            if simple is not None: return simple
+
+        c = collections.Counter(kwargs)
         for a in args:
-            if   isinstance(a, dict): self._c.update(a)
-            elif isinstance(a, int):  self._c.update({1:a})
-            elif isinstance(a, str):  self._c.update([a])
-            else:                     self._c.update(a)
+            if   isinstance(a, dict): c.update(a)
+            elif isinstance(a, int):  c.update({1:a})
+            elif isinstance(a, str):  c.update([a])
+            else:                     c.update(a)
+        terms = frozenset((k, v) for k, v in c.iteritems() if v != 0)
+
+        self = cls._interned.get(terms)
+        if self is None:
+            self = super(AbstractDim, cls).__new__(cls)
+            self._c = collections.Counter(dict(terms))
+            self._terms = terms
+            self._concrete = not terms or (len(terms) == 1 and 1 in self._c)
+            self._value = self._c[1] if self._concrete else None
+            self._hash = hash(self._value) if self._concrete else hash(terms)
+            self._str = None
+            cls._interned[terms] = self
+        if len(args) == 1 and not kwargs and type(args[0]) in (int, str):
+            cls._simple[args[0]] = self
+        return self
+
+    # instances are immutable, so copies are the instance itself
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (AbstractDim, (dict(self._terms),))
+
+    def __hash__(self):
+        return self._hash
 
     @property
     def concrete(self):
         """ AD is concrete means it can be converted into an int, i.e. it has
             no abstract part with nonzero coefficients.
         """
-        nzkeys = self.nzkeys()
-        if len(nzkeys) == 0: return True
-        return len(nzkeys) == 1 and self._c[1] != 0
+        return self._concrete
 
     def keys(self):
         return self._c.keys()
@@ -57,11 +109,14 @@ class AbstractDim(object):
         """ Protect with parentheses if more than one term.  Don't bother to
             print terms with coefficient == 0
         """
-        printkeys = self.nzkeys()
-        if not printkeys: return "0"
-        ret = ' + '.join(map(self._str_term, sorted(printkeys)))
-        if len(printkeys) < 2: return ret
-        return "(%s)" % ret
+        if self._str is None:
+            printkeys = self.nzkeys()
+            if not printkeys:
+                self._str = "0"
+            else:
+                ret = ' + '.join(map(self._str_term, sorted(printkeys)))
+                self._str = ret if len(printkeys) < 2 else "(%s)" % ret
+        return self._str
 
     def _str_term(self, key):
         """ Format single term nicely
@@ -72,11 +127,10 @@ class AbstractDim(object):
         return "%d*%s" % (self._c[key], key)
 
     def __int__(self):
-        if self.concrete: return self._c[1]
-        return None
+        return self._value
 
     def __float__(self):
-        if self.concrete: return float(self._c[1])
+        if self.concrete: return float(self._value)
         return None
 
     def __eq__(self, other):
@@ -84,78 +138,61 @@ class AbstractDim(object):
             == 1 or == -1 to allow simplifications.  So we want to be able to
             have AbstractDim(1) == 1 -> True
         """
-        if not isinstance(other, (AbstractDim, int)):
-            return NotImplemented
         if isinstance(other, AbstractDim):
-            return self._c == other._c
-        if isinstance(other, int) and self.concrete:
-            return int(self) == other
-        return False
+            return self is other
+        if isinstance(other, int):
+            return self.concrete and self._value == other
+        return NotImplemented
 
-    def __mul__(self, other):
-        if not isinstance(other, (AbstractDim, int)):
-            return NotImplemented
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented: return result
+        return not result
 
-        if isinstance(other, int):
-            if self.concrete: return int(self) * other
-            return self * AbstractDim(other)
-
-        if self.concrete:
-            mul = AbstractDim()
-            for k,v in other._c.iteritems(): mul._c[k] = int(self)*v
-            return mul
-        if other.concrete:
-            mul = AbstractDim()
-            for k,v in self._c.iteritems(): mul._c[k] = other._c[1]*v
-            return mul
-        ops = sorted([str(self), str(other)])
-        mulkey = "%s * %s" % (ops[0], ops[1])
-        return AbstractDim(mulkey)
+    def _result(self, op, other):
+        """ The result of self op other, for AbstractDims; they are
+            immutable, so it is only computed once.
+        """
+        key = (op, self, other)
+        result = AbstractDim._results.get(key)
+        if result is None:
+            result = op(self, other)
+            if len(AbstractDim._results) >= RESULTS_LIMIT:
+                AbstractDim._results.clear()
+            AbstractDim._results[key] = result
+        return result
 
-    def __div__(self, other):
-        if not isinstance(other, (AbstractDim, int)):
+    def __mul__(self, other):
+        if isinstance(other, int):
+            if self.concrete: return self._value * other
+            other = AbstractDim(other)
+        elif not isinstance(other, AbstractDim):
             return NotImplemented
+        return self._result(_mul, other)
 
+    def __div__(self, other):
         if isinstance(other, int):
-            if self.concrete:
-                return int(self) / other
-            return self / AbstractDim(other)
-
-        if self.concrete:
-            div = AbstractDim()
-            for k,v in other._c.iteritems(): div._c[k] = int(self)/v
-            return div
-        if other.concrete:
-            div = AbstractDim()
-            for k,v in self._c.iteritems(): div._c[k] = v/other._c[1]
-            return div
-        divkey = "%s / %s" % (self, other)
-        return AbstractDim(divkey)
-
-
-    def __add__(self, other):
-        if not isinstance(other, (AbstractDim, int)):
+            if self.concrete: return self._value / other
+            other = AbstractDim(other)
+        elif not isinstance(other, AbstractDim):
             return NotImplemented
+        return self._result(_div, other)
 
+    def __add__(self, other):
         if isinstance(other, int):
-            if self.concrete:
-                return int(self) + other
-            return self + AbstractDim(other)
-
-        return AbstractDim(self._c + other._c)
-
-    def __sub__(self, other):
-        if not isinstance(other, (AbstractDim, int)):
+            if self.concrete: return self._value + other
+            other = AbstractDim(other)
+        elif not isinstance(other, AbstractDim):
             return NotImplemented
+        return self._result(_add, other)
 
+    def __sub__(self, other):
         if isinstance(other, int):
-            if self.concrete:
-                return int(self) - other
-            return self - AbstractDim(other)
-
-        sub = self._c.copy()
-        sub.subtract(other._c)
-        return AbstractDim(sub)
+            if self.concrete: return self._value - other
+            other = AbstractDim(other)
+        elif not isinstance(other, AbstractDim):
+            return NotImplemented
+        return self._result(_sub, other)
 
     def __radd__(self, other):
         return self + other
@@ -163,5 +200,31 @@ class AbstractDim(object):
     def __rmul__(self, other):
         return self * other
 
+# the arithmetic between ADs, for AbstractDim._result
+def _mul(a, b):
+    if a.concrete:
+        return AbstractDim(dict((k, a._value*v) for k,v in b._c.iteritems()))
+    if b.concrete:
+        return AbstractDim(dict((k, b._value*v) for k,v in a._c.iteritems()))
+    ops = sorted([str(a), str(b)])
+    mulkey = "%s * %s" % (ops[0], ops[1])
+    return AbstractDim(mulkey)
+
+def _div(a, b):
+    if a.concrete:
+        return AbstractDim(dict((k, a._value/v) for k,v in b._c.iteritems()))
+    if b.concrete:
+        return AbstractDim(dict((k, v/b._value) for k,v in a._c.iteritems()))
+    divkey = "%s / %s" % (a, b)
+    return AbstractDim(divkey)
+
+def _add(a, b):
+    return AbstractDim(a._c + b._c)
+
+def _sub(a, b):
+    sub = a._c.copy()
+    sub.subtract(b._c)
+    return AbstractDim(sub)
+
 if __name__ == "__main__":
     print list_product([5, 'a'])
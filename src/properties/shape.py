@@ -76,6 +76,16 @@ class Shape(object):
         self._assign_col()
 
 
+    @property
+    def dimensions(self):
+        return self._dimensions
+
+    @dimensions.setter
+    def dimensions(self, dimensions):
+        self._dimensions = dimensions
+        # the sizes computed by size(), by the rewriter
+        self._sizes = {}
+
     # FIXME: _assign_row, _assign_col, _check_instantiation could all be put
     # inside a dimensions setter
     def _assign_row(self):
@@ -97,16 +107,24 @@ class Shape(object):
             Additionally, abstract string dimension names can be rewritten
             (usually for consistency with a particular codegen).  See
             Codegen.abstractdim_rewriter for examples.
+
+            The size is computed once per rewriter (until the dimensions are
+            changed, e.g., by eval).
         """
-        dims = self.dimensions
-        if abstractdim_rewriter:
-            # Only apply it to dims that are still abstract
-            def adrw(x):
-                if not x.concrete:
-                    return abstract_dim.AbstractDim(abstractdim_rewriter(str(x)))
-                return x
-            dims = map(adrw, dims)
-        return abstract_dim.list_product(dims)
+        # the rewriters are functions of the dimension name only (a bound
+        # method is remembered by its function, so the codegen isn't kept)
+        key = getattr(abstractdim_rewriter, '__func__', abstractdim_rewriter)
+        if key not in self._sizes:
+            dims = self.dimensions
+            if abstractdim_rewriter:
+                # Only apply it to dims that are still abstract
+                def adrw(x):
+                    if not x.concrete:
+                        return abstract_dim.AbstractDim(abstractdim_rewriter(str(x)))
+                    return x
+                dims = map(adrw, dims)
+            self._sizes[key] = abstract_dim.list_product(dims)
+        return self._sizes[key]
 
     def __str__(self):
         if isscalar(self): return "Scalar()"
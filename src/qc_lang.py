@@ -2,8 +2,13 @@ from . qc_parser import QCParser
 from . codegens import PythonCodegen, \
     MatlabCodegen, \
     C_Codegen, \
-    PythonOperatorCodegen
+    CtypesCodegen, \
+    C_OperatorCodegen, \
+    CtypesOperatorCodegen, \
+    PythonOperatorCodegen, \
+    PythonQPCodegen
 from . helpers import profile, default_locals
+from . import planner
 from . exceptions import DCPError, QCMLException
 from . ast.expressions import Variable
 from . ast import NodeVisitor
@@ -13,8 +18,12 @@ PARSE, CANONICALIZE, CODEGEN, COMPLETE = range(4)
 
 SUPPORTED_LANGUAGES = {
     "C": C_Codegen,
+    "ctypes": CtypesCodegen,
     "python": PythonCodegen,
     "operator": PythonOperatorCodegen,
+    "qp": PythonQPCodegen,
+    "C_operator": C_OperatorCodegen,
+    "ctypes_operator": CtypesOperatorCodegen,
     "matlab": MatlabCodegen
 }
 
@@ -41,6 +50,22 @@ class QCML(object):
     def socp2prob(self):
         return self.__codegen.socp2prob
 
+    @property
+    def socp_norms(self):
+        return self.__codegen.socp_norms
+
+    @property
+    def nnz_bounds(self):
+        """ Upper bounds on the nonzeros of G and A, known after codegen, as
+            formulas in the abstract dims and the nonzeros of the sparse
+            parameters, e.g., {'G': nnz(A) + n, 'A': n}.
+
+            They are only reported (e.g., for the planner); the generated
+            code allocates G and A from the exact nonzeros of the parameters
+            it is given.
+        """
+        return self.__codegen.nnz_bounds
+
     @profile
     def parse(self, text):
         """ Parse state enum.
@@ -58,16 +83,65 @@ class QCML(object):
         self.state = CANONICALIZE
 
     @profile
-    def canonicalize(self):
+    def canonicalize(self, quadratic = False):
+        """ Rewrites the problem into an SOCP.
+
+            If `quadratic`, the convex quadratic terms of the objective (e.g.,
+            square(norm(A*x - b))) are kept as quadratic forms instead, for
+            the "qp" code generator.
+        """
         if self.state > CANONICALIZE: return
         if self.state is PARSE:
             raise QCMLException("QCML canonicalize: No problem currently parsed.")
 
-        self.program.canonicalize()
+        self.program.canonicalize(quadratic)
+        if self.debug:
+            self.program.show(buf=sys.stdout)
+        self.state = CODEGEN
+
+    @profile
+    def presolve(self):
+        """ Simplifies the canonicalized problem before codegen.
+
+            Variables defined by the equalities of the problem (other than
+            user variables that are not aliases of another variable) are
+            substituted away, and
+            redundant linear constraints are dropped or merged. The solution
+            still contains every user variable.
+        """
+        if self.state is PARSE:
+            raise QCMLException("QCML presolve: No problem currently parsed.")
+        self.canonicalize()
+
+        self.program.presolve()
         if self.debug:
             self.program.show(buf=sys.stdout)
+        # any generated code is out of date
         self.state = CODEGEN
 
+    @profile
+    def plan(self, dims=None, nnz=None, cost=None):
+        """ Predicts the size of the SOCP each rewriting strategy produces
+            and picks the cheapest one by `cost` (see `planner.kkt_cost`).
+
+            The `dims` are set first, if given; they must all be set. The
+            dict `nnz` gives the nonzeros of sparse matrix parameters, which
+            are assumed to be dense otherwise. The best strategy is in the
+            `best` attribute of the returned plan, and can be passed on to
+            `codegen`.
+        """
+        if self.state is PARSE:
+            raise QCMLException("QCML plan: No problem currently parsed.")
+        self.canonicalize()
+        if dims is not None:
+            self.dims = dims
+
+        result = planner.plan(self.program, nnz, cost or planner.kkt_cost)
+        if self.debug:
+            print result
+            print
+        return result
+
     @property
     def dims(self):
         return self.program.dimensions
@@ -83,7 +157,19 @@ class QCML(object):
             self.state = CODEGEN
 
     @profile
-    def codegen(self, language="python"):
+    def codegen(self, language="python", frozen_params=None, strategy=None, **kwargs):
+        """ Generates code in the target `language`.
+
+            The parameters in the dict `frozen_params` are frozen to the given
+            values, which are folded into the generated code; they are no
+            longer passed to prob2socp.
+
+            The rewriting `strategy` is one of `planner.STRATEGIES`, e.g., the
+            `best` one of a `plan`.
+
+            Any other keyword arguments are passed on to the code generator as
+            options, e.g., `codegen("C", openmp=True)`.
+        """
         if self.state is COMPLETE:
             self.state = CODEGEN
         if self.state is PARSE:
@@ -96,7 +182,16 @@ class QCML(object):
         except KeyError:
             raise QCMLException("QCML codegen: Invalid code generator. Must be one of: ", SUPPORTED_LANGUAGES.keys())
         else:
-            self.__codegen = codegen_class()
+            if strategy is not None:
+                codegen_class, options = planner.strategy_codegen(codegen_class, strategy)
+                options.update(kwargs)
+                kwargs = options
+            self.__codegen = codegen_class(**kwargs)
+            if frozen_params:
+                unknown = [k for k in frozen_params if k not in self.program.parameters]
+                if unknown:
+                    raise QCMLException("QCML codegen: Cannot freeze unknown parameters: %s" % ', '.join(unknown))
+                self.__codegen.freeze(frozen_params)
             self.__codegen.visit(self.program)
 
         # generate the prob2socp and socp2prob functions
@@ -107,17 +202,25 @@ class QCML(object):
             print
             print self.socp2prob.numbered_source
             print
+        if self.debug:
+            print "nnz(G) <= %(G)s, nnz(A) <= %(A)s" % self.nnz_bounds
+            if hasattr(self.__codegen, 'auxiliary_saved'):
+                print "auxiliary variables saved %(rows)s rows and %(cols)s columns" % self.__codegen.auxiliary_saved
+            print
 
         self.state = COMPLETE
         self.language = language    # set our language
 
     @profile
-    def save(self, name = "problem"):
+    def save(self, name = "problem", **kwargs):
         """
             Saves the generated code into a folder with name `name`.
+
+            Any keyword arguments are passed on to the code generator, e.g.,
+            `save("myprob", benchmark=True)` for the C code.
         """
         if self.state is COMPLETE:
-            self.__codegen.save(name)
+            self.__codegen.save(name, **kwargs)
         else:
             raise QCMLException("QCML save: No generated code to save.")
 
@@ -127,6 +230,8 @@ class QCML(object):
             raise QCMLException("QCML solver: Cannot execute code generated in %s" % self.language)
         if self.state is not COMPLETE:
             raise QCMLException("QCML solver: No python code currently generated.")
+        if self.__codegen.cone_layout != "interleaved":
+            raise QCMLException("QCML solver: ECOS requires the interleaved cone layout.")
 
         try:
             import ecos
@@ -135,8 +240,14 @@ class QCML(object):
 
         def solve_func(params, dims):
             data = self.prob2socp(params, dims)
+            # the scaling (if the data was equilibrated) is undone on recovery;
+            # the objective is not scaled
+            scaling = data.pop('scaling', None)
             sol = ecos.solve(**data)
-            result = self.socp2prob(sol['x'], sol['y'], sol['z'], dims)
+            if scaling is not None:
+                result = self.socp2prob(sol['x'], sol['y'], sol['z'], dims, scaling)
+            else:
+                result = self.socp2prob(sol['x'], sol['y'], sol['z'], dims)
             result['info'] = sol['info']
 
             # set the objective value
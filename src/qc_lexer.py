@@ -33,6 +33,9 @@ class QCLexer(object):
         ('negative', 'SIGN'),
         ('nonnegative', 'SIGN'),
         ('nonpositive', 'SIGN'),
+        ('diagonal', 'STRUCTURE'),
+        ('sparse', 'STRUCTURE'),
+        ('dense', 'STRUCTURE'),
         ('minimize', 'SENSE'),
         ('maximize', 'SENSE'),
         ('subject', 'SUBJ'),
@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 from ply import yacc
 
 from . exceptions import ParseError
@@ -6,7 +8,7 @@ from . ast.expressions import Number, Parameter, Variable, Sum, Transpose
 from . ast.atoms import atoms
 from . ast import SOCP, ProgramData, ProgramConstraints, ProgramObjective
 from . properties.sign import Neither, Positive, Negative
-from . properties.shape import Scalar, Shape, isscalar
+from . properties.shape import Scalar, Shape, isscalar, isvector, ismatrix
 
 # TODO: dimlist, arraylist, and idlist are all very similar
 # i would like to merge them.
@@ -43,9 +45,9 @@ class QCParser(object):
         self.tokens = self.lex.tokens
         self.parser = yacc.yacc(module = self)
 
-        self.decl_parameters = {}
-        self.decl_variables = {}
-        self.decl_dimensions = set()
+        self.decl_parameters = OrderedDict()
+        self.decl_variables = OrderedDict()
+        self.decl_dimensions = []
         self.decl_dual_variables = set()
 
         # while self.decl_parameters, self.decl_variables, and
@@ -126,6 +128,31 @@ class QCParser(object):
                 self._show_err(msg, lineno, lexpos)
                 raise ParseError(msg)
 
+    def _sign(self, keyword):
+        if keyword == 'positive' or keyword == 'nonnegative':
+            return Positive()
+        return Negative()
+
+    def _check_structure(self, name, shape, structure, lineno, lexpos):
+        # only matrices have a structure; diagonal ones must be square
+        if isvector(shape) or not ismatrix(shape):
+            msg = "'%s' is not a matrix, so it cannot be %s" % (name, structure)
+        elif structure == 'diagonal' and not shape.row == shape.col:
+            msg = "'%s' is not square, so it cannot be diagonal" % name
+        else:
+            return
+        self._show_err(msg, lineno, lexpos)
+        raise ParseError(msg)
+
+    def _program_data(self):
+        # the used dimensions, parameters, and variables in the order they
+        # were declared (not the order of their hashes), so that the layout
+        # of the generated code only depends on the problem
+        used = lambda decl, names: OrderedDict((k, decl[k]) for k in decl if k in names)
+        dimensions = OrderedDict.fromkeys(d for d in self.decl_dimensions if d in self.dimensions)
+        return ProgramData(list(dimensions), used(self.decl_parameters, self.parameters),
+            used(self.decl_variables, self.variables))
+
     # only a single objective allowed per program
     def p_program(self,p):
         '''program : statements objective statements
@@ -134,15 +161,13 @@ class QCParser(object):
         constraints = p[1]
         if len(p) > 3: constraints.extend(p[3])
         constr = ProgramConstraints(constraints)
-        data = ProgramData(self.dimensions, self.parameters, self.variables)
-        p[0] = SOCP(p[2], constr, data)
+        p[0] = SOCP(p[2], constr, self._program_data())
 
     def p_program_find(self,p):
         'program : statements'
         obj = ProgramObjective('find', Number(0))
         constr = ProgramConstraints(p[1])
-        data = ProgramData(self.dimensions, self.parameters, self.variables)
-        p[0] = SOCP(obj, constr, data)
+        p[0] = SOCP(obj, constr, self._program_data())
 
     def p_program_empty(self,p):
         'program : empty'
@@ -179,11 +204,11 @@ class QCParser(object):
     def p_create_dimension(self,p):
         'create : DIMENSION ID'
         self._check_if_defined(p[2], p.lineno(2), p.lexpos(2))
-        self.decl_dimensions.add(p[2])
+        self.decl_dimensions.append(p[2])
 
     def p_create_dimensions(self,p):
         'create : DIMENSIONS idlist'
-        self.decl_dimensions.update(p[2])
+        self.decl_dimensions.extend(p[2])
 
     def p_create_identifier(self,p):
         '''create : VARIABLE array
@@ -200,17 +225,29 @@ class QCParser(object):
                   | PARAMETERS arraylist
         '''
         if(p[1] == 'variables'):
-            self.decl_variables.update({name: Variable(name, shape) for (name,shape) in p[2]})
+            self.decl_variables.update((name, Variable(name, shape)) for (name,shape) in p[2])
         if(p[1] == 'parameters'):
-            self.decl_parameters.update({name: Parameter(name, shape, Neither()) for (name,shape) in p[2]})
+            self.decl_parameters.update((name, Parameter(name, shape, Neither())) for (name,shape) in p[2])
 
     def p_create_signed_identifier(self,p):
         'create : PARAMETER array SIGN'
         (name, shape) = p[2]
-        if p[3] == 'positive' or p[3] == 'nonnegative':
-            self.decl_parameters[name] = Parameter(name, shape, Positive())
+        self.decl_parameters[name] = Parameter(name, shape, self._sign(p[3]))
+
+    def p_create_structured_identifier(self,p):
+        '''create : PARAMETER array STRUCTURE
+                  | PARAMETER array SIGN STRUCTURE
+                  | PARAMETER array STRUCTURE SIGN
+        '''
+        (name, shape) = p[2]
+        if len(p) == 4:
+            structure, param_sign = p[3], Neither()
+        elif self.lex.reserved[p[3]] == 'SIGN':
+            structure, param_sign = p[4], self._sign(p[3])
         else:
-            self.decl_parameters[name] = Parameter(name, shape, Negative())
+            structure, param_sign = p[3], self._sign(p[4])
+        self._check_structure(name, shape, structure, p.lineno(3), p.lexpos(3))
+        self.decl_parameters[name] = Parameter(name, shape, param_sign, structure)
 
     def p_create_dual_variable(self, p):
         'create : DUAL VARIABLE ID'
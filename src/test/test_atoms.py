@@ -2,6 +2,7 @@
 # invokes CVXOPT and checks that objval is within tolerance to expected
 # constant value
 from .. import QCML
+from .. ast.constraints import SOCProd
 import numpy
 from nose.tools import assert_raises
 
@@ -36,6 +37,11 @@ convex_list = [
     ("pow_rat(4,4,2)", 16),
     ("pow_rat(8,4,3)", 16),
     ("pow_rat(8,4,4)", 8),
+    ("pow_rat(2,5,2)", 5.656854249492381),
+    ("pow_rat(8,5,3)", 32),
+    ("pow_rat(2,6,1)", 64),
+    ("pow_rat(4,6,2)", 64),
+    ("pow_rat(3,7,5)", 4.655536721746079),
     ("quad_over_lin(v, 2)", 4.5),
     ("square_over_lin(2,4)", 1),
     ("square(3)", 9)
@@ -44,6 +50,8 @@ convex_list = [
 concave_list = [
     ("geo_mean(4,1)", 2),
     ("geo_mean(2,2)", 2),
+    ("geo_mean(2,4,8)", 4),
+    ("geo_mean(1,2,4,8,16)", 4),
     ("min(3,4,-1)", -1),
     ("pow_rat(4,1,2)", 2),
     ("pow_rat(8,1,3)", 2),
@@ -51,7 +59,10 @@ concave_list = [
     ("pow_rat(8,2,3)", 4),
     ("pow_rat(4,2,4)", 2),
     ("pow_rat(16,3,4)",8),
-    ("sqrt(2)", 1.414213562373095)
+    ("sqrt(2)", 1.414213562373095),
+    ("pow_rat(32,3,5)", 8),
+    ("pow_rat(16,7,8)", 11.313708498984761),
+    ("pow_rat(5,2,7)", 1.583819608766579)
 ]
 
 # OOD tests
@@ -77,3 +88,88 @@ def test_atom():
     for obj, obj_val in concave_list:
         yield run_atom, concave_template, obj, obj_val
 
+
+# the atoms that are the max of some terms (abs, max, and so norm_inf and min)
+# need no epigraph in a <= constraint
+constrained_list = [
+    ("maximize sum(x)\nnorm_inf(x) <= 2", 6, 0),
+    ("maximize sum(x)\nabs(x) <= 3 + v", 8, 0),
+    ("minimize sum(x)\nmax(abs(x), 1) <= 2", -6, 0),
+    ("maximize t\nmin(x) >= t\nx <= 1", 1, 0),
+    ("maximize sum(x)\nnorm_inf(x) <= t\nt <= 1", 3, 0),
+    # with more than one, the others keep their epigraph
+    ("maximize sum(x)\nabs(x) + abs(t) <= 1", 3, 2),
+]
+
+def run_constrained(prob, obj_val, new_variables):
+    p = QCML()
+    p.parse("""
+        parameter v(3)
+        variables x(3) t
+        %s
+    """ % prob)
+    p.canonicalize()
+    assert len(p.program.new_variables) == new_variables
+    solution = p.solve(params={'v': v})
+    assert( abs(solution['objval'] - obj_val) <= TOL )
+
+def test_constrained():
+    for prob, obj_val, new_variables in constrained_list:
+        yield run_constrained, prob, obj_val, new_variables
+
+def test_shared_epigraph():
+    p = QCML()
+    p.parse("""
+        variable x(3)
+        parameter v(3)
+        minimize norm1(x - v) + norm_inf(x - v) + sum(abs(x - v))
+    """)
+    p.canonicalize()
+    # abs(x - v) and the max of it
+    assert len(p.program.new_variables) == 2
+    solution = p.solve(params={'v': v})
+    assert( abs(solution['objval']) <= TOL )
+
+# the fewest 3-dimensional cones for the powers and geometric means
+cones_list = [
+    ("maximize pow_rat(x,1,3)", 2),
+    ("maximize pow_rat(x,3,4)", 2),
+    ("minimize pow_rat(x,4,3)", 2),
+    ("minimize pow_rat(x,5,2)", 3),
+    ("maximize pow_rat(x,1,7)", 3),
+    ("minimize pow_rat(x,9,2)", 4),
+    ("maximize geo_mean(x,y,z)", 3),
+    ("maximize geo_mean(x,y,z,x,y,z,x,y)", 7),
+]
+
+def count_cones(prob, cones):
+    p = QCML()
+    p.parse("""
+        variables x y z
+        %s
+    """ % prob)
+    p.canonicalize()
+    socs = [c for c in p.program.constraints.children() if isinstance(c, SOCProd)]
+    assert len(socs) == cones
+
+def test_cones():
+    for prob, cones in cones_list:
+        yield count_cones, prob, cones
+
+def geo_mean_cones(k, most):
+    names = ' '.join('x%d' % i for i in xrange(k))
+    p = QCML()
+    p.parse("""
+        variables %s
+        maximize geo_mean(%s)
+    """ % (names, ', '.join(names.split())))
+    p.canonicalize()
+    socs = [c for c in p.program.constraints.children() if isinstance(c, SOCProd)]
+    # a tree over k args has at least k - 1 cones
+    assert k - 1 <= len(socs) <= most
+
+def test_many_geo_mean_args():
+    # the balanced tree for 16 args is optimal; for 17 and 33 args, the search
+    # for the tree is capped (by SEARCH_LIMIT), so only bound the cones it finds
+    for k, most in [(16, 15), (17, 20), (33, 37)]:
+        yield geo_mean_cones, k, most
@@ -4,7 +4,7 @@ the function body is properly generated.
 
 Should be able to run generated Makefile without any errors (except warnings).
 """
-import os, shutil, subprocess
+import os, sys, shutil, subprocess
 
 from .. codegens import PythonCodegen, MatlabCodegen, C_Codegen, PythonOperatorCodegen
 from nose import with_setup
@@ -52,7 +52,7 @@ def test_codegen():
         yield codegen, gen
 
 def test_empty_python_prob2socp():
-    assert python.prob2socp.source == "def prob_to_socp(params, dims={}):\n    pass"
+    assert python.prob2socp.source == "def prob_to_socp(params, dims={}, cache=None):\n    pass"
 
 def test_empty_python_socp2prob():
     assert python.socp2prob.source == "def socp_to_prob(x, y, z, dims={}):\n    pass"
@@ -142,3 +142,663 @@ def test_parse_and_compiles():
     yield parse_and_generate, sq_norm, "matlab"
     yield parse_and_generate, sq_norm, "C"
     yield parse_and_generate, sq_norm, "operator"
+
+def c_compiles(prob, options):
+    from .. qc_lang import QCML
+    p = QCML(debug=True)
+    p.parse(prob)
+    p.canonicalize()
+    p.codegen("C", **options)
+    p.save("test_problem")
+    try:
+        with open(os.devnull, "w") as fnull:
+            subprocess.check_call(["make", "-C", "test_problem"], stdout=fnull, stderr=fnull)
+    except subprocess.CalledProcessError:
+        print "Generated C code with options %s unable to compile." % options
+        print p.prob2socp.source
+        assert False
+    finally:
+        shutil.rmtree("%s/test_problem" % os.getcwd())
+
+def test_openmp_compiles():
+    yield c_compiles, LP, {'openmp': True}
+    yield c_compiles, SOCP, {'openmp': True}
+    yield c_compiles, sq_norm, {'openmp': True}
+
+def test_int32_compiles():
+    yield c_compiles, LP, {'index_type': 'int32'}
+    yield c_compiles, SOCP, {'index_type': 'int32'}
+    yield c_compiles, sq_norm, {'index_type': 'int32'}
+
+def test_python_int32_indices():
+    import numpy as np
+    from .. qc_lang import QCML
+    from .. exceptions import QCMLException
+    from nose.tools import assert_raises
+
+    p = QCML()
+    p.parse(sq_norm)
+    p.canonicalize()
+    p.codegen("python")
+    expected = p.prob2socp({'h': 1.0})['G']
+    p.codegen("python", index_type="int32")
+    result = p.prob2socp({'h': 1.0})['G']
+    assert "dtype=np.int32" in p.prob2socp.source
+    assert abs(result - expected).sum() == 0
+    # the returned matrices have the index type (not the one scipy picks)
+    assert result.indices.dtype == np.int32 and result.indptr.dtype == np.int32
+    assert expected.indices.dtype == np.int64 and expected.indptr.dtype == np.int64
+
+    assert_raises(QCMLException, p.codegen, "python", index_type="int16")
+
+lasso = """
+dimensions m n
+variable x(n)
+parameters A(m,n) b(m)
+parameter gamma positive
+minimize (square(norm(A*x - b)) + gamma*norm1(x))
+sum(x) == 1
+"""
+
+def load_ctypes(p, name):
+    """ Saves the ctypes code generated by `p` to the folder `name`, builds
+        its library, and returns the loaded module. The folder is removed (the
+        library stays loaded, so each one needs its own name).
+    """
+    import imp
+    p.save(name)
+    try:
+        with open(os.devnull, "w") as fnull:
+            subprocess.check_call(["make", "-C", name, "lib%s.so" % name], stdout=fnull, stderr=fnull)
+        return imp.load_source(name, "%s/%s.py" % (name, name))
+    finally:
+        shutil.rmtree("%s/%s" % (os.getcwd(), name))
+
+def assert_same_socp(result, expected, tol=1e-12):
+    """ Checks that `result` is the SOCP data `expected` (with sparse
+        matrices). Matrices are compared entrywise; the matrix-free operators
+        (functions) are compared by applying them and their transposes, and
+        their row and column norms to those of the matrices.
+    """
+    import numpy as np
+    assert np.allclose(result['c'], expected['c'])
+    assert result['dims'] == expected['dims']
+    x = np.random.randn(expected['c'].shape[0])
+    for v, M in [('h', 'G'), ('b', 'A')]:
+        if expected[M] is None:
+            # (the operators are given even when they have no rows)
+            assert result[v] is None
+            assert result[M] is None or result[M](x).size == 0
+            continue
+        assert np.allclose(result[v], expected[v])
+        if callable(result[M]):
+            y = np.random.randn(expected[M].shape[0])
+            assert np.allclose(result[M](x), expected[M] * x)
+            assert np.allclose(result[M + 'T'](y), expected[M].T * y)
+        else:
+            assert abs(result[M] - expected[M]).sum() < tol
+    # the row and column norms of the operators
+    if 'norms' in result:
+        for ord in [2, np.inf]:
+            norms = result['norms'](ord)
+            for M in ['G', 'A']:
+                if expected[M] is None:
+                    assert norms[M] is None
+                    continue
+                dense = expected[M].toarray()
+                assert np.allclose(norms[M][0], np.linalg.norm(dense, ord, axis=1))
+                assert np.allclose(norms[M][1], np.linalg.norm(dense, ord, axis=0))
+
+def ctypes_matches_python(prob, name, params, dims, options={}):
+    from .. qc_lang import QCML
+    p = QCML()
+    p.parse(prob)
+    p.canonicalize()
+    p.codegen("python", **options)
+    expected = p.prob2socp(params, dims)
+    p.codegen("ctypes", **options)
+    result = load_ctypes(p, name).prob_to_socp(params, dims)
+    assert_same_socp(result, expected)
+
+def test_ctypes():
+    import numpy as np
+    import scipy.sparse as sp
+    np.random.seed(0)
+    yield ctypes_matches_python, LP, "test_ctypes_lp", {'c': 1.0, 'h': 2.0}, {}
+    yield ctypes_matches_python, SOCP, "test_ctypes_socp", {'c': 1.0, 'h': 2.0}, {}
+    yield ctypes_matches_python, lasso, "test_ctypes_lasso", \
+        {'A': sp.rand(10, 5, 0.5), 'b': np.random.randn(10), 'gamma': 0.5}, \
+        {'m': 10, 'n': 5}
+
+def test_ctypes_rebuilds():
+    import imp
+    import numpy as np
+    from .. qc_lang import QCML
+    name = "test_ctypes_rebuild"
+    params = {'c': 1.0, 'h': 2.0}
+    lib = "%s/lib%s.so" % (name, name)
+    try:
+        for prob in [LP, SOCP]:
+            p = QCML()
+            p.parse(prob)
+            p.canonicalize()
+            p.codegen("python")
+            expected = p.prob2socp(params, {})
+            p.codegen("ctypes")
+            p.save(name)
+            if os.path.exists(lib):
+                # the library of the previous problem is out of date
+                os.utime(lib, (0, 0))
+                module = imp.load_source(name, "%s/%s.py" % (name, name))
+                assert os.path.getmtime(lib) > 0
+                result = module.prob_to_socp(params, {})
+                assert abs(result['G'] - expected['G']).sum() < 1e-12
+            else:
+                with open(os.devnull, "w") as fnull:
+                    subprocess.check_call(["make", "-C", name, "lib%s.so" % name], stdout=fnull, stderr=fnull)
+    finally:
+        shutil.rmtree("%s/%s" % (os.getcwd(), name))
+
+def openmp_matches_serial(prob, name, params, dims):
+    from .. qc_lang import QCML
+    p = QCML()
+    p.parse(prob)
+    p.canonicalize()
+    results = []
+    for openmp, lib in [(False, name), (True, name + "_openmp")]:
+        p.codegen("ctypes", openmp=openmp)
+        results.append(load_ctypes(p, lib).prob_to_socp(params, dims))
+    serial, parallel = results
+    assert_same_socp(parallel, serial)
+
+def test_openmp_matches_serial():
+    import numpy as np
+    import scipy.sparse as sp
+    np.random.seed(0)
+    yield openmp_matches_serial, SOCP, "test_openmp_socp", {'c': 1.0, 'h': 2.0}, {}
+    yield openmp_matches_serial, lasso, "test_openmp_lasso", \
+        {'A': sp.rand(40, 20, 0.3), 'b': np.random.randn(40), 'gamma': 0.5}, \
+        {'m': 40, 'n': 20}
+
+cone_products = """
+dimensions n
+variables x(n) y(n)
+parameter c(n)
+minimize c'*x + sum(norm(x, y)) + sum(square(x))
+x + y <= 1
+norm(x) <= 3
+"""
+
+def test_cone_blocks():
+    import numpy as np
+    from .. qc_lang import QCML
+    from .. exceptions import QCMLException
+    from nose.tools import assert_raises
+    p = QCML()
+    p.parse(cone_products)
+    p.canonicalize()
+    params, dims = {'c': np.arange(4.0)}, {'n': 4}
+    p.codegen("python")
+    interleaved = p.prob2socp(params, dims)
+    cones = interleaved['dims']
+    assert sum(([k]*num for num, k in cones['q_blocks']), []) == cones['q']
+
+    p.codegen("python", cone_layout="blocked")
+    blocked = p.prob2socp(params, dims)
+    cones = blocked['dims']
+    assert 'q' not in cones and cones['layout'] == 'blocked'
+    # the row of the interleaved data for each row of the blocked data
+    rows = range(cones['l'])
+    for num, k in cones['q_blocks']:
+        start = len(rows)
+        rows += [start + i*k + j for j in range(k) for i in range(num)]
+    assert np.allclose(blocked['h'], interleaved['h'][rows])
+    assert abs(blocked['G'] - interleaved['G'][rows]).sum() == 0
+
+    assert_raises(QCMLException, p.codegen, "python", cone_layout="blocked", equilibrate=True)
+    assert_raises(QCMLException, p.codegen, "C", cone_layout="strided")
+
+def test_ctypes_cone_blocks():
+    import numpy as np
+    params, dims = {'c': np.arange(4.0)}, {'n': 4}
+    yield ctypes_matches_python, cone_products, "test_ctypes_cones", params, dims
+    yield ctypes_matches_python, cone_products, "test_ctypes_blocked", params, dims, \
+        {'cone_layout': 'blocked'}
+
+def benchmark_runs(prob, options={}):
+    from .. qc_lang import QCML
+    p = QCML()
+    p.parse(prob)
+    p.canonicalize()
+    p.codegen("C", **options)
+    p.save("test_problem", benchmark=True)
+    try:
+        with open(os.devnull, "w") as fnull:
+            subprocess.check_call(["make", "-C", "test_problem", "bench_test_problem"], stdout=fnull, stderr=fnull)
+        output = subprocess.check_output(["./test_problem/bench_test_problem", "2", "4", "3"])
+    except subprocess.CalledProcessError:
+        print "Generated C benchmark unable to compile or run."
+        assert False
+    finally:
+        shutil.rmtree("%s/test_problem" % os.getcwd())
+    assert "ns/call" in output
+
+def test_benchmark():
+    yield benchmark_runs, LP
+    yield benchmark_runs, SOCP
+    yield benchmark_runs, sq_norm
+    yield benchmark_runs, lasso
+    yield benchmark_runs, lasso, {'openmp': True}
+    yield benchmark_runs, lasso, {'equilibrate': True}
+
+# sums and products of parameters are evaluated in C (instead of introducing
+# new variables), so the C code must produce the same SOCP as the Python code
+parameter_expressions = [
+    """
+    variable x(n)
+    parameters A(m,n) B(m,n)
+    parameters c(m) d(m)
+    minimize 2*c'*A*x
+    x == B'*d
+    """,
+    """
+    variable x(n)
+    parameters A(m,n) B(m,n)
+    parameter c(m)
+    minimize norm(A*x + B*x - c)
+    """,
+    """
+    variable x(n)
+    parameters C(n,n) D(n,n)
+    parameter e(n)
+    minimize norm(C*D*x + x)
+    C*x + D*x <= e
+    """,
+    """
+    variable x(n)
+    parameter A(m,n)
+    parameter gamma
+    minimize norm(gamma*A*x) + sum(A*x)
+    """
+]
+
+def test_C_parameter_expressions():
+    import numpy as np
+    np.random.seed(0)
+    m, n = 40, 30
+    params = {'A': np.random.randn(m,n), 'B': np.random.randn(m,n),
+        'C': np.random.randn(n,n), 'D': np.random.randn(n,n),
+        'c': np.random.randn(m), 'd': np.random.randn(m),
+        'e': np.random.randn(n), 'gamma': 0.5}
+    for k, prob in enumerate(parameter_expressions):
+        yield ctypes_matches_python, "dimensions m n\n" + prob, \
+            "test_ctypes_expr%d" % k, params, {'m': m, 'n': n}
+
+def equilibrated_matches(prob, name, params, dims):
+    import numpy as np
+    from .. qc_lang import QCML
+    p = QCML()
+    p.parse(prob)
+    p.canonicalize()
+    p.codegen("python")
+    data = p.prob2socp(dict(params), dims)
+    p.codegen("python", equilibrate=True)
+    scaled = p.prob2socp(dict(params), dims)
+    D, F, E = [scaled['scaling'][k] for k in ('x', 'y', 'z')]
+
+    # G = E*G*D, A = F*A*D, h = E*h, b = F*b, and c = D*c
+    assert np.allclose(scaled['c'], D * data['c'])
+    for v, M, S in [('h', 'G', E), ('b', 'A', F)]:
+        if data[M] is not None:
+            assert np.allclose(scaled[v], S * data[v])
+            assert np.allclose(scaled[M].toarray(), S[:,None] * data[M].toarray() * D)
+    # the scaling is the same within each second-order cone
+    start = data['dims']['l']
+    for q in data['dims']['q']:
+        assert np.allclose(E[start:start+q], E[start])
+        start += q
+    # the variables are recovered from the scaled solution
+    x, y, z = np.random.randn(D.size), np.random.randn(F.size), np.random.randn(E.size)
+    expected = p.socp2prob(D * x, F * y, E * z, dims)
+    result = p.socp2prob(x, y, z, dims, scaled['scaling'])
+    for k in expected.keys():
+        assert np.allclose(result[k], expected[k])
+
+    # the C code computes the same scaling
+    p.codegen("ctypes", equilibrate=True)
+    result = load_ctypes(p, name).prob_to_socp(dict(params), dims)
+    for k in ('x', 'y', 'z'):
+        assert np.allclose(result['scaling'][k], scaled['scaling'][k])
+    assert_same_socp(result, scaled, tol=1e-9)
+
+def test_equilibrate():
+    import numpy as np
+    np.random.seed(0)
+    m, n = 6, 4
+    params = {'A': 10 ** np.random.randn(m, n), 'b': np.random.randn(m), 'gamma': 0.5}
+    yield equilibrated_matches, SOCP, "test_equilibrate_socp", {'c': 1.0, 'h': 2.0}, {}
+    yield equilibrated_matches, lasso, "test_equilibrate_lasso", params, {'m': m, 'n': n}
+
+def operator_matches_python(prob, params, dims):
+    import numpy as np
+    from .. qc_lang import QCML
+    p = QCML()
+    p.parse(prob)
+    p.canonicalize()
+    # the python codegen converts dense parameters to sparse ones in place
+    p.codegen("python")
+    expected = p.prob2socp(dict(params), dims)
+    norms = p.socp_norms
+    p.codegen("operator")
+    result = p.prob2socp(dict(params), dims)
+
+    # the row and column norms are computed from the blocks of G and A
+    for ord in [2, np.inf]:
+        expected_norms, result_norms = norms(expected, ord), p.socp_norms(result, ord)
+        for M in ['G', 'A']:
+            if expected[M] is None:
+                assert expected_norms[M] is None and result_norms[M] is None
+                continue
+            dense = expected[M].toarray()
+            assert np.allclose(expected_norms[M][0], np.linalg.norm(dense, ord, axis=1))
+            assert np.allclose(expected_norms[M][1], np.linalg.norm(dense, ord, axis=0))
+            assert np.allclose(result_norms[M][0], expected_norms[M][0])
+            assert np.allclose(result_norms[M][1], expected_norms[M][1])
+
+    n = expected['c'].shape[0]
+    x, X = np.random.randn(n), np.random.randn(n, 3)
+    for M in ['G', 'A']:
+        if expected[M] is None: continue
+        m = expected[M].shape[0]
+        y, Y = np.random.randn(m), np.random.randn(m, 3)
+        assert np.allclose(result[M](x), expected[M] * x)
+        assert np.allclose(result[M + 'T'](y), expected[M].T * y)
+
+        # blocks of vectors and the LinearOperator interface
+        op = result[M + 'op']
+        assert op.shape == (m, n)
+        assert np.allclose(result[M](X), expected[M] * X)
+        assert np.allclose(result[M + 'T'](Y), expected[M].T * Y)
+        assert np.allclose(op.matvec(x), expected[M] * x)
+        assert np.allclose(op.rmatvec(y), expected[M].T * y)
+        assert np.allclose(op.matmat(X), expected[M] * X)
+        assert np.allclose(op.rmatmat(Y), expected[M].T * Y)
+
+def test_operator():
+    import numpy as np
+    import scipy.sparse as sp
+    np.random.seed(0)
+    m, n = 40, 30
+    params = {'A': np.random.randn(m,n), 'B': np.random.randn(m,n),
+        'C': np.random.randn(n,n), 'D': np.random.randn(n,n),
+        'c': np.random.randn(m), 'd': np.random.randn(m),
+        'e': np.random.randn(n), 'gamma': 0.5}
+    yield operator_matches_python, SOCP, {'c': 1.0, 'h': 2.0}, {}
+    yield operator_matches_python, sq_norm, {'h': 2.0}, {}
+    yield operator_matches_python, lasso, \
+        {'A': sp.rand(10, 5, 0.5), 'b': np.random.randn(10), 'gamma': 0.5}, \
+        {'m': 10, 'n': 5}
+    for prob in parameter_expressions:
+        yield operator_matches_python, "dimensions m n\n" + prob, params, {'m': m, 'n': n}
+    # products of cones are stuffed with strided rows
+    yield operator_matches_python, """
+    dimensions m n
+    variable x(n)
+    parameters A(m,n) B(m,n)
+    minimize sum(norm(A*x, B*x)) + sum(square_over_lin(A*x, 1 + B*x))
+    """, params, {'m': m, 'n': n}
+
+def nnz_bounds_hold(prob, params, dims):
+    import numpy as np
+    import scipy.sparse as sp
+    from .. qc_lang import QCML
+    p = QCML()
+    p.parse(prob)
+    p.canonicalize()
+    p.codegen("python")
+    data = p.prob2socp(dict(params), dims)
+
+    # evaluate the formulas, e.g., "(2 + dims['n'] + nnz(A))"
+    scope = dict(params, dims=dims, nnz=lambda x: sp.coo_matrix(x).nnz)
+    for M in ('G', 'A'):
+        bound = eval(str(p.nnz_bounds[M]), scope)
+        nnz = 0 if data[M] is None else sp.coo_matrix(data[M]).nnz
+        assert nnz <= bound
+
+def test_nnz_bounds():
+    import numpy as np
+    import scipy.sparse as sp
+    np.random.seed(0)
+    m, n = 40, 30
+    params = {'A': np.random.randn(m,n), 'B': np.random.randn(m,n),
+        'C': np.random.randn(n,n), 'D': np.random.randn(n,n),
+        'c': np.random.randn(m), 'd': np.random.randn(m),
+        'e': np.random.randn(n), 'gamma': 0.5}
+    yield nnz_bounds_hold, SOCP, {'c': 1.0, 'h': 2.0}, {}
+    yield nnz_bounds_hold, sq_norm, {'h': 2.0}, {}
+    yield nnz_bounds_hold, lasso, \
+        {'A': sp.rand(10, 5, 0.5), 'b': np.random.randn(10), 'gamma': 0.5}, \
+        {'m': 10, 'n': 5}
+    for prob in parameter_expressions:
+        yield nnz_bounds_hold, "dimensions m n\n" + prob, params, {'m': m, 'n': n}
+    yield nnz_bounds_hold, """
+    dimensions m n
+    variable x(n)
+    parameters A(m,n) B(m,n)
+    minimize sum(norm(A*x, B*x)) + sum(square_over_lin(A*x, 1 + B*x))
+    """, params, {'m': m, 'n': n}
+
+def c_operator_matches_python(prob, name, params, dims):
+    from .. qc_lang import QCML
+    p = QCML()
+    p.parse(prob)
+    p.canonicalize()
+    p.codegen("python")
+    expected = p.prob2socp(dict(params), dims)
+    p.codegen("ctypes_operator")
+    assert_same_socp(load_ctypes(p, name).prob_to_socp(params, dims), expected)
+
+def test_C_operator():
+    import numpy as np
+    import scipy.sparse as sp
+    np.random.seed(0)
+    m, n = 40, 30
+    params = {'A': np.random.randn(m,n), 'B': np.random.randn(m,n),
+        'C': np.random.randn(n,n), 'D': np.random.randn(n,n),
+        'c': np.random.randn(m), 'd': np.random.randn(m),
+        'e': np.random.randn(n), 'gamma': 0.5}
+    yield c_operator_matches_python, SOCP, "test_c_operator_socp", {'c': 1.0, 'h': 2.0}, {}
+    yield c_operator_matches_python, lasso, "test_c_operator_lasso", \
+        {'A': sp.rand(10, 5, 0.5), 'b': np.random.randn(10), 'gamma': 0.5}, \
+        {'m': 10, 'n': 5}
+    for k, prob in enumerate(parameter_expressions):
+        yield c_operator_matches_python, "dimensions m n\n" + prob, \
+            "test_c_operator_expr%d" % k, params, {'m': m, 'n': n}
+    # products of cones are applied with strided rows
+    yield c_operator_matches_python, """
+    dimensions m n
+    variable x(n)
+    parameters A(m,n) B(m,n)
+    minimize sum(norm(A*x, B*x)) + sum(square_over_lin(A*x, 1 + B*x))
+    """, "test_c_operator_strided", params, {'m': m, 'n': n}
+
+# diagonal and dense parameters are stuffed without forming sparse matrices,
+# but must produce the same SOCP as their sparse counterparts
+structured = """
+dimensions m n
+variable x(n)
+variable z(m)
+parameter A(m,n) %s
+parameter D(n,n) %s
+parameters B(m,n) c(n)
+parameter gamma positive
+minimize norm(A*x) + gamma*sum(D*x) + c'*x + norm(2*A*x + B*x) + norm(D*x)
+D*x >= -1
+-3*A'*z <= c
+-A'*A*x == c
+"""
+
+def structured_matches_unstructured(language, name, params, dims, attributes=("dense", "diagonal"), frozen=[]):
+    """ Checks that the structured problem, with the `attributes` of A and D
+        and with the parameters `frozen` into the code, produces the same SOCP
+        as the problem with unstructured parameters.
+    """
+    import numpy as np
+    from .. qc_lang import QCML
+    p = QCML()
+    p.parse(structured % ("", ""))
+    p.canonicalize()
+    p.codegen("python")
+    expected = p.prob2socp(dict(params, D=np.diag(params['D'])), dims)
+
+    p = QCML()
+    p.parse(structured % attributes)
+    p.canonicalize()
+    p.dims = dims
+    p.codegen(language, frozen_params=dict((k, params[k]) for k in frozen))
+    # the frozen parameters are no longer inputs
+    assert not any("'%s' has shape" % k in p.prob2socp.source for k in frozen)
+    given = dict((k, v) for k, v in params.iteritems() if k not in frozen)
+    if language in ("ctypes", "ctypes_operator"):
+        result = load_ctypes(p, name).prob_to_socp(given, dims)
+    else:
+        result = p.prob2socp(given, dims)
+    assert_same_socp(result, expected)
+
+def test_structured_parameters():
+    import numpy as np
+    import scipy.sparse as sp
+    np.random.seed(0)
+    m, n = 5, 3
+    params = {'A': np.random.randn(m, n), 'D': np.random.rand(n) + 0.1,
+        'B': sp.rand(m, n, 0.5), 'c': np.random.randn(n), 'gamma': 2.0}
+    dims = {'m': m, 'n': n}
+    yield structured_matches_unstructured, "python", "", params, dims
+    yield structured_matches_unstructured, "operator", "", params, dims
+    yield structured_matches_unstructured, "ctypes", "test_structured", params, dims
+    yield structured_matches_unstructured, "ctypes_operator", "test_structured_operator", params, dims
+    yield benchmark_runs, structured % ("dense", "diagonal")
+
+def cached_matches_uncached(prob, language, params, dims):
+    import numpy as np
+    from .. qc_lang import QCML
+    from .. import invalidate
+    p = QCML()
+    p.parse(prob)
+    p.canonicalize()
+    p.codegen(language)
+    cache, given = {}, dict(params)
+    # the operators are functions, the matrices are sparse
+    apply = lambda M, x: M(x) if callable(M) else M * x
+    # the conversions must be redone for the parameters that changed
+    changed = dict(params, A=2*params['A'], gamma=1.5)
+    for values in [params, params, changed]:
+        expected = p.prob2socp(dict(values), dims)
+        result = p.prob2socp(values, dims, cache)
+        x = np.random.randn(expected['c'].shape[0])
+        assert np.allclose(result['c'], expected['c'])
+        for v, M in [('h', 'G'), ('b', 'A')]:
+            if expected[M] is None: continue
+            assert np.allclose(result[v], expected[v])
+            assert np.allclose(apply(result[M], x), apply(expected[M], x))
+    assert cache
+    # the caller's parameters are left alone
+    assert all(params[k] is given[k] for k in params)
+    # the cache holds one entry per conversion, however many calls are made
+    size = len(cache)
+    p.prob2socp(dict(params, A=params['A'].copy()), dims, cache)
+    assert len(cache) == size
+    # a parameter modified in place (in a single entry) is noticed, and its
+    # conversions can be dropped explicitly
+    changed['A'][-1, 1] += 100
+    expected = p.prob2socp(dict(changed), dims)
+    for drop in [False, True]:
+        if drop:
+            invalidate(cache, 'A')
+            assert not any('A' in names for names, _, _, _ in cache.values())
+        result = p.prob2socp(changed, dims, cache)
+        x = np.random.randn(expected['c'].shape[0])
+        for v, M in [('h', 'G'), ('b', 'A')]:
+            if expected[M] is None: continue
+            assert np.allclose(result[v], expected[v])
+            assert np.allclose(apply(result[M], x), apply(expected[M], x))
+
+def test_conversion_cache():
+    import numpy as np
+    np.random.seed(0)
+    m, n = 40, 30
+    params = {'A': np.random.randn(m,n), 'B': np.random.randn(m,n),
+        'C': np.random.randn(n,n), 'D': np.random.randn(n,n),
+        'c': np.random.randn(m), 'd': np.random.randn(m),
+        'e': np.random.randn(n), 'gamma': 0.5}
+    for language in ["python", "operator"]:
+        for k in [1, 2, 3]:
+            yield cached_matches_uncached, "dimensions m n\n" + parameter_expressions[k], \
+                language, params, {'m': m, 'n': n}
+
+def test_frozen_parameters():
+    import numpy as np
+    import scipy.sparse as sp
+    np.random.seed(0)
+    m, n = 5, 3
+    params = {'A': np.random.randn(m, n), 'D': np.random.rand(n) + 0.1,
+        'B': sp.rand(m, n, 0.5), 'c': np.random.randn(n), 'gamma': 2.0}
+    dims = {'m': m, 'n': n}
+    # each library needs its own name, since it stays loaded
+    for k, frozen in enumerate([['A'], ['D', 'gamma'], ['B', 'c'], sorted(params)]):
+        for language, name in [("python", ""), ("operator", ""),
+                ("ctypes", "test_frozen%d" % k), ("ctypes_operator", "test_frozen_operator%d" % k)]:
+            yield structured_matches_unstructured, language, name, params, dims, ("", "diagonal"), frozen
+
+def test_bad_frozen_parameters():
+    import numpy as np
+    from .. qc_lang import QCML
+    from .. exceptions import QCMLException
+    from nose.tools import assert_raises
+
+    p = QCML()
+    p.parse(lasso)
+    p.canonicalize()
+    # the dims must be set
+    assert_raises(QCMLException, p.codegen, "python", frozen_params={'b': np.ones(2)})
+    p.dims = {'m': 2, 'n': 3}
+    assert_raises(QCMLException, p.codegen, "python", frozen_params={'x': 1.0})
+    assert_raises(QCMLException, p.codegen, "python", frozen_params={'b': np.ones(3)})
+    assert_raises(QCMLException, p.codegen, "python", frozen_params={'gamma': -1.0})
+    assert_raises(QCMLException, p.codegen, "python", frozen_params={'b': [1.0, np.nan]})
+    p.codegen("python", frozen_params={'b': np.ones(2), 'gamma': 1.0})
+
+layout = """
+dimensions m n k
+variables x(n) y(k) w
+dual variables u v l
+parameters A(m,n) b(m) c(n) F(k,n) g(k)
+parameter gamma positive
+minimize square(norm(A*x - b)) + gamma*norm1(x) + c'*x + norm_inf(F*x - y) + abs(w) + max(y)
+u : sum(x) == 1
+v : F*x + y <= g
+l : x >= -1
+norm(y) <= w
+geo_mean(w, sqrt(x)) >= 0.1
+"""
+
+def generated_source(language, seed):
+    # generate the code in a fresh interpreter with the given hash seed
+    package = __name__.split('.')[0]
+    path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    script = "from %s import QCML; p = QCML(); p.parse(%r); p.canonicalize(); " \
+        "p.codegen(%r); p.printsource()" % (package, layout, language)
+    env = dict(os.environ, PYTHONHASHSEED=str(seed), PYTHONPATH=path)
+    with open(os.devnull, "w") as fnull:
+        output = subprocess.check_output([sys.executable, "-c", script], env=env, stderr=fnull)
+    # drop the timing comments
+    return [line for line in output.splitlines() if " took " not in line]
+
+def deterministic_source(language):
+    expected = generated_source(language, 0)
+    for seed in [1, 2, 3]:
+        assert generated_source(language, seed) == expected
+
+def test_deterministic_source():
+    for language in ["python", "operator", "matlab", "C", "C_operator"]:
+        yield deterministic_source, language
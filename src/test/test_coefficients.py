@@ -0,0 +1,67 @@
+from .. import codes
+from .. codes.coefficients.coefficient import DENSE, DIAGONAL, SPARSE
+
+A = codes.ParameterCoeff('A', ('m', 'n'))
+B = codes.ParameterCoeff('B', ('m', 'n'))
+D = codes.ParameterCoeff('D', ('n', 'n'), DIAGONAL)
+F = codes.ParameterCoeff('F', ('m', 'n'), DENSE)
+b = codes.ParameterCoeff('b', ('m', 1))
+c = codes.ScalarParameterCoeff('c')
+I = codes.EyeCoeff('n', codes.ConstantCoeff(1))
+
+# (coefficient, shape, structure, nnz bound)
+sparsity = [
+    (codes.ConstantCoeff(2), (1, 1), DENSE, "1"),
+    (c, (1, 1), DENSE, "1"),
+    (A, ('m', 'n'), SPARSE, "nnz(A)"),
+    (b, ('m', 1), DENSE, "m"),
+    (D, ('n', 'n'), DIAGONAL, "n"),
+    (I, ('n', 'n'), DIAGONAL, "n"),
+    (codes.OnesCoeff('n', c), ('n', 1), DENSE, "n"),
+    (codes.OnesCoeff('n', c, True), (1, 'n'), DENSE, "n"),
+    (codes.NegateCoeff(A), ('m', 'n'), SPARSE, "nnz(A)"),
+    (codes.TransposeCoeff(A), ('n', 'm'), SPARSE, "nnz(A)"),
+    (codes.AddCoeff(A, B), ('m', 'n'), SPARSE, "(nnz(A) + nnz(B))"),
+    (codes.AddCoeff(A, F), ('m', 'n'), DENSE, "m * n"),
+    (codes.AddCoeff(D, I), ('n', 'n'), DIAGONAL, "n"),
+    (codes.MulCoeff(c, A), ('m', 'n'), SPARSE, "nnz(A)"),
+    (codes.MulCoeff(A, D), ('m', 'n'), SPARSE, "nnz(A)"),
+    (codes.MulCoeff(F, D), ('m', 'n'), DENSE, "m * n"),
+    (codes.MulCoeff(codes.TransposeCoeff(A), B), ('n', 'n'), SPARSE, "n * n"),
+    (codes.SliceCoeff(codes.ParameterCoeff('A', (5, 7)), 0, 3), (3, 7), SPARSE, "nnz(A)"),
+    (codes.SliceCoeff(codes.ParameterCoeff('F', (5, 7), DENSE), 1, 3), (2, 7), DENSE, "14"),
+    (codes.SliceCoeff(codes.ParameterCoeff('D', (5, 5), DIAGONAL), 0, 3), (3, 5), SPARSE, "3"),
+    (codes.SliceCoeff(codes.ParameterCoeff('b', (5, 1)), 2, 5), (3, 1), DENSE, "3"),
+]
+
+def check_sparsity(coeff, shape, structure, nnz):
+    assert coeff.shape() == shape
+    assert coeff.structure() == structure
+    assert str(coeff.nnz_bound()) == nnz
+
+def test_sparsity():
+    for coeff, shape, structure, nnz in sparsity:
+        yield check_sparsity, coeff, shape, structure, nnz
+
+def check_folded(coeff, expected):
+    import numpy as np
+    assert isinstance(coeff, codes.FrozenCoeff)
+    assert np.allclose(coeff.matrix.toarray(), expected)
+
+def test_frozen_folding():
+    import numpy as np
+    from .. codes.coefficients.coefficient import frozen
+    F = np.array([[1., 0., 2.], [0., 3., 0.]])
+    G = np.array([[1., 2.], [0., 1.], [4., 0.]])
+    yield check_folded, frozen(F) * frozen(G), F.dot(G)
+    yield check_folded, frozen(F) + frozen(2*F), 3*F
+    yield check_folded, -frozen(F), -F
+    yield check_folded, frozen(F).trans(), F.T
+    yield check_folded, codes.ConstantCoeff(2) * frozen(F), 2*F
+    yield check_folded, codes.EyeCoeff(2, codes.ConstantCoeff(1)) * frozen(F), F
+    yield check_folded, frozen(F.dot(G)) + codes.EyeCoeff(2, codes.ConstantCoeff(3)), F.dot(G) + 3*np.eye(2)
+    yield check_folded, codes.OnesCoeff(2, codes.ConstantCoeff(1), True) * frozen(F), F.sum(axis=0)
+    # the scalar parameter is left to multiply the folded product
+    product = (c * frozen(F)) * frozen(G)
+    assert isinstance(product, codes.MulCoeff) and product.left is c
+    yield check_folded, product.right, F.dot(G)
@@ -78,6 +78,13 @@ problem_list = [
     subject to
         y : x <= 4
 """,
+""" dimensions m n
+    variable x(n)
+    parameter A(m,n) dense
+    parameter D(n,n) diagonal positive
+    parameter S(m,n) nonnegative sparse
+    minimize norm(A*x) + sum(D*x) + sum(S*x)
+""",
 ]
 
 bad_problem_list = [
@@ -105,7 +112,13 @@ bad_problem_list = [
     parameter c(n)
     minimize c'*x
         y : c <= x <= 5
-"""
+""",
+""" dimensions m n
+    parameter D(m,n) diagonal""",
+""" dimension n
+    parameter d(n) dense""",
+"parameter gamma diagonal",
+"variable x diagonal"
 ]
 
 # check keywords: variable, parameters, and dimensions
@@ -0,0 +1,92 @@
+""" Tests for the planner, which picks the rewriting strategy by the
+    predicted size of the SOCP.
+
+    The predicted sizes should be those of the generated data.
+"""
+import numpy as np
+import scipy.sparse as sp
+from nose.tools import assert_raises
+
+from .. qc_lang import QCML
+from .. exceptions import QCMLException
+from .. import planner
+
+prob = """
+dimensions m n
+variable x(n)
+parameters A(m,n) b(m) c(n)
+minimize norm(A*x - b) + c'*x + norm1(x)
+x >= 0
+"""
+
+dims = {'m': 6, 'n': 4}
+params = {'A': sp.rand(6, 4, 0.5, random_state=0), 'b': np.arange(6.0), 'c': np.ones(4)}
+
+def planned(**kwargs):
+    p = QCML()
+    p.parse(prob)
+    return p, p.plan(dims, {'A': params['A'].nnz}, **kwargs)
+
+def matches_prediction(strategy):
+    p, plan = planned()
+    size = plan.sizes[strategy]
+    p.codegen("python", strategy=strategy)
+    data = p.prob2socp(params, dims)
+    assert data['c'].shape == (size['n'],)
+    assert data['G'].shape == (size['m'], size['n'])
+    assert data['G'].nnz <= size['nnz(G)']
+    if data['A'] is None:
+        assert size['p'] == 0
+    else:
+        assert data['A'].shape == (size['p'], size['n'])
+        assert data['A'].nnz <= size['nnz(A)']
+    assert data['dims']['l'] == size['l']
+    assert len(data['dims']['q']) == size['cones']
+
+def test_predictions():
+    p, plan = planned()
+    for strategy in plan.sizes:
+        yield matches_prediction, strategy
+
+def test_picks_cheapest():
+    p, plan = planned()
+    assert plan.best in plan.sizes
+    assert all(plan.costs[plan.best] <= c for c in plan.costs.values())
+    assert plan.best in str(plan)
+
+def test_custom_cost():
+    # prefer the most variables
+    p, plan = planned(cost=lambda size: -size['n'])
+    n = max(size['n'] for size in plan.sizes.values())
+    assert plan.sizes[plan.best]['n'] == n
+
+def test_evaluate():
+    dim = planner.AbstractDim(['nnz(A)', 'nnz(A)']) + 3
+    assert planner.evaluate(dim, {'A': 5}) == 13
+    assert planner.evaluate(dim * (planner.AbstractDim('nnz(B)') + 1), {'A': 5, 'B': 2}) == 39
+    assert_raises(QCMLException, planner.evaluate, planner.AbstractDim('n'), {})
+    dim = planner.AbstractDim({'nnz(A)': 2, 1: -3}) * planner.AbstractDim('nnz(B)')
+    assert planner.evaluate(dim, {'A': 5, 'B': 2}) == 14
+    # the keys are never evaluated as Python
+    assert_raises(QCMLException, planner.evaluate, planner.AbstractDim("__import__('os')"), {})
+
+def test_not_applicable():
+    p, plan = planned()
+    # the cone of norm(A*x - b) would have to be split
+    assert 'fixed_cone' in plan.failures
+    assert 'fixed_cone' not in plan.sizes
+    # the columns line up, with the best strategy marked
+    lines = str(plan).splitlines()
+    assert len(set(len(line) for line in lines[:len(plan.sizes) + 1])) == 1
+    assert [line[0] for line in lines[1:len(plan.sizes) + 1]].count('*') == 1
+
+def test_plan_requires_dims():
+    p = QCML()
+    p.parse(prob)
+    assert_raises(QCMLException, p.plan)
+
+def test_invalid_strategy():
+    p = QCML()
+    p.parse(prob)
+    p.canonicalize()
+    assert_raises(QCMLException, p.codegen, "python", strategy="fastest")
@@ -0,0 +1,145 @@
+""" Tests for the presolve of the canonicalized problem.
+
+    A presolved problem should give the same SOCP data as the problem written
+    without the redundant variables and constraints.
+"""
+import numpy as np
+import scipy.sparse as sp
+from nose.tools import assert_raises
+
+from .. qc_lang import QCML
+from .. exceptions import QCMLException
+from .. import ast
+from .. ast.expressions import expression as e
+from .. properties import shape
+
+header = """
+dimensions m n
+variable x(n)
+parameters A(m,n) b(m)
+"""
+
+pairs = [
+    # an alias of a user variable
+    ("""
+    variable z(n)
+    minimize norm(A*z - b) + sum(x)
+    z == x
+    x >= 0
+    """, """
+    minimize norm(A*x - b) + sum(x)
+    x >= 0
+    """),
+    # a chain of aliases
+    ("""
+    variables y(n) z(n)
+    minimize norm(A*z - b)
+    z == y
+    y == x
+    """, """
+    minimize norm(A*x - b)
+    """),
+    # an equality on a variable eliminated after it
+    ("""
+    variable z(n)
+    minimize norm(A*x - b)
+    A*z == b
+    z == x
+    """, """
+    minimize norm(A*x - b)
+    A*x == b
+    """),
+    # bounds on the same expression
+    ("""
+    minimize norm(A*x - b)
+    x >= -1
+    x >= 0
+    -2 <= x
+    x <= 3
+    """, """
+    minimize norm(A*x - b)
+    x >= 0
+    x <= 3
+    """),
+]
+
+params = {'A': sp.rand(3, 4, 0.5, random_state=0), 'b': np.arange(3.0)}
+dims = {'m': 3, 'n': 4}
+
+def data(prob, presolve):
+    p = QCML()
+    p.parse(header + prob)
+    p.canonicalize()
+    if presolve: p.presolve()
+    p.codegen("python")
+    return p.prob2socp(params, dims)
+
+def presolved_matches(prob, expected_prob):
+    result, expected = data(prob, True), data(expected_prob, False)
+    for k in ['c', 'G', 'h', 'A', 'b']:
+        # A and b are None without equality constraints
+        if expected[k] is None:
+            assert result[k] is None
+        elif sp.issparse(expected[k]):
+            assert result[k].shape == expected[k].shape
+            assert np.allclose(result[k].toarray(), expected[k].toarray())
+        else:
+            assert np.allclose(result[k], expected[k])
+    assert result['dims'] == expected['dims']
+
+def test_presolve():
+    for prob, expected_prob in pairs:
+        yield presolved_matches, prob, expected_prob
+
+def test_recovers_aliases():
+    p = QCML()
+    p.parse(header + pairs[1][0])
+    p.presolve()
+    p.codegen("python")
+    d = p.prob2socp(params, dims)
+    n = d['c'].shape[0]
+    sol = p.socp2prob(np.arange(n), np.zeros(0), np.zeros(d['G'].shape[0]), dims)
+    assert set(sol) == set(['x', 'y', 'z'])
+    assert np.all(sol['y'] == sol['x']) and np.all(sol['z'] == sol['x'])
+
+def test_keeps_dual_rows():
+    p = QCML()
+    p.parse(header + """
+    variable z(n)
+    dual variables u v
+    minimize norm(A*z - b)
+    u : z == x
+    v : x >= -1
+    x >= 0
+    """)
+    p.presolve()
+    assert not p.program.eliminated
+    assert len(list(p.program.constraints.children())) == 4
+
+def test_eliminates_new_variables():
+    ast.SOCP.reset()
+    x = e.Variable('x', shape.Vector(2))
+    t = e.Variable('', shape.Vector(2))
+    prob = ast.SOCP(
+        ast.ProgramObjective("minimize", e.Sum(t)),
+        ast.ProgramConstraints([t == x + e.Number(1), x >= e.Number(0)]),
+        ast.ProgramData(variables={'x': x})
+    )
+    prob.presolve()
+    assert t.value in prob.eliminated
+    assert t.value not in prob.new_variables
+    assert t.value not in str(prob.objective)
+    assert len(list(prob.constraints.children())) == 1
+
+def test_trivially_infeasible():
+    p = QCML()
+    p.parse(header + """
+    variable z(n)
+    minimize norm(A*x - b)
+    z == x
+    z - x >= 1
+    """)
+    assert_raises(QCMLException, p.presolve)
+
+def test_presolve_requires_parse():
+    assert_raises(QCMLException, QCML().presolve)
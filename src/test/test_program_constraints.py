@@ -1,2 +1,63 @@
 # check that adding the same constraint does nothing
 # test iter, str, add, clear
+from .. ast import ProgramConstraints
+from .. ast.constraints import SOC, SOCProd
+from .. ast.expressions import Variable, Number
+from .. properties import shape
+from .. qc_lang import QCML
+
+x = Variable('x', shape.Vector(3))
+y = Variable('y', shape.Vector(3))
+t = Variable('t', shape.Scalar())
+
+# pairs of constraints that are the same up to the order of the terms, the
+# way the numbers are written, or the order and sign of the norm arguments
+duplicates = [
+    (x + y <= Number(1), y + x <= Number(1)),
+    (Number(2) * x == y, Number(2.0) * x + Number(0) == y),
+    (Number(-1) * (x + y) <= t, Number(-1) * x - y <= t),
+    (SOC(t, [x, y]), SOC(t, [y, x])),
+    (SOC(t, [x - y]), SOC(t, [y - x])),
+    (SOCProd(x, [y, t]), SOCProd(x, [t, y])),
+]
+
+distinct = [
+    (x + y <= Number(1), x + y <= Number(2)),
+    (x <= y, x == y),
+    (Number(2) * x <= y, x <= y),
+    (SOC(t, [x, y]), SOC(t, [x, Number(2) * y])),
+    (SOC(t, [x]), SOCProd(t, [x])),
+]
+
+def check_collapse(c1, c2, count):
+    constraints = ProgramConstraints([c1])
+    constraints.add(c2)
+    assert len(list(constraints.children())) == count
+
+def test_duplicates():
+    for c1, c2 in duplicates:
+        yield check_collapse, c1, c2, 1
+
+def test_distinct():
+    for c1, c2 in distinct:
+        yield check_collapse, c1, c2, 2
+
+def test_dual_variables_kept():
+    c1, c2 = x <= y, x <= y
+    c2.dual_var = 'u'
+    check_collapse(c1, c2, 2)
+
+def test_duplicate_rows_after_canonicalization():
+    # the rows only differ in the order of their terms, or in how their
+    # coefficients are written, once simplified
+    p = QCML()
+    p.parse("""
+    variables x y
+    minimize x + y
+    x + y <= 1
+    y + x <= 1
+    x + y + x <= 2
+    2*x + y <= 2
+    """)
+    p.canonicalize()
+    assert len(p.program.constraints.ineq_constr) == 2
@@ -0,0 +1,114 @@
+""" Tests for the QP code generator, which keeps the quadratic terms of the
+    objective instead of rewriting them into second-order cones.
+
+    The QP should have the solution of the SOCP.
+"""
+import numpy as np
+import scipy.sparse as sp
+from nose.tools import assert_raises
+
+from .. qc_lang import QCML
+from .. exceptions import QCMLException
+
+header = """
+dimensions m n
+variable x(n)
+parameters A(m,n) b(m) c(n)
+parameter gamma positive
+"""
+
+problems = [
+    "minimize square(norm(A*x - b)) + gamma*norm1(x)",
+    "minimize sum(huber(A*x - b)) + 0.5*sum(square(x))",
+    """maximize c'*x - gamma*square(norm(x)) - quad_over_lin(A*x, 2)
+    sum(x) == 1
+    x >= 0""",
+    """minimize sum(square_over_lin(x - c, 4)) + sum(square(norm(A*x - b, 2*(A*x))))
+    abs(x) <= 1""",
+]
+
+dims = {'m': 5, 'n': 3}
+params = {
+    'A': sp.rand(5, 3, 0.6, random_state=0),
+    'b': np.arange(5.0) - 2,
+    'c': np.array([1.0, -2.0, 0.5]),
+    'gamma': 0.3
+}
+
+def solve_qp(data):
+    """ Solves the QP (with a diagonal P) with ecos, as the SOCP
+
+            minimize q'*x + t
+            subject to (1/2) x'*P*x <= t, l <= A*x <= u
+    """
+    import ecos
+    P, q, A, l, u = [data[k] for k in ('P', 'q', 'A', 'l', 'u')]
+    n = q.shape[0]
+    A = sp.hstack([A, sp.csc_matrix((A.shape[0], 1))]).tocsr()
+    eq = (l == u)
+    upper = ~eq & np.isfinite(u)
+    lower = ~eq & np.isfinite(l)
+    cone = sp.vstack([
+        sp.coo_matrix(([-0.5, 0.5], ([0, 1], [n, n])), (2, n + 1)),
+        sp.hstack([-sp.diags(np.sqrt(P.diagonal() / 2)), sp.csc_matrix((n, 1))])
+    ])
+    G = sp.vstack([A[upper], -A[lower], cone]).tocsc()
+    h = np.hstack([u[upper], -l[lower], [0.5, 0.5], np.zeros(n)])
+    cones = {'l': int(upper.sum() + lower.sum()), 'q': [n + 2]}
+    kwargs = {}
+    if eq.any():
+        kwargs = {'A': A[eq].tocsc(), 'b': l[eq]}
+    sol = ecos.solve(np.hstack([q, 1.0]), G, h, cones, verbose=False, **kwargs)
+    return sol['x'][:n]
+
+def qp_matches_socp(prob):
+    socp = QCML()
+    socp.parse(header + prob)
+    socp.canonicalize()
+    socp.codegen("python")
+    expected = socp.solver(params, dims)['x']
+
+    qp = QCML()
+    qp.parse(header + prob)
+    qp.canonicalize(quadratic=True)
+    assert qp.program.quadratic
+    qp.codegen("qp")
+    data = qp.prob2socp(params, dims)
+    # the quadratic terms are all in P, which is diagonal
+    assert data['P'].nnz == np.count_nonzero(data['P'].diagonal())
+    result = qp.socp2prob(solve_qp(data), dims=dims)['x']
+    # (up to the accuracy of the solver)
+    assert np.allclose(result, expected, atol=1e-3)
+
+def test_qp():
+    for prob in problems:
+        yield qp_matches_socp, prob
+
+def test_presolve_keeps_quadratic():
+    p = QCML()
+    p.parse(header + """
+    variable y(m)
+    minimize square(norm(y)) + gamma*norm1(x)
+    y == A*x - b
+    """)
+    p.canonicalize(quadratic=True)
+    p.presolve()
+    assert 'y' in p.program.quadratic
+    p.codegen("qp")
+    data = p.prob2socp(params, dims)
+    assert data['P'].nnz == dims['m']
+
+def test_not_qp():
+    p = QCML()
+    p.parse(header + """
+    minimize square(norm(A*x - b))
+    norm(x) <= 1
+    """)
+    p.canonicalize(quadratic=True)
+    assert_raises(QCMLException, p.codegen, "qp")
+
+def test_socp_codegen_rejects_quadratic():
+    p = QCML()
+    p.parse(header + "minimize square(norm(A*x - b))")
+    p.canonicalize(quadratic=True)
+    assert_raises(QCMLException, p.codegen, "python")
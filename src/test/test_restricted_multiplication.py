@@ -101,3 +101,38 @@ int main(int argc, char **argv) {
 def test_parse_and_compiles():
     yield properly_solves, "python"
     yield properly_solves, "C"
+
+repeated = """
+variable x(2)
+parameters A(3,2) B(3,2)
+parameters c(3) d(3)
+minimize 2*c'*A*x
+x == B'*d
+A'*B*x <= 1
+norm(A'*B*x) <= 2
+x + c'*A*x >= 0
+x >= -1
+"""
+
+def auxiliary_data(mixin, **kwargs):
+    from .. qc_lang import QCML
+    from .. codegens import PythonCodegen
+    p = QCML()
+    p.parse(repeated)
+    p.canonicalize()
+    if mixin:
+        codegen = type("Codegen", (mixin, PythonCodegen), {})(**kwargs)
+    else:
+        codegen = PythonCodegen()
+    codegen.visit(p.program)
+    codegen.codegen()
+    params = {'A': np.array(A), 'B': np.array(B), 'c': np.array(c), 'd': np.array(d)}
+    return codegen, codegen.prob2socp(params)
+
+def test_reuses_auxiliary():
+    from .. mixins import RestrictedMultiplyMixin
+    codegen, result = auxiliary_data(RestrictedMultiplyMixin)
+    # B*x and A*x each appear twice, but get a single variable
+    assert codegen.auxiliary_saved == {'rows': 6, 'cols': 6}
+    rows = sum(v.shape.size() for v in codegen.auxiliary.values())
+    assert result['A'].shape == (2 + rows, 3 + rows)
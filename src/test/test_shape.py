@@ -105,3 +105,37 @@ def test_with_abstract_dim():
 
     assert(map(str, s.dimensions) == ['n'])
 
+
+def test_abstract_dim_interned():
+    n, m = AbstractDim('n'), AbstractDim('m')
+    assert AbstractDim('n') is n
+    assert (n + m) is (m + n) and str(n + m) == "(m + n)"
+    assert (2*n + 3) is AbstractDim({'n': 2, 1: 3})
+    assert hash(AbstractDim(4)) == hash(4) and AbstractDim(4) == 4
+    assert len(set([n*m, m*n, n + m - m])) == 2
+    # concrete dims give plain ints in arithmetic with ints
+    assert AbstractDim(3) * 2 == 6 and type(AbstractDim(3) * 2) is int
+    assert (n - n).concrete and n - n == 0
+
+def test_size_memo():
+    rewriter = lambda x: "dims['%s']" % x
+    s = Matrix('m', 'n')
+    assert str(s.size()) == "m * n"
+    assert str(s.size(rewriter)) == "dims['m'] * dims['n']"
+    assert s.size(rewriter) is s.size(rewriter)
+    s.eval({'m': 3, 'n': 4})
+    assert s.size() == 12 and s.size(rewriter) == 12
+
+def test_abstract_dim_caches_bounded():
+    import gc
+    from .. properties import abstract_dim
+    # ADs no longer in use are not kept alive by the interning
+    n = AbstractDim('unused_dim_n')
+    del n
+    gc.collect()
+    assert 'unused_dim_n' not in AbstractDim._simple
+    # the remembered results are bounded
+    m = AbstractDim('m')
+    for k in xrange(abstract_dim.RESULTS_LIMIT + 10):
+        m + AbstractDim('k%d' % k)
+    assert len(AbstractDim._results) <= abstract_dim.RESULTS_LIMIT